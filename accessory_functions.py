@@ -1,13 +1,12 @@
 import numpy as np
-from global_constants import GRAVITATIONAL_CONSTANT
-np.warnings.filterwarnings('ignore', category=np.VisibleDeprecationWarning)
+from global_constants import GRAVITATIONAL_CONSTANT, NUMBER_OF_RINGS, RING_SPACING, MINIMUM_RADIUS, NUMBER_OF_MASSES_PER_UNIT_RADIUS
 """
 Self-contained small numeric functions, and functions used in testing the stability of the program.
 
 
 Methods:
 
-    circular_oribit_velocity(float, float) --> float (No Side-effects)
+    circular_oribit_velocity(float, float, float) --> float (No Side-effects)
 
     position_polar_to_cartesian(float[]) --> float[] (No Side-effects)
 
@@ -15,25 +14,28 @@ Methods:
 
     distance(float[], float[]) --> float[] (No Side-effects)
 
-    energy_of_massive_objects(Mass[]) --> float (No Side-effects)
+    generate_disc(float, int, float, float, float, float, float, float) --> (float[][], float[][]) (No Side-effects)
 
-    energy_of_test_masses(Mass[]) --> float (No Side-effects)
+    energy_of_massive_objects(Mass[], float) --> float (No Side-effects)
+
+    energy_of_test_masses(Mass[], float) --> float (No Side-effects)
     
 """
 
-def circular_orbit_velocity(radius, mass):
+def circular_orbit_velocity(radius, mass, gravitational_constant = GRAVITATIONAL_CONSTANT):
     """
     Finds the velocity at which test masses need to orbit to stay in a circular orbit around their massive object.
 
     Keyword arguments:
     radius -- float, distance at which test mass is orbiting from massive object
     mass --  float, mass of the massive object
+    gravitational_constant -- float (default GRAVITATIONAL_CONSTANT)
 
     Return value:
     -- float, the speed (magnitude, not a vector) for cicular orbit
     """
 
-    return np.sqrt(GRAVITATIONAL_CONSTANT*mass/radius)
+    return np.sqrt(gravitational_constant*mass/radius)
 
 def position_polar_to_cartesian(position):
     """
@@ -81,30 +83,77 @@ def distance(vector_1, vector_2):
     vector_2 = np.array(vector_2)
     return vector_2 - vector_1
 
-def energy_of_massive_objects(massive_objects):
+def generate_disc(mass, number_of_rings = NUMBER_OF_RINGS, ring_spacing = RING_SPACING, minimum_radius = MINIMUM_RADIUS,
+                  number_of_masses_per_unit_radius = NUMBER_OF_MASSES_PER_UNIT_RADIUS, inclination = 0, node_angle = 0,
+                  gravitational_constant = GRAVITATIONAL_CONSTANT):
+    """
+    Finds the positions and velocities of rings of test masses in circular orbits around a massive object at the origin.
+    All rings are generated at once with array operations.
+
+    Ring i has radius i*ring_spacing + minimum_radius and int(radius*number_of_masses_per_unit_radius) test masses
+    spaced equally around it. The disc lies in the x-y plane before it is tilted by inclination about the x axis,
+    and then rotated by node_angle about the z axis.
+
+    Keyword arguments:
+    mass -- float, mass of the massive object at the centre of the disc
+    number_of_rings -- int (default NUMBER_OF_RINGS)
+    ring_spacing -- float, distance between neighbouring rings (default RING_SPACING)
+    minimum_radius -- float, radius of the innermost ring (default MINIMUM_RADIUS)
+    number_of_masses_per_unit_radius -- float (default NUMBER_OF_MASSES_PER_UNIT_RADIUS)
+    inclination -- float, angle in radians between the disc and the x-y plane (default 0)
+    node_angle -- float, angle in radians from the x axis to the line about which the disc is tilted (default 0)
+    gravitational_constant -- float (default GRAVITATIONAL_CONSTANT)
+
+    Return values:
+    positions -- 2D array of floats, [ x y z, ...] relative to the massive object
+    velocities -- 2D array of floats, [ vx vy vz, ...] relative to the massive object
+    """
+
+    ring_radii = np.arange(number_of_rings)*ring_spacing + minimum_radius
+    #rounds down to nearest integer
+    masses_on_rings = (ring_radii*number_of_masses_per_unit_radius).astype(int)
+
+    #one entry per test mass, j counts the test masses around each ring
+    radii = np.repeat(ring_radii, masses_on_rings)
+    masses_on_ring = np.repeat(masses_on_rings, masses_on_rings)
+    first_on_ring = np.repeat(np.cumsum(masses_on_rings) - masses_on_rings, masses_on_rings)
+    j = np.arange(len(radii)) - first_on_ring
+
+    #spaces test masses equally around ring, moving at the circular orbit velocity
+    angles = j*2*np.pi/masses_on_ring
+    orbital_velocities = circular_orbit_velocity(radii, mass, gravitational_constant)
+    cosines = np.cos(angles)
+    sines = np.sin(angles)
+    zeros = np.zeros(len(radii))
+    positions = np.column_stack((radii*cosines, radii*sines, zeros))
+    velocities = np.column_stack((-orbital_velocities*sines, orbital_velocities*cosines, zeros))
+
+    if inclination != 0 or node_angle != 0:
+        tilt = np.array([[1, 0, 0], [0, np.cos(inclination), -np.sin(inclination)], [0, np.sin(inclination), np.cos(inclination)]])
+        turn = np.array([[np.cos(node_angle), -np.sin(node_angle), 0], [np.sin(node_angle), np.cos(node_angle), 0], [0, 0, 1]])
+        rotation = np.dot(turn, tilt)
+        positions = np.dot(positions, rotation.T)
+        velocities = np.dot(velocities, rotation.T)
+
+    return (positions, velocities)
+
+def energy_of_massive_objects(massive_objects, gravitational_constant = GRAVITATIONAL_CONSTANT):
     """Returns a float of the total energy of the massive objects in the system, excludes test masses"""
-    energy = [] 
-    for i in range(len(massive_objects)):
-        velocity = np.linalg.norm(massive_objects[i].velocity)
-        kinetic_energy = 0.5*massive_objects[i].mass*(velocity**2) 
-        gpe = 0
-        for j in range(len(massive_objects)): #loop over all massive objects to find potential energy
-            if i == j: #to avoid self gravitation
-                pass
-            else:
-                r_vector = distance(massive_objects[i].position, massive_objects[j].position)
-                gpe += (-1)*(massive_objects[j].mass)*(massive_objects[i].mass)/abs((np.linalg.norm(r_vector)))   #calculation of GPE
-        energy.append(gpe+kinetic_energy)
-    return np.sum(energy)
-
-def energy_of_test_masses(massive_objects):
-    """Returns a float of the total energy of the test masses orbiting the massive objects in the system"""
-    energy = []
-    for j in range(len(massive_objects)):
-        for i in range(len(massive_objects[j].test_masses)): #loop over all massive objects to find potential energy
-            velocity = np.linalg.norm(massive_objects[j].test_masses[i].velocity)
-            kinetic_energy = 0.5*velocity**2
-            r_vector = distance(massive_objects[j].position, massive_objects[0].test_masses[i].position)
-            gpe = -massive_objects[j].mass/(np.linalg.norm(r_vector))
-            energy.append(kinetic_energy+gpe)
-    return np.sum(energy)
+    positions = np.array([massive_object.position for massive_object in massive_objects], dtype = float)
+    velocities = np.array([massive_object.velocity for massive_object in massive_objects], dtype = float)
+    masses = np.array([massive_object.mass for massive_object in massive_objects], dtype = float)
+
+    kinetic_energy = 0.5*np.sum(masses*np.sum(velocities**2, axis = 1))
+    (first, second) = np.triu_indices(len(masses), 1) #each pair once
+    gpe = -gravitational_constant*np.sum(masses[first]*masses[second]/np.linalg.norm(positions[first] - positions[second], axis = 1))
+    return kinetic_energy + gpe
+
+def energy_of_test_masses(massive_objects, gravitational_constant = GRAVITATIONAL_CONSTANT):
+    """Returns a float of the total energy of the test masses orbiting the massive objects in the system, each only in the field of its own massive object"""
+    energy = 0
+    for massive_object in massive_objects:
+        test_masses = massive_object.test_masses
+        kinetic_energy = 0.5*np.sum(test_masses.velocities**2)
+        gpe = -gravitational_constant*massive_object.mass*np.sum(1/np.linalg.norm(test_masses.positions - massive_object.position, axis = 1))
+        energy += kinetic_energy + gpe
+    return energy
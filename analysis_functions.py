@@ -0,0 +1,170 @@
+import numpy as np
+from core_classes import SimulationConfig
+"""
+Classification of the test masses after an encounter between a host galaxy and a perturbing galaxy, and summary
+statistics of each snapshot, found with array operations on chunks of test masses so the cost stays small next to
+the integration even for millions of test masses.
+
+Each test mass is put into one of four classes:
+    HOST -- bound to the host (negative orbital energy relative to it, and more tightly bound to it than to the
+            perturber) and within config.tail_distance of it
+    CAPTURED -- bound to the perturber in the same way, and within config.tail_distance of it
+    BRIDGE -- neither, and between the two galaxies: its projection onto the line from the host to the perturber
+              lies between them
+    TAIL -- any other test mass
+
+The summary also keeps the distance-only measures that run_main.py has always reported: the mean distance from the
+host of the test masses more than config.tail_distance from both galaxies, and the number within
+config.tail_distance of the perturber.
+
+Methods:
+
+    classify_test_masses(float[][], float[][], float[], SimulationConfig, int, int, int) --> int[] (No side-effects)
+
+    analyse_snapshot(float[], StackLayout, float[], SimulationConfig, int, int, int) --> (int[], dict) (No side-effects)
+
+"""
+
+#classes of test masses, the values in the array returned by classify_test_masses()
+HOST = 0
+CAPTURED = 1
+TAIL = 2
+BRIDGE = 3
+CLASS_NAMES = ["host", "captured", "tail", "bridge"]
+
+#number of test masses whose temporary arrays are held at once
+CHUNK_SIZE = 65536
+
+
+
+
+
+def _analyse_chunk(test_mass_state, host_state, perturber_state, host_mass, perturber_mass, config):
+    """
+    Classifies a chunk of test masses
+
+    Return values:
+    classes -- array of ints, the class of each test mass
+    tail_distance_sum -- float, sum of the distances from the host of the test masses beyond tail_distance of both galaxies
+    number_beyond_both -- int, number of test masses beyond tail_distance of both galaxies
+    number_near_perturber -- int, number of test masses within tail_distance of the perturber
+    """
+    positions = test_mass_state[:, 0:3]
+    velocities = test_mass_state[:, 3:6]
+
+    host_r_vectors = positions - host_state[0:3]
+    host_distances = np.sqrt(np.einsum("ij,ij->i", host_r_vectors, host_r_vectors))
+    host_relative_velocities = velocities - host_state[3:6]
+    host_energies = 0.5*np.einsum("ij,ij->i", host_relative_velocities, host_relative_velocities) - config.gravitational_constant*host_mass/host_distances
+
+    perturber_r_vectors = positions - perturber_state[0:3]
+    perturber_distances = np.sqrt(np.einsum("ij,ij->i", perturber_r_vectors, perturber_r_vectors))
+    perturber_relative_velocities = velocities - perturber_state[3:6]
+    perturber_energies = 0.5*np.einsum("ij,ij->i", perturber_relative_velocities, perturber_relative_velocities) - config.gravitational_constant*perturber_mass/perturber_distances
+
+    #position along the line from the host (0) to the perturber (1)
+    separation_vector = perturber_state[0:3] - host_state[0:3]
+    projections = np.dot(host_r_vectors, separation_vector)/max(np.dot(separation_vector, separation_vector), np.finfo(float).tiny)
+
+    near_host = host_distances <= config.tail_distance
+    near_perturber = perturber_distances < config.tail_distance
+    classes = np.full(len(test_mass_state), TAIL, dtype = np.int8)
+    classes[(projections > 0) & (projections < 1)] = BRIDGE
+    classes[(perturber_energies < 0) & (perturber_energies < host_energies) & near_perturber] = CAPTURED
+    classes[(host_energies < 0) & (host_energies <= perturber_energies) & near_host] = HOST
+
+    #the distance-only measures of run_main.py
+    beyond_both = (host_distances > config.tail_distance) & (perturber_distances > config.tail_distance)
+
+
+    return (classes, float(np.sum(host_distances[beyond_both])), int(np.count_nonzero(beyond_both)), int(np.count_nonzero(near_perturber)))
+
+
+
+
+
+
+def _chunks(test_mass_state, massive_object_state, masses, config, host, perturber):
+    """Yields the slice and results of _analyse_chunk() for each chunk of CHUNK_SIZE test masses"""
+    massive_object_state = np.asarray(massive_object_state, dtype = float)
+    for start in range(0, len(test_mass_state), CHUNK_SIZE):
+        chunk = slice(start, start + CHUNK_SIZE)
+        yield (chunk, _analyse_chunk(np.asarray(test_mass_state[chunk], dtype = float), massive_object_state[host], massive_object_state[perturber],
+                                     masses[host], masses[perturber], config))
+
+
+def classify_test_masses(test_mass_state, massive_object_state, masses, config = None, host = 0, perturber = 1):
+    """
+    Puts each test mass into one of the classes HOST, CAPTURED, TAIL or BRIDGE
+
+    Keyword arguments:
+    test_mass_state -- 2D array of floats, [x y z vx vy vz] of each test mass
+    massive_object_state -- 2D array of floats, [x y z vx vy vz] of each massive object
+    masses -- array of floats, masses of each of the massive_objects
+    config -- SimulationConfig, gives the tail_distance and gravitational_constant (default None, the values in global_constants.py)
+    host -- int, number of the host galaxy in massive_object_state (default 0)
+    perturber -- int, number of the perturbing galaxy in massive_object_state (default 1)
+
+    Return value:
+    classes -- array of ints, the class of each test mass
+    """
+    if config is None:
+        config = SimulationConfig()
+    classes = np.empty(len(test_mass_state), dtype = np.int8)
+    for (chunk, (chunk_classes, _, _, _)) in _chunks(test_mass_state, massive_object_state, masses, config, host, perturber):
+        classes[chunk] = chunk_classes
+
+
+    return classes
+
+
+
+
+
+
+def analyse_snapshot(stack, stack_layout, masses, config = None, host = 0, perturber = 1):
+    """
+    Classifies every test mass in a stack and summarises the snapshot
+
+    Keyword arguments:
+    stack -- array of floats, see core_functions.stacker()
+    stack_layout -- StackLayout, contains information about what the values in stack correspond to
+    masses -- array of floats, masses of each of the massive_objects
+    config -- SimulationConfig, gives the tail_distance and gravitational_constant (default None, the values in global_constants.py)
+    host -- int, number of the host galaxy (default 0)
+    perturber -- int, number of the perturbing galaxy (default 1)
+
+    Return values:
+    classes -- array of ints, the class of each test mass, see classify_test_masses()
+    summary -- dict of:
+        "separation" -- float, distance between the host and the perturber
+        "host", "captured", "tail", "bridge" -- int, number of test masses in each class
+        "host_fraction", "captured_fraction", "tail_fraction", "bridge_fraction" -- float, fraction of test masses in each class
+        "length_of_tidal_tail" -- float, mean distance from the host of the test masses beyond tail_distance of both galaxies, 0 if there are none
+        "within_capture_distance" -- int, number of test masses within tail_distance of the perturber
+    """
+    if config is None:
+        config = SimulationConfig()
+    massive_object_state = stack_layout.massive_object_state(stack)
+    test_mass_state = stack_layout.test_mass_state(stack)
+    number_of_test_masses = len(test_mass_state)
+
+    classes = np.empty(number_of_test_masses, dtype = np.int8)
+    (tail_distance_sum, number_beyond_both, number_near_perturber) = (0.0, 0, 0)
+    for (chunk, (chunk_classes, chunk_distance_sum, chunk_beyond_both, chunk_near_perturber)) in _chunks(test_mass_state, massive_object_state, masses,
+                                                                                                             config, host, perturber):
+        classes[chunk] = chunk_classes
+        tail_distance_sum += chunk_distance_sum
+        number_beyond_both += chunk_beyond_both
+        number_near_perturber += chunk_near_perturber
+
+    summary = {"separation": float(np.linalg.norm(massive_object_state[perturber, 0:3] - massive_object_state[host, 0:3]))}
+    counts = np.bincount(classes, minlength = len(CLASS_NAMES))
+    for (class_number, name) in enumerate(CLASS_NAMES):
+        summary[name] = int(counts[class_number])
+        summary[name + "_fraction"] = float(counts[class_number]/number_of_test_masses) if number_of_test_masses > 0 else 0.0
+    summary["length_of_tidal_tail"] = tail_distance_sum/number_beyond_both if number_beyond_both > 0 else 0
+    summary["within_capture_distance"] = number_near_perturber
+
+
+    return (classes, summary)
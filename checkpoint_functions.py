@@ -0,0 +1,103 @@
+import os
+import json
+import numpy as np
+import core_functions as cf
+from core_classes import Mass, ParticleStore, StackLayout
+"""
+Saving and restoring the full state of a run, so a long run can be continued after it stops.
+
+A checkpoint is a single .npz file holding the stack, the masses, the StackLayout, the time, the number of
+snapshots completed, the settings of the run, the state of the integrator and any diagnostics collected so far. It is written to
+a temporary file which then replaces the previous checkpoint, so a checkpoint on disk is always complete.
+All floats are stored at full precision, so continuing from a checkpoint gives exactly the same results.
+
+Methods:
+
+    save_checkpoint(string, Mass[], float, int, dict, dict, dict) --> None (Side-effects: writes the checkpoint file)
+
+    load_checkpoint(string) --> (Mass[], float, int, dict, dict, dict) (No side-effects)
+
+"""
+
+
+
+
+
+def save_checkpoint(file_name, massive_objects, time, snapshot_number, settings, diagnostics, integrator_state = None):
+    """
+    Atomically writes a checkpoint of a run
+
+    Keyword arguments:
+    file_name -- string, path of the checkpoint, should end in .npz
+    massive_objects -- array of class Mass
+    time -- float, the simulation time of massive_objects
+    snapshot_number -- int, number of snapshots completed
+    settings -- dict, the settings of the run, e.g. SimulationConfig.as_dict(), must be JSON serialisable
+    diagnostics -- dict, quantities collected during the run, must be JSON serialisable
+    integrator_state -- dict, integrator_state yielded by core_functions.integrate_snapshots() (default None)
+
+    Return value:
+    None, writes file_name
+    """
+    (stack, stack_layout, masses) = cf.stacker(massive_objects)
+    integrator_arrays = {}
+    if integrator_state is not None:
+        integrator_arrays = {"integrator_" + key: np.asarray(value, dtype = float) for (key, value) in integrator_state.items()}
+
+    temporary_file_name = file_name + ".tmp"
+    with open(temporary_file_name, "wb") as checkpoint_file:
+        np.savez(checkpoint_file, stack = stack, masses = np.array(masses, dtype = float),
+                 test_mass_counts = stack_layout.test_mass_counts, time = np.float64(time),
+                 snapshot_number = np.int64(snapshot_number), settings = json.dumps(settings), diagnostics = json.dumps(diagnostics),
+                 **integrator_arrays)
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    os.replace(temporary_file_name, file_name) #atomic, the old checkpoint stays until the new one is complete
+
+
+    return None
+
+
+
+
+
+
+def load_checkpoint(file_name):
+    """
+    Reads a checkpoint written by save_checkpoint()
+
+    Keyword arguments:
+    file_name -- string, path of the checkpoint
+
+    Return values:
+    massive_objects -- array of class Mass, with their test masses
+    time -- float, the simulation time of massive_objects
+    snapshot_number -- int, number of snapshots completed
+    settings -- dict, the settings of the run
+    diagnostics -- dict, quantities collected during the run
+    integrator_state -- dict, the integrator_state saved with the checkpoint, None if there wasn't one
+    """
+    with np.load(file_name) as checkpoint:
+        stack = checkpoint["stack"]
+        masses = checkpoint["masses"]
+        stack_layout = StackLayout(len(masses), checkpoint["test_mass_counts"])
+        time = float(checkpoint["time"])
+        snapshot_number = int(checkpoint["snapshot_number"])
+        settings = json.loads(str(checkpoint["settings"]))
+        diagnostics = json.loads(str(checkpoint["diagnostics"]))
+        integrator_state = None
+        if "integrator_stack" in checkpoint.files:
+            integrator_state = {"stack": checkpoint["integrator_stack"]}
+            for key in ("time", "step_size", "next_step_size"):
+                integrator_state[key] = float(checkpoint["integrator_" + key])
+
+    massive_objects = []
+    massive_object_state = stack_layout.massive_object_state(stack)
+    for i in range(stack_layout.number_of_massive_objects):
+        massive_object = Mass(massive_object_state[i, 0:3], massive_object_state[i, 3:6], float(masses[i]))
+        test_mass_state = stack_layout.test_mass_state(stack, i)
+        massive_object.test_masses = ParticleStore.from_arrays(test_mass_state[:, 0:3], test_mass_state[:, 3:6])
+        massive_objects.append(massive_object)
+
+
+    return (massive_objects, time, snapshot_number, settings, diagnostics, integrator_state)
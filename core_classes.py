@@ -1,7 +1,9 @@
+import json
+import copy
+import hashlib
 import numpy as np
-import accessory_functions as af
-from global_constants import *
-np.warnings.filterwarnings('ignore', category=np.VisibleDeprecationWarning)
+import disc_cache_functions as dc
+import global_constants
 
 class Mass:
     """
@@ -10,24 +12,26 @@ class Mass:
     Attributes
     ---------
     position : float[]
-        position in cartesians [a, b, c]
+        position in cartesians [a, b, c], a view of state
     velocity : float[]
-        velocity in cartesians [a, b, c]
+        velocity in cartesians [a, b, c], a view of state
+    state : float[]
+        [x, y, z, vx, vy, vz], the storage behind position and velocity
     mass : float
         mass of massive object
-    test_masses : float[]
-        array of TestMass objects
+    test_masses : ParticleStore
+        contiguous store of the test masses, indexing it gives TestMass objects
     number_of_test_masses : int
         length of test_masses
 
     Methods
     ------
     __init__(vector, vector, float) --> None  
-    (Side-effects: creates position, velocity, mass, test_masses and number_of_test_masses attributes)
+    (Side-effects: creates state, mass and test_masses attributes)
 
 
-    generate_test_masses() --> None 
-    (Side-effects: modifies test_masses and number_of_test_masses)
+    generate_test_masses(int, float, float, float, float, float, SimulationConfig) --> None 
+    (Side-effects: modifies test_masses)
     """
 
 
@@ -41,44 +45,64 @@ class Mass:
         mass -- float (default 1.0)
         """
 
+        self.state = np.zeros(6)
         self.position = position
         self.velocity = velocity
         self.mass = mass
-        self.test_masses = []
-        self.number_of_test_masses = 0
+        self.test_masses = ParticleStore()
 
         return None
-    
-    def generate_test_masses(self):
-        """Populates test_masses array with TestMass objects"""
 
+    @property
+    def position(self):
+        return self.state[0:3]
+
+    @position.setter
+    def position(self, position):
+        self.state[0:3] = position
+
+    @property
+    def velocity(self):
+        return self.state[3:6]
+
+    @velocity.setter
+    def velocity(self, velocity):
+        self.state[3:6] = velocity
+
+    @property
+    def number_of_test_masses(self):
+        return len(self.test_masses)
     
-        for i in range(NUMBER_OF_RINGS): #loop over the rings
-            j=0 #counter for number of masses in each ring
-
-            #the parameters in capitals have been determined in global_variables.py
-            ring_radius = i*RING_SPACING + MINIMUM_RADIUS
-            #rounds down to nearest integer
-            number_of_masses_on_ring = int(ring_radius*NUMBER_OF_MASSES_PER_UNIT_RADIUS)
-            #velocity at which masses need to orbit to stay in a circular orbit
-            orbital_velocity = af.circular_orbit_velocity(ring_radius, self.mass) 
-
-            while j < number_of_masses_on_ring:
-                #spaces test masses equally around ring
-                position_test = [ring_radius, j*2*np.pi/number_of_masses_on_ring, 0] 
-                velocity_test = [0, orbital_velocity, 0] 
-                
-                #convert cylindrical polar coordinates and vector field to cartesians
-                velocity_test = af.field_polar_to_cartesian(position_test, velocity_test)
-                position_test = af.position_polar_to_cartesian(position_test)
-                #ensures test masses are comoving with massive object they are created on
-                velocity_test += self.velocity 
-                position_test += self.position
-
-                self.test_masses.append(TestMass(position_test, velocity_test))
-                j += 1
-
-            self.number_of_test_masses = len(self.test_masses)
+    def generate_test_masses(self, number_of_rings = None, ring_spacing = None, minimum_radius = None,
+                             number_of_masses_per_unit_radius = None, inclination = 0, node_angle = 0, config = None):
+        """
+        Populates test_masses with rings of test masses in circular orbits, see accessory_functions.generate_disc().
+        The disc is loaded from config.disc_cache_directory if it has been generated before, see disc_cache_functions.py
+
+        Keyword arguments:
+        number_of_rings -- int (default None, config.number_of_rings)
+        ring_spacing -- float, distance between neighbouring rings (default None, config.ring_spacing)
+        minimum_radius -- float, radius of the innermost ring (default None, config.minimum_radius)
+        number_of_masses_per_unit_radius -- float (default None, config.number_of_masses_per_unit_radius)
+        inclination -- float, angle in radians between the disc and the x-y plane (default 0)
+        node_angle -- float, angle in radians from the x axis to the line about which the disc is tilted (default 0)
+        config -- SimulationConfig (default None, the values in global_constants.py)
+        """
+
+        if config is None:
+            config = SimulationConfig()
+        (positions, velocities) = dc.cached_disc(config.disc_cache_directory, config.disc_cache_size, self.mass,
+                                                 config.number_of_rings if number_of_rings is None else number_of_rings,
+                                                 config.ring_spacing if ring_spacing is None else ring_spacing,
+                                                 config.minimum_radius if minimum_radius is None else minimum_radius,
+                                                 config.number_of_masses_per_unit_radius if number_of_masses_per_unit_radius is None else number_of_masses_per_unit_radius,
+                                                 inclination, node_angle, config.gravitational_constant)
+
+        #ensures test masses are comoving with massive object they are created on, the disc is cached relative to it,
+        #the offsets are added straight into the store so a cached disc is only read once
+        self.test_masses = ParticleStore(len(positions), config.test_mass_dtype)
+        np.add(positions, self.position, out = self.test_masses.positions)
+        np.add(velocities, self.velocity, out = self.test_masses.velocities)
         return None
 
 
@@ -90,7 +114,7 @@ class Mass:
 
 class TestMass:
     """
-    Class for test_mass objects
+    Class for test_mass objects, a view of one row of a ParticleStore
 
     Attributes
     ---------
@@ -98,24 +122,379 @@ class TestMass:
         position in cartesians [a, b, c]
     velocity : float[]
         velocity in cartesians [a, b, c]
+    particle_store : ParticleStore
+        the store holding the position and velocity
+    index : int
+        row of particle_store belonging to this test mass
 
     Methods
     ------
-    __init__(vector, vector) --> None (Side-effects: creates positon, velocity attributes)
+    __init__(vector, vector, ParticleStore, int) --> None 
+    (Side-effects: creates particle_store and index attributes, and a new ParticleStore if none is given)
     """
 
 
-    def __init__(self, position, velocity):
+    def __init__(self, position = None, velocity = None, particle_store = None, index = 0):
         """
         Assigns positon and velocity to test mass
 
         Keywords arguments:
-        position -- position --- array of floats [a, b, c] (default [0, 0, 0])
-        velocity -- array of floats[d, e, f] (default [0, 0, 0])
+        position -- position --- array of floats [a, b, c] (default None, leaves the stored value unchanged)
+        velocity -- array of floats[d, e, f] (default None, leaves the stored value unchanged)
+        particle_store -- ParticleStore, the store to view (default None, a new store holding only this test mass)
+        index -- int, row of particle_store (default 0)
         """
 
-        self.position = position
-        self.velocity = velocity
+        if particle_store is None:
+            particle_store = ParticleStore(1)
+        self.particle_store = particle_store
+        self.index = index
+        if position is not None:
+            self.position = position
+        if velocity is not None:
+            self.velocity = velocity
   
         return None
-    
+
+    @property
+    def position(self):
+        return self.particle_store.state[self.index, 0:3]
+
+    @position.setter
+    def position(self, position):
+        self.particle_store.state[self.index, 0:3] = position
+
+    @property
+    def velocity(self):
+        return self.particle_store.state[self.index, 3:6]
+
+    @velocity.setter
+    def velocity(self, velocity):
+        self.particle_store.state[self.index, 3:6] = velocity
+
+
+
+
+
+
+
+
+class ParticleStore:
+    """
+    Class holding the positions and velocities of a group of test masses in one contiguous array.
+    Indexing or iterating over it gives TestMass objects viewing its rows.
+
+    Attributes
+    ---------
+    state : float[][]
+        one row [x, y, z, vx, vy, vz] per particle
+    positions : float[][]
+        view of the first three columns of state
+    velocities : float[][]
+        view of the last three columns of state
+
+    Methods
+    ------
+    __init__(int, dtype) --> None (Side-effects: creates state attribute)
+
+    from_arrays(float[][], float[][], dtype) --> ParticleStore (No Side-effects)
+
+    __len__() --> int (No Side-effects)
+
+    __getitem__(int) --> TestMass (No Side-effects)
+    """
+
+
+    def __init__(self, number_of_particles = 0, dtype = float):
+        """
+        Allocates the store, with all positions and velocities zero
+
+        Keyword arguments:
+        number_of_particles -- int, number of rows (default 0)
+        dtype -- numpy dtype of the stored values (default float)
+        """
+
+        self.state = np.zeros((number_of_particles, 6), dtype = dtype)
+
+        return None
+
+    @classmethod
+    def from_arrays(cls, positions, velocities, dtype = float):
+        """
+        Creates a ParticleStore holding copies of positions and velocities
+
+        Keyword arguments:
+        positions -- 2D array of floats, [ x y z, ...]
+        velocities -- 2D array of floats, [ vx vy vz, ...]
+        dtype -- numpy dtype of the stored values (default float)
+
+        Return value:
+        -- ParticleStore
+        """
+
+        particle_store = cls(len(positions), dtype)
+        particle_store.positions[:] = positions
+        particle_store.velocities[:] = velocities
+        return particle_store
+
+    @property
+    def positions(self):
+        return self.state[:, 0:3]
+
+    @property
+    def velocities(self):
+        return self.state[:, 3:6]
+
+    def __len__(self):
+        return len(self.state)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("particle index out of range")
+        return TestMass(particle_store = self, index = index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield TestMass(particle_store = self, index = index)
+
+
+
+
+
+
+
+
+class StackLayout:
+    """
+    Class describing where each object is stored in a stack (see core_functions.stacker()).
+    Computed once per system and used in place of comparing strings element by element.
+
+    Every object takes up one row of 6 floats in the stack, [x, y, z, vx, vy, vz].
+    The rows of the massive objects come first, followed by the rows of the test masses of
+    massive object 0, then those of massive object 1, and so on.
+
+    Attributes
+    ---------
+    number_of_massive_objects : int
+        number of massive objects at the start of the stack
+    test_mass_counts : int[]
+        number of test masses belonging to each massive object
+    number_of_test_masses : int
+        total number of test masses in the stack
+    test_mass_offsets : int[]
+        row of the stack at which the test masses of each massive object start, with the end row appended
+    massive_object_slice : slice
+        elements of the stack holding the massive objects
+    test_mass_slice : slice
+        elements of the stack holding the test masses
+    length : int
+        number of elements in the stack
+
+    Methods
+    ------
+    __init__(int, int[]) --> None
+    (Side-effects: creates the attributes above)
+
+    from_massive_objects(Mass[]) --> StackLayout (No Side-effects)
+
+    massive_object_state(float[]) --> float[][] (No Side-effects)
+
+    test_mass_state(float[], int) --> float[][] (No Side-effects)
+    """
+
+
+    def __init__(self, number_of_massive_objects, test_mass_counts):
+        """
+        Works out the offsets of each block of the stack
+
+        Keyword arguments:
+        number_of_massive_objects -- int, number of massive objects in the system
+        test_mass_counts -- array of ints, number of test masses belonging to each massive object
+        """
+
+        self.number_of_massive_objects = int(number_of_massive_objects)
+        self.test_mass_counts = np.array(test_mass_counts, dtype = np.int64)
+        self.number_of_test_masses = int(np.sum(self.test_mass_counts))
+        self.test_mass_offsets = self.number_of_massive_objects + np.concatenate(([0], np.cumsum(self.test_mass_counts)))
+        self.massive_object_slice = slice(0, 6*self.number_of_massive_objects)
+        self.test_mass_slice = slice(6*self.number_of_massive_objects, 6*(self.number_of_massive_objects + self.number_of_test_masses))
+        self.length = self.test_mass_slice.stop
+
+        return None
+
+    @classmethod
+    def from_massive_objects(cls, massive_objects):
+        """Returns the StackLayout of the stack that core_functions.stacker() builds from massive_objects"""
+        return cls(len(massive_objects), [massive_object.number_of_test_masses for massive_object in massive_objects])
+
+    def massive_object_state(self, stack):
+        """
+        Returns a view of the massive object rows of stack
+
+        Keyword arguments:
+        stack -- array of floats, see core_functions.stacker() for more information
+
+        Return value:
+        -- 2D array of floats, [x y z vx vy vz, ...] one row per massive object
+        """
+
+        return np.reshape(stack[self.massive_object_slice], (self.number_of_massive_objects, 6))
+
+    def test_mass_state(self, stack, massive_object_number = None):
+        """
+        Returns a view of the test mass rows of stack
+
+        Keyword arguments:
+        stack -- array of floats, see core_functions.stacker() for more information
+        massive_object_number -- int, only return the test masses of this massive object (default None, all test masses)
+
+        Return value:
+        -- 2D array of floats, [x y z vx vy vz, ...] one row per test mass
+        """
+
+        if massive_object_number is None:
+            return np.reshape(stack[self.test_mass_slice], (self.number_of_test_masses, 6))
+        start = self.test_mass_offsets[massive_object_number]
+        end = self.test_mass_offsets[massive_object_number + 1]
+        return np.reshape(stack[6*start:6*end], (end - start, 6))
+
+
+
+
+
+
+
+
+class IntegrationResult:
+    """
+    Class for the results of the integrators in core_functions that do not use solve_ivp,
+    with the same attributes as the solve_ivp results that the rest of the program uses
+
+    Attributes
+    ---------
+    t : float[]
+        times of the columns of y
+    y : float[][]
+        stack at each time, one column per time
+    nfev : int
+        number of evaluations of the accelerations
+    success : bool
+        whether the integration completed
+    status : int
+        0 if the integration completed, as for solve_ivp
+    message : string
+        description of how the integration finished
+
+    Methods
+    ------
+    __init__(float[], float[][], int) --> None (Side-effects: creates the attributes above)
+    """
+
+
+    def __init__(self, t, y, nfev, success = True, message = "The solver successfully reached the end of the integration interval."):
+        """
+        Stores the results of an integration
+
+        Keyword arguments:
+        t -- array of floats, times of the columns of y
+        y -- 2D array of floats, stack at each time
+        nfev -- int, number of evaluations of the accelerations
+        success -- bool (default True)
+        message -- string (default says the integration completed)
+        """
+
+        self.t = t
+        self.y = y
+        self.nfev = nfev
+        self.success = success
+        self.status = 0 if success else -1
+        self.message = message
+
+        return None
+
+
+
+
+
+
+
+
+class SimulationConfig:
+    """
+    Class holding every physical and numerical parameter of a simulation, so that simulations with different
+    settings can exist side by side. There is one attribute for each constant in global_constants.py, named in
+    lower case (e.g. step_size for STEP_SIZE), which it takes as its default.
+
+    Attributes
+    ---------
+    galaxy_position, galaxy_velocity, galaxy_mass, step_size, delta_time, number_of_snapshots, gravitational_constant, ...
+        see global_constants.py
+
+    Methods
+    ------
+    __init__(**parameters) --> None (Side-effects: creates an attribute for each parameter)
+
+    replace(**parameters) --> SimulationConfig (No Side-effects)
+
+    as_dict() --> dict (No Side-effects)
+
+    from_dict(dict) --> SimulationConfig (No Side-effects)
+
+    config_hash(string[]) --> string (No Side-effects)
+    """
+
+
+    def __init__(self, **parameters):
+        """
+        Takes each parameter from global_constants.py unless it is given
+
+        Keyword arguments:
+        **parameters -- values to use instead of those in global_constants.py, e.g. step_size = 0.05
+        """
+
+        for name in SimulationConfig.parameter_names():
+            setattr(self, name, copy.deepcopy(getattr(global_constants, name.upper())))
+        for (name, value) in parameters.items():
+            if not hasattr(global_constants, name.upper()) or not name.islower():
+                raise TypeError("SimulationConfig has no parameter " + str(name))
+            setattr(self, name, value)
+
+        return None
+
+    @staticmethod
+    def parameter_names():
+        """Returns an array of strings, the names of the parameters, one for each constant in global_constants.py"""
+        return [name.lower() for name in dir(global_constants) if name.isupper()]
+
+    def replace(self, **parameters):
+        """Returns a new SimulationConfig, a copy of this one with the given parameters changed"""
+        new_parameters = self.as_dict()
+        new_parameters.update(parameters)
+        return SimulationConfig(**new_parameters)
+
+    def as_dict(self):
+        """Returns a dict of every parameter"""
+        return {name: copy.deepcopy(getattr(self, name)) for name in SimulationConfig.parameter_names()}
+
+    @classmethod
+    def from_dict(cls, parameters):
+        """Returns a SimulationConfig with the parameters in a dict written by as_dict()"""
+        return cls(**parameters)
+
+    def config_hash(self, parameter_names = None):
+        """Returns a string, a hash of the named parameters (default every parameter), the same for configs where they are equal"""
+        parameters = self.as_dict()
+        if parameter_names is not None:
+            parameters = {name: parameters[name] for name in parameter_names}
+        return hashlib.sha1(json.dumps(parameters, sort_keys = True).encode()).hexdigest()
+
+    def __eq__(self, other):
+        return isinstance(other, SimulationConfig) and self.as_dict() == other.as_dict()
+
+    def __hash__(self):
+        return hash(self.config_hash())
+
+    def __repr__(self):
+        return "SimulationConfig(" + ", ".join(name + " = " + repr(value) for (name, value) in self.as_dict().items()) + ")"
@@ -1,29 +1,61 @@
 import numpy as np
 import accessory_functions as af
-import scipy.integrate as syi
-from global_constants import GRAVITATIONAL_CONSTANT, STEP_SIZE
-np.warnings.filterwarnings('ignore', category=np.VisibleDeprecationWarning)
+import tree_functions as tf
+import kernel_functions as kf
+import timestep_functions as ts
+import mesh_functions as mf
+from core_classes import StackLayout, IntegrationResult, SimulationConfig
+from global_constants import GRAVITATIONAL_CONSTANT
 
 """
 Methods for integrating the differential equations and changing the format of data 
 
+Every method taking a config (a SimulationConfig) uses the values in global_constants.py when it isn't given.
+scipy is only imported by the methods that call solve_ivp, so runs with the symplectic and block integrators never load it.
+The integrators taking a profiler (a profiling_functions.Profiler) count and time their evaluations and steps in it,
+nothing is counted when it is None.
+
 For methods involving vector algebra and other minor numerical calculations, see accessory_functions.py
 
 Methods:
 
-    stacker(Mass[]) --> (float[], string[], float[]) (No side-effects)
+    stacker(Mass[]) --> (float[], StackLayout, float[]) (Side-effects: the states of Mass[] become views of the returned stack)
+
+    separate_stack(float[], StackLayout) --> (float[], float[]) (No side-effects)
+
+    destacker(float[], StackLayout, Mass[]) --> None (Side-effects: modifies attributes of Mass[])
+
+    forcing_function_massive_object(float[], float[], int, int, float) --> float (No Side-effects)
+
+    forcing_function_test_mass(float[], float[], int, float[], float) --> float (No Side-effects)
+
+    derivative_assignment(float, float[], StackLayout, float[], SimulationConfig) --> float[] (No Side-effects)
+
+    massive_object_accelerations(float[][], float[], SimulationConfig) --> float[][] (No Side-effects)
+
+    test_mass_accelerations(float[][], float[][], float[], SimulationConfig) --> float[][] (No Side-effects)
+
+    acceleration_assignment(float[][], StackLayout, float[], string, SimulationConfig) --> float[][] (No Side-effects)
+
+    vectorized_derivative_assignment(float, float[], StackLayout, float[], string, SimulationConfig) --> float[] (No Side-effects)
 
-    separate_stack(float[], string[]) --> (float[], float[]) (No side-effects)
+    symplectic_integrate(float[], StackLayout, float[], float, float, string, float, string, SimulationConfig, Profiler, float[]) --> IntegrationResult (No Side-effects)
 
-    destacker(float[], string[], Mass[]) --> None (Side-effects: modifies attributes of Mass[])
+    block_integrate(float[], StackLayout, float[], float, float, string, SimulationConfig, Profiler, float[]) --> IntegrationResult (No Side-effects)
 
-    forcing_function_massive_object(float[], float[], int, int) --> float (No Side-effects)
+    integrate(float[], StackLayout, float[], float, float, string, string, string, SimulationConfig, Profiler, float[]) --> float[] (No Side-effects)
 
-    forcing_function_test_mass(float[], float[], int, float[]) --> float (No Side-effects)
+    integrate_snapshots(float[], StackLayout, float[], float, float[], string, string, string, dict, SimulationConfig, function, Profiler) --> generator (No Side-effects)
 
-    derivative_assignment(float, float[], string[], float[]) --> float[] (No Side-effects)
+    test_mass_derivative_assignment(float, float[], function, float[], SimulationConfig) --> float[] (No Side-effects)
 
-    integrate(float[], string[], float[], float, float) --> float[] (No Side-effects)
+    integrate_massive_objects(float[], float[], float, float, float, float, SimulationConfig) --> OdeResult (No Side-effects)
+
+    propagate_test_masses(float[][], function, float[], float, float, string, int, float, SimulationConfig) --> (float[][], int) (No Side-effects)
+
+    integrate_restricted(float[], StackLayout, float[], float, float, string, int, SimulationConfig) --> IntegrationResult (No Side-effects)
+
+    integrate_mixed_precision(Mass[], float, float, string, int, SimulationConfig) --> int (Side-effects: advances massive_objects)
 
 """
 
@@ -31,6 +63,16 @@ Methods:
 
 
 
+def _scipy_integrate():
+    """Returns the scipy.integrate module, imported on first use as it takes much longer to import than the rest of the program"""
+    import scipy.integrate
+    return scipy.integrate
+
+
+
+
+
+
 def stacker(massive_objects):
     """
     Creates a one dimensional array of all the positions and velocities of masses and test masses in massive_objects
@@ -50,83 +92,95 @@ def stacker(massive_objects):
         ...
     For more information see accompanying report.
 
+    The first call copies every object into a new stack and makes their state arrays views of it,
+    so later calls (for the same objects) return the same stack without copying. Changing the stack
+    therefore changes the objects, and destacker() on an integrated stack is a single copy per massive object.
+    A stack is always float64, so test masses stored in float32 (see TEST_MASS_DTYPE) are rejected rather than copied
+    into it, integrate them with integrate_mixed_precision() instead.
+
     Keyword arguments:
     massive_objects -- array of class Mass
 
     Return values:
     stack -- array of floats, structure described above
-    stack_info -- array of strings, contains information about what the values in stack correspond to
+    stack_layout -- StackLayout, contains information about what the values in stack correspond to
     masses -- array of floats, the masses of the massive objects 
     """
 
 
-    stack = []
-    stack_info = []
-    masses = []
+    for massive_object in massive_objects:
+        if massive_object.test_masses.state.dtype != float:
+            raise ValueError("test masses stored as " + str(massive_object.test_masses.state.dtype)
+                             + " can't be put in a float64 stack, integrate them with integrate_mixed_precision()")
+    masses = [massive_object.mass for massive_object in massive_objects]
+    stack_layout = StackLayout.from_massive_objects(massive_objects)
 
-    number_of_massive_objects = len(massive_objects)
+    stack = _shared_stack(massive_objects, stack_layout)
+    if stack is None:
+        stack = np.empty(stack_layout.length)
+        massive_object_state = stack_layout.massive_object_state(stack)
+        for i in range(stack_layout.number_of_massive_objects):
+            #copy each object into its rows, then make the object a view of those rows
+            massive_object_state[i] = massive_objects[i].state
+            massive_objects[i].state = massive_object_state[i]
+            test_mass_state = stack_layout.test_mass_state(stack, i)
+            test_mass_state[:] = massive_objects[i].test_masses.state
+            massive_objects[i].test_masses.state = test_mass_state
+
+
+
+    return (stack, stack_layout, masses)
 
 
-    #loop for massive objects
-    for i in range(number_of_massive_objects):
-        masses.append(massive_objects[i].mass)
-        for k in range(3):
-            stack.append(massive_objects[i].position[k])
-            stack_info.append(("position", "mass"))
-        for k in range(3):
-            stack.append(massive_objects[i].velocity[k])
-            stack_info.append(("velocity", "mass"))
 
 
-    #loop for test masses
-    for i in range(number_of_massive_objects):
-        for j in range(massive_objects[i].number_of_test_masses):
-            for k in range(3):
-                stack.append(massive_objects[i].test_masses[j].position[k])
-                stack_info.append(("position", "test_mass"))
-            for k in range(3):
-                stack.append(massive_objects[i].test_masses[j].velocity[k])
-                stack_info.append(("velocity", "test_mass"))
-    stack_info = np.array(stack_info)
 
 
 
-    return (stack, stack_info, masses)
+def _shared_stack(massive_objects, stack_layout):
+    """Returns the stack that every object in massive_objects is already a view of, or None if there isn't one"""
+    if stack_layout.number_of_massive_objects == 0:
+        return None
+    stack = massive_objects[0].state.base
+    if stack is None or stack.ndim != 1 or stack.dtype != float or len(stack) != stack_layout.length:
+        return None
 
+    #each object must view the rows stack_layout expects it to
+    row_size = 6*stack.itemsize
+    for i in range(stack_layout.number_of_massive_objects):
+        if massive_objects[i].state.base is not stack or massive_objects[i].state.ctypes.data != stack.ctypes.data + i*row_size:
+            return None
+        test_mass_state = massive_objects[i].test_masses.state
+        if len(test_mass_state) > 0:
+            if test_mass_state.base is not stack or test_mass_state.ctypes.data != stack.ctypes.data + stack_layout.test_mass_offsets[i]*row_size:
+                return None
 
 
+    return stack
 
 
 
 
-def separate_stack(stack, stack_info):
+
+
+
+def separate_stack(stack, stack_layout):
     """
     Separates stack into arrays corresponding to position for massive objects and test masses
 
     Keyword arguments:
     stack -- array of floats, see stacker() method for more information
-    stack_info -- array of strings, contains information about what the values in stack correspond to
+    stack_layout -- StackLayout, contains information about what the values in stack correspond to
 
     Return values:
     positions_of_massive_objects -- 2D array of floats, [ x y z, ...] for the positions of massive objects
     positions_of_test_masses -- 2D array of floats, [ x y z, ...] for the positions of test masses
     """
 
+    stack = np.asarray(stack)
+    positions_of_massive_objects = stack_layout.massive_object_state(stack)[:, 0:3]
+    positions_of_test_masses = stack_layout.test_mass_state(stack)[:, 0:3]
 
-    positions_of_massive_objects = []
-    positions_of_test_masses = []
-    i = 0
-    while i < len(stack) - 1: 
-        if stack_info[i, 1] == "mass":
-            #assigns x, y and z coordinates
-            positions_of_massive_objects.append([stack[i], stack[i+1], stack[i+2]]) 
-            i += 6
-        else:
-            positions_of_test_masses.append([stack[i], stack[i+1], stack[i+2]])
-            i += 6
-
-
-        
 
     return (positions_of_massive_objects, positions_of_test_masses)
 
@@ -136,45 +190,24 @@ def separate_stack(stack, stack_info):
 
 
 
-def destacker(stack, stack_info, massive_objects):
+def destacker(stack, stack_layout, massive_objects):
     """
     Updates the position and velocity in massive_objects, for massive objects and test masses, given a stack
 
     Keyword arguments:
     stack -- array of floats, see stacker() method for more information
-    stack_info -- array of strings, contains information about what the values in stack correspond to
+    stack_layout -- StackLayout, contains information about what the values in stack correspond to
     massive_objects -- array of class Mass
 
     Return value:
     None, changes attributes of massive_objects (pass by reference)
     """
-    number_of_masses = len(massive_objects)
-    positions_of_massive_objects = []
-    velocities_of_massive_objects = []
-    positions_of_test_masses = []
-    velocities_of_test_masses = []
-    number_of_test_masses_completed = 0
-    i = 0
-
-    #looping over entire stack
-    while i < len(stack) - 1:
-        if stack_info[i, 1] == "mass":
-            #assigns x, y and z coordinates
-            positions_of_massive_objects.append([stack[i], stack[i+1], stack[i+2]]) 
-            #assigns x, y and z velocities
-            velocities_of_massive_objects.append([stack[i+3], stack[i+4], stack[i+5]]) 
-            i += 6
-        else:
-            positions_of_test_masses.append([stack[i], stack[i+1], stack[i+2]])
-            velocities_of_test_masses.append([stack[i+3], stack[i+4], stack[i+5]])
-            i += 6
-    for a in range(number_of_masses):
-        massive_objects[a].position = positions_of_massive_objects[a]
-        massive_objects[a].velocity = velocities_of_massive_objects[a]
-        for b in range(massive_objects[a].number_of_test_masses):
-            massive_objects[a].test_masses[b].position = positions_of_test_masses[number_of_test_masses_completed]
-            massive_objects[a].test_masses[b].velocity = velocities_of_test_masses[number_of_test_masses_completed]
-            number_of_test_masses_completed += 1
+    stack = np.asarray(stack)
+    massive_object_state = stack_layout.massive_object_state(stack)
+
+    for a in range(stack_layout.number_of_massive_objects):
+        massive_objects[a].state[:] = massive_object_state[a]
+        massive_objects[a].test_masses.state[:] = stack_layout.test_mass_state(stack, a)
 
   
   
@@ -187,7 +220,7 @@ def destacker(stack, stack_info, massive_objects):
 
 
 
-def forcing_function_massive_object(positions_of_massive_objects, masses, axis, massive_object_number):
+def forcing_function_massive_object(positions_of_massive_objects, masses, axis, massive_object_number, gravitational_constant = GRAVITATIONAL_CONSTANT):
     """
     Finds the force acting on massive_object_number in massive_objects array along a particular axis
 
@@ -196,6 +229,7 @@ def forcing_function_massive_object(positions_of_massive_objects, masses, axis,
     masses -- array of floats, masses of each of the massive_objects
     axis -- float, range 0-2 corresponding to x, y, z
     massive_object_number -- the row number of positions_of_massive_objects of the mass 
+    gravitational_constant -- float (default GRAVITATIONAL_CONSTANT)
 
     Return values:
     force -- float, the force acting on the object along (axis)
@@ -210,7 +244,7 @@ def forcing_function_massive_object(positions_of_massive_objects, masses, axis,
             r_vector = af.distance(positions_of_massive_objects[massive_object_number], positions_of_massive_objects[i])
             r_vector = np.array(r_vector)
             #adds the force due to this mass to the total force
-            force += r_vector[axis]*masses[i]*GRAVITATIONAL_CONSTANT/(np.linalg.norm(r_vector)**3) 
+            force += r_vector[axis]*masses[i]*gravitational_constant/(np.linalg.norm(r_vector)**3) 
     
     
     
@@ -222,7 +256,7 @@ def forcing_function_massive_object(positions_of_massive_objects, masses, axis,
 
 
 
-def forcing_function_test_mass(positions_of_massive_objects, masses, axis, position_of_test_mass):
+def forcing_function_test_mass(positions_of_massive_objects, masses, axis, position_of_test_mass, gravitational_constant = GRAVITATIONAL_CONSTANT):
     """
     Finds the force acting on a test mass along a particular axis due to the massive objects
 
@@ -231,6 +265,7 @@ def forcing_function_test_mass(positions_of_massive_objects, masses, axis, posit
     masses -- array of floats, masses of each of the massive_objects
     axis -- float, range 0-2 corresponding to x, y, z
     position_of_test_mass -- the position of the test mass on which the force will act
+    gravitational_constant -- float (default GRAVITATIONAL_CONSTANT)
 
     Return values:
     force -- float, the force acting on the object along (axis)
@@ -241,7 +276,7 @@ def forcing_function_test_mass(positions_of_massive_objects, masses, axis, posit
         r_vector = af.distance(position_of_test_mass, positions_of_massive_objects[i]) 
         r_vector = np.array(r_vector)
         #adds the force due to this mass to the total force
-        force += r_vector[axis]*masses[i]*GRAVITATIONAL_CONSTANT/(np.linalg.norm(r_vector)**3) 
+        force += r_vector[axis]*masses[i]*gravitational_constant/(np.linalg.norm(r_vector)**3) 
 
 
     return force
@@ -251,50 +286,46 @@ def forcing_function_test_mass(positions_of_massive_objects, masses, axis, posit
 
 
 
-def derivative_assignment(time, stack, stack_info, masses): 
+def derivative_assignment(time, stack, stack_layout, masses, config = None): 
     """
     Create and return the values of the derivatives at time, in the same format as stack.
 
     Keyword arguments:
     time -- float, time at which derivatives are to be evaluated. 
     stack -- array of floats, see stacker() method for more information
-    stack_info -- array of strings, contains information about what the values in stack correspond to
+    stack_layout -- StackLayout, contains information about what the values in stack correspond to
     masses -- array of floats, masses of each of the massive_objects
+    config -- SimulationConfig (default None, the values in global_constants.py)
 
     Return values:
     derivative_stack -- array of floats, of the derivatives to be assigned at time
     """
-
+    if config is None:
+        config = SimulationConfig()
 
     derivative_stack = [] #return object
 
-    length_of_stack = len(stack)
     stack = np.array(stack)
 
-    #keeps track of which number mass is being assigned in the separated arrays
-    number_of_massive_objects_compelted = 0 
-    number_of_test_masses_completed = 0
+    (positions_of_massive_objects, positions_of_test_masses) = separate_stack(stack, stack_layout)
 
     i = 0 #counter for each element in stack 
 
-    (positions_of_massive_objects, positions_of_test_masses) = separate_stack(stack, stack_info)
-    while i < length_of_stack:  #looping over stack
-        if stack_info[i, 1] == "mass":
-            for axis in range(3):
-                derivative_stack.append(stack[i+3+axis])
-            i += 3 #advances to next set of three velocities
-            for axis in range(3):
-                derivative_stack.append(forcing_function_massive_object(positions_of_massive_objects, masses, axis, number_of_massive_objects_compelted))
-            number_of_massive_objects_compelted += 1
-            i += 3 #advances to next set of three position coordinates
-        else:
-            for axis in range(3):
-                derivative_stack.append(stack[i+3+axis])
-            i += 3
-            for axis in range(3):
-                derivative_stack.append(forcing_function_test_mass(positions_of_massive_objects, masses, axis, positions_of_test_masses[number_of_test_masses_completed])) 
-            number_of_test_masses_completed += 1  
-            i += 3
+    #rows of the massive objects come first
+    for massive_object_number in range(stack_layout.number_of_massive_objects):
+        for axis in range(3):
+            derivative_stack.append(stack[i+3+axis])
+        for axis in range(3):
+            derivative_stack.append(forcing_function_massive_object(positions_of_massive_objects, masses, axis, massive_object_number, config.gravitational_constant))
+        i += 6 #advances to the next row
+
+    #followed by the rows of the test masses
+    for test_mass_number in range(stack_layout.number_of_test_masses):
+        for axis in range(3):
+            derivative_stack.append(stack[i+3+axis])
+        for axis in range(3):
+            derivative_stack.append(forcing_function_test_mass(positions_of_massive_objects, masses, axis, positions_of_test_masses[test_mass_number], config.gravitational_constant)) 
+        i += 6
 
 
 
@@ -304,23 +335,395 @@ def derivative_assignment(time, stack, stack_info, masses):
 
 
 
-def integrate(stack, stack_info, masses, time, delta_time):
+def massive_object_accelerations(positions_of_massive_objects, masses, config = None):
+    """
+    Finds the accelerations of all the massive objects due to each other using array operations
+
+    Equivalent to calling forcing_function_massive_object() for every massive object and axis, when softening_length is 0.
+
+    Keyword arguments:
+    positions_of_massive_objects -- 2D array of floats, [ x y z, ...] positions of all the masses
+    masses -- array of floats, masses of each of the massive_objects
+    config -- SimulationConfig, gives the gravitational_constant and softening_length (default None, the values in global_constants.py)
+
+    Return values:
+    accelerations -- 2D array of floats, [ x y z, ...] the acceleration of each massive object
+    """
+    if config is None:
+        config = SimulationConfig()
+    positions_of_massive_objects = np.asarray(positions_of_massive_objects, dtype = float)
+    masses = np.asarray(masses, dtype = float)
+
+    #r_vectors[i, j] is the separation vector from massive object i to massive object j
+    r_vectors = positions_of_massive_objects[np.newaxis, :, :] - positions_of_massive_objects[:, np.newaxis, :]
+    distances_cubed = (np.sum(r_vectors**2, axis = 2) + config.softening_length**2)**1.5
+    np.fill_diagonal(distances_cubed, np.inf) #so the mass doesn't exert a force on itself
+
+    return config.gravitational_constant*np.einsum("ijk,ij->ik", r_vectors, masses[np.newaxis, :]/distances_cubed)
+
+
+
+
+
+
+
+def test_mass_accelerations(positions_of_test_masses, positions_of_massive_objects, masses, config = None):
+    """
+    Finds the accelerations of all the test masses due to the massive objects using array operations
+
+    Equivalent to calling forcing_function_test_mass() for every test mass and axis, when softening_length is 0.
+    Test masses in float32 are found in float32, only the sum over the massive objects is made in float64.
+
+    Keyword arguments:
+    positions_of_test_masses -- 2D array of floats, [ x y z, ...] positions of all the test masses
+    positions_of_massive_objects -- 2D array of floats, [ x y z, ...] positions of all the masses
+    masses -- array of floats, masses of each of the massive_objects
+    config -- SimulationConfig, gives the gravitational_constant and softening_length (default None, the values in global_constants.py)
+
+    Return values:
+    accelerations -- 2D array of floats, [ x y z, ...] the acceleration of each test mass, in the precision of the test masses
+    """
+    if config is None:
+        config = SimulationConfig()
+    positions_of_test_masses = np.asarray(positions_of_test_masses)
+    dtype = _precision(positions_of_test_masses)
+    positions_of_test_masses = positions_of_test_masses.astype(dtype, copy = False)
+    accelerations = np.zeros(positions_of_test_masses.shape)
+
+    #loop over the (few) massive objects, every test mass is handled at once
+    for i in range(len(masses)):
+        r_vectors = np.asarray(positions_of_massive_objects[i], dtype = dtype) - positions_of_test_masses
+        distances_cubed = (np.sum(r_vectors**2, axis = 1) + dtype(config.softening_length**2))**1.5
+        accelerations += r_vectors*(dtype(masses[i]*config.gravitational_constant)/distances_cubed)[:, np.newaxis]
+
+
+    return accelerations.astype(dtype, copy = False)
+
+
+def _precision(state):
+    """Returns the dtype test masses are integrated in, float32 for float32 arrays and float (float64) for anything else"""
+    return np.float32 if state.dtype == np.float32 else float
+
+
+
+
+
+
+#functions finding the accelerations of the massive objects and of the test masses, for each force_backend.
+#"direct" sums over every pair with the compiled kernels of kernel_functions when Numba is installed, and with
+#the NumPy functions above otherwise; "numpy" and "jit" always use one or the other. "tree" and "mesh" approximate
+#the forces of many massive objects, see tree_functions.py and mesh_functions.py.
+FORCE_BACKENDS = {
+    "numpy": (massive_object_accelerations, test_mass_accelerations),
+    "jit": (kf.jit_accelerations, kf.jit_test_mass_accelerations),
+    "tree": (tf.tree_accelerations, tf.tree_test_mass_accelerations),
+    "mesh": (mf.mesh_accelerations, mf.mesh_test_mass_accelerations),
+}
+FORCE_BACKENDS["direct"] = FORCE_BACKENDS["jit"] if kf.NUMBA_AVAILABLE else FORCE_BACKENDS["numpy"]
+
+
+def acceleration_assignment(positions, stack_layout, masses, force_backend = "direct", config = None):
+    """
+    Finds the acceleration of every object in a stack, given all of their positions
+
+    Keyword arguments:
+    positions -- 2D array of floats, [ x y z, ...] one row per object in the order of the stack
+    stack_layout -- StackLayout, contains information about what the values in stack correspond to
+    masses -- array of floats, masses of each of the massive_objects
+    force_backend -- string, a key of FORCE_BACKENDS, "direct" sums over every pair, "tree" and "mesh" use tree_functions and mesh_functions (default "direct")
+    config -- SimulationConfig (default None, the values in global_constants.py)
+
+    Return values:
+    accelerations -- 2D array of floats, [ x y z, ...] the acceleration of each object
+    """
+    if config is None:
+        config = SimulationConfig()
+    (massive_object_function, test_mass_function) = FORCE_BACKENDS[force_backend]
+    number_of_massive_objects = stack_layout.number_of_massive_objects
+    accelerations = np.empty_like(positions)
+
+    positions_of_massive_objects = positions[:number_of_massive_objects]
+    accelerations[:number_of_massive_objects] = massive_object_function(positions_of_massive_objects, masses, config)
+    accelerations[number_of_massive_objects:] = test_mass_function(positions[number_of_massive_objects:], positions_of_massive_objects, masses, config)
+
+
+    return accelerations
+
+
+
+
+
+
+def vectorized_derivative_assignment(time, stack, stack_layout, masses, force_backend = "direct", config = None):
+    """
+    Create and return the values of the derivatives at time, in the same format as stack.
+
+    Gives the same result as derivative_assignment(), but reshapes stack into rows of
+    [x y z vx vy vz] (massive objects first, then test masses) and evaluates every row at once.
+
+    Keyword arguments:
+    time -- float, time at which derivatives are to be evaluated. 
+    stack -- array of floats, see stacker() method for more information
+    stack_layout -- StackLayout, contains information about what the values in stack correspond to
+    masses -- array of floats, masses of each of the massive_objects
+    force_backend -- string, a key of FORCE_BACKENDS (default "direct")
+    config -- SimulationConfig (default None, the values in global_constants.py)
+
+    Return values:
+    derivative_stack -- array of floats, of the derivatives to be assigned at time
+    """
+    state = np.reshape(np.asarray(stack, dtype = float), (-1, 6))
+    derivative_state = np.empty_like(state)
+
+    #derivative of the position is the velocity
+    derivative_state[:, 0:3] = state[:, 3:6]
+    derivative_state[:, 3:6] = acceleration_assignment(state[:, 0:3], stack_layout, masses, force_backend, config)
+
+
+    return derivative_state.reshape(-1)
+
+
+
+
+
+#the right-hand sides that can be chosen in integrate()
+DERIVATIVE_FUNCTIONS = {"loop": derivative_assignment, "vectorized": vectorized_derivative_assignment}
+
+
+#kick and drift coefficients of the fixed step symplectic integrators, as fractions of the step size.
+#a step is kick, drift, kick, drift, ..., kick, with one more kick than drift.
+_YOSHIDA_W1 = 1/(2 - 2**(1/3))
+_YOSHIDA_W0 = -2**(1/3)/(2 - 2**(1/3))
+SYMPLECTIC_COEFFICIENTS = {
+    "leapfrog": ((0.5, 0.5), (1.0,)),
+    "yoshida": ((_YOSHIDA_W1/2, (_YOSHIDA_W0 + _YOSHIDA_W1)/2, (_YOSHIDA_W0 + _YOSHIDA_W1)/2, _YOSHIDA_W1/2), (_YOSHIDA_W1, _YOSHIDA_W0, _YOSHIDA_W1)),
+}
+
+
+def symplectic_integrate(stack, stack_layout, masses, time, delta_time, method = "leapfrog", step_size = None, force_backend = "direct", config = None,
+                         profiler = None, output_times = None):
+    """
+    Integrates the system with a fixed step kick-drift-kick symplectic integrator
+
+    "leapfrog" is second order and needs one evaluation of the accelerations per step, "yoshida" is
+    fourth order and needs three. The accelerations at the end of a step are reused at the start of the next.
+    The step is the largest that fits a whole number of times into delta_time without exceeding step_size,
+    or with output_times into each interval between them, so every output time falls at the end of a step.
+
+    Keyword arguments:
+    stack -- array of floats, see stacker() method for more information
+    stack_layout -- StackLayout, contains information about what the values in stack correspond to
+    masses -- array of floats, masses of each of the massive_objects
+    time -- float, the start time from which the system should be solved
+    delta_time --  float, the interval over which the system should be solved
+    method -- string, "leapfrog" or "yoshida" (default "leapfrog")
+    step_size -- float, the largest step allowed (default None, config.step_size)
+    force_backend -- string, a key of FORCE_BACKENDS (default "direct")
+    config -- SimulationConfig (default None, the values in global_constants.py)
+    profiler -- Profiler, counts and times the force evaluations and steps (default None)
+    output_times -- array of floats, increasing times after time, up to time + delta_time, at which to keep the stack (default None, every step)
+
+    Return values:
+    result -- IntegrationResult, with the stack at the start and after every step in result.y as for solve_ivp,
+              or with output_times only the stack at each of them
+    """
+    if config is None:
+        config = SimulationConfig()
+    if step_size is None:
+        step_size = config.step_size
+    state = np.array(stack, dtype = float).reshape(-1, 6) #copy, so stack is left unchanged
+
+    def acceleration_function(time, positions):
+        return acceleration_assignment(positions, stack_layout, masses, force_backend, config)
+
+    if profiler is not None:
+        acceleration_function = profiler.timed("force_evaluation", acceleration_function)
+
+    if output_times is None:
+        number_of_steps = _number_of_steps(delta_time, step_size)
+        step = delta_time/number_of_steps
+        times = time + step*np.arange(number_of_steps + 1)
+        states = np.empty((state.size, number_of_steps + 1))
+        states[:, 0] = state.reshape(-1)
+        if profiler is not None:
+            profiler.count("steps", number_of_steps)
+        number_of_evaluations = _symplectic_steps(state, acceleration_function, time, step, number_of_steps, method, states)
+        return IntegrationResult(times, states, number_of_evaluations)
+
+    #only the stacks at output_times are kept, the steps between them are taken in place
+    times = np.asarray(output_times, dtype = float)
+    states = np.empty((state.size, len(times)))
+    number_of_evaluations = 0
+    for (i, output_time) in enumerate(times):
+        number_of_steps = _number_of_steps(output_time - time, step_size)
+        if profiler is not None:
+            profiler.count("steps", number_of_steps)
+        number_of_evaluations += _symplectic_steps(state, acceleration_function, time, (output_time - time)/number_of_steps, number_of_steps, method)
+        states[:, i] = state.reshape(-1)
+        time = output_time
+
+
+    return IntegrationResult(times, states, number_of_evaluations)
+
+
+
+
+
+
+
+def _number_of_steps(delta_time, step_size):
+    """Returns the smallest number of equal steps covering delta_time that are no longer than step_size"""
+    #rounding guards against delta_time/step_size being a whole number plus floating point error
+    return max(1, int(np.ceil(np.round(delta_time/step_size, 9))))
+
+
+def _symplectic_steps(state, acceleration_function, time, step, number_of_steps, method, states = None, step_callback = None):
+    """
+    Advances state in place by number_of_steps kick-drift-kick steps, see symplectic_integrate()
+
+    Keyword arguments:
+    state -- 2D array of floats, [x y z vx vy vz, ...] modified in place
+    acceleration_function -- function(float, float[][]) --> float[][], accelerations given the time and positions
+    time -- float, the time of state
+    step -- float, the step size
+    number_of_steps -- int
+    method -- string, a key of SYMPLECTIC_COEFFICIENTS
+    states -- 2D array of floats, if given column i + 1 is set to the flattened state after step i (default None)
+    step_callback -- function(float, float[]), if given called with the time and flattened state after each step (default None)
+
+    Return value:
+    number_of_evaluations -- int, number of calls to acceleration_function
+    """
+    (kicks, drifts) = SYMPLECTIC_COEFFICIENTS[method]
+    positions = state[:, 0:3]
+    velocities = state[:, 3:6]
+
+    accelerations = acceleration_function(time, positions)
+    number_of_evaluations = 1
+    for i in range(number_of_steps):
+        drift_time = time + i*step
+        for k in range(len(drifts)):
+            velocities += kicks[k]*step*accelerations
+            positions += drifts[k]*step*velocities
+            drift_time += drifts[k]*step
+            accelerations = acceleration_function(drift_time, positions)
+            number_of_evaluations += 1
+        velocities += kicks[-1]*step*accelerations
+        if states is not None:
+            states[:, i + 1] = state.reshape(-1)
+        if step_callback is not None:
+            step_callback(time + (i + 1)*step, state.reshape(-1))
+
+
+    return number_of_evaluations
+
+
+
+
+
+
+def block_integrate(stack, stack_layout, masses, time, delta_time, force_backend = "direct", config = None, profiler = None, output_times = None):
     """
-    Takes arguments and passes them to scipy.integrate.solve_ivp()
+    Integrates the system with the hierarchical block timestep integrator of timestep_functions.py, in which each test
+    mass takes steps suited to its own orbit, so the few test masses in a close encounter don't slow the rest
 
     Keyword arguments:
     stack -- array of floats, see stacker() method for more information
-    stack_info -- array of strings, contains information about what the values in stack correspond to
+    stack_layout -- StackLayout, contains information about what the values in stack correspond to
     masses -- array of floats, masses of each of the massive_objects
     time -- float, the start time from which the system should be solved
     delta_time --  float, the interval over which the system should be solved
+    force_backend -- string, a key of FORCE_BACKENDS (default "direct")
+    config -- SimulationConfig, gives the block_maximum_step, block_maximum_level and block_accuracy (default None, the values in global_constants.py)
+    profiler -- Profiler, counts and times the force evaluations, the steps and the test masses in them (default None)
+    output_times -- array of floats, increasing times after time, up to time + delta_time, at which to keep the stack (default None, the end of every block)
 
     Return values:
-    new_stack -- array of floats, the stack at a later time having been integrated
+    result -- IntegrationResult, with the stack at the start and at the end of every block in result.y, or with output_times only the stack at each of them
     """
+    if config is None:
+        config = SimulationConfig()
+    state = np.array(stack, dtype = float).reshape(-1, 6) #copy, so stack is left unchanged
+    acceleration_functions = FORCE_BACKENDS[force_backend]
+    if profiler is not None:
+        acceleration_functions = tuple(profiler.timed("force_evaluation", function) for function in acceleration_functions)
+    integrator = ts.BlockTimestepIntegrator(state, stack_layout.number_of_massive_objects, masses, time, acceleration_functions, config, profiler = profiler)
+
+    if output_times is None:
+        number_of_blocks = _number_of_steps(delta_time, config.block_maximum_step)
+        times = time + delta_time*np.arange(number_of_blocks + 1)/number_of_blocks
+        states = np.empty((state.size, number_of_blocks + 1))
+        states[:, 0] = state.reshape(-1)
+        (first_column, output_times) = (1, times[1:])
+    else:
+        times = np.asarray(output_times, dtype = float)
+        states = np.empty((state.size, len(times)))
+        first_column = 0
+    for (i, output_time) in enumerate(output_times):
+        integrator.advance(output_time)
+        states[:, first_column + i] = state.reshape(-1)
+
 
+    return IntegrationResult(times, states, integrator.number_of_evaluations)
 
-    result = syi.solve_ivp(derivative_assignment, (time, time + delta_time), stack, 'RK45', vectorized = False, args = (stack_info, masses), max_step = STEP_SIZE)
+
+
+
+
+
+def integrate(stack, stack_layout, masses, time, delta_time, derivatives = None, method = None, force_backend = None, config = None, profiler = None,
+              output_times = None):
+    """
+    Takes arguments and passes them to scipy.integrate.solve_ivp(), or to symplectic_integrate() for a symplectic method,
+    or to block_integrate() for the "block" method
+
+    By default the stack after every step is returned, which for many test masses is far more memory than the
+    single stack usually wanted: pass output_times = [time + delta_time] to keep only the final stack.
+
+    Keyword arguments:
+    stack -- array of floats, see stacker() method for more information
+    stack_layout -- StackLayout, contains information about what the values in stack correspond to
+    masses -- array of floats, masses of each of the massive_objects
+    time -- float, the start time from which the system should be solved
+    delta_time --  float, the interval over which the system should be solved
+    derivatives -- string, "vectorized" or "loop", the right-hand side passed to solve_ivp (default None, config.derivatives)
+    method -- string, "leapfrog", "yoshida", "block" or any solve_ivp method (default None, config.integration_method)
+    force_backend -- string, a key of FORCE_BACKENDS, only "direct" is available with the "loop" derivatives (default None, config.force_backend)
+    config -- SimulationConfig, also gives the largest step allowed (default None, the values in global_constants.py)
+    profiler -- Profiler, counts and times the evaluations of the derivatives and the steps (default None)
+    output_times -- array of floats, increasing times after time, up to time + delta_time, at which to keep the stack,
+                    the t_eval of solve_ivp (default None, every step)
+
+    Return values:
+    result -- solve_ivp result or IntegrationResult, the stack at each step (or each of output_times) in result.y,
+              the last column at time + delta_time (or the last of output_times)
+    """
+    if config is None:
+        config = SimulationConfig()
+    (derivatives, method, force_backend) = _integrator_choice(derivatives, method, force_backend, config)
+    (derivative_function, arguments) = _derivative_arguments(derivatives, stack_layout, masses, force_backend, config)
+    if method in SYMPLECTIC_COEFFICIENTS:
+        return symplectic_integrate(stack, stack_layout, masses, time, delta_time, method, force_backend = force_backend, config = config, profiler = profiler,
+                                    output_times = output_times)
+    if method == "block":
+        return block_integrate(stack, stack_layout, masses, time, delta_time, force_backend, config, profiler, output_times)
+
+    if profiler is not None:
+        derivative_function = profiler.timed("rhs", derivative_function)
+    #with t_eval, solve_ivp keeps only the stacks at those times rather than at every step
+    result = _scipy_integrate().solve_ivp(derivative_function, (time, time + delta_time), stack, method, vectorized = False, args = arguments, max_step = config.step_size,
+                                          t_eval = output_times)
+    if profiler is not None:
+        if method in SNAPSHOT_SOLVERS:
+            #two evaluations start the solver, then each attempt at a step takes n_stages, any more were spent on rejected attempts
+            attempts = (result.nfev - 2)//getattr(_scipy_integrate(), method).n_stages
+            if output_times is None:
+                profiler.count("steps", len(result.t) - 1)
+                profiler.count("rejected_steps", max(0, attempts - (len(result.t) - 1)))
+            else:
+                profiler.count("step_attempts", attempts)
+        else:
+            profiler.count("steps", len(result.t) - 1)
     
     
     return result
@@ -329,4 +732,401 @@ def integrate(stack, stack_info, masses, time, delta_time):
 
 
 
-    
\ No newline at end of file
+
+def _integrator_choice(derivatives, method, force_backend, config):
+    """Returns derivatives, method and force_backend, with those that are None taken from config"""
+    return (config.derivatives if derivatives is None else derivatives,
+            config.integration_method if method is None else method,
+            config.force_backend if force_backend is None else force_backend)
+
+
+def _derivative_arguments(derivatives, stack_layout, masses, force_backend, config):
+    """Checks the choice of right-hand side and force backend, returns the right-hand side and the extra arguments it takes"""
+    if force_backend not in FORCE_BACKENDS:
+        raise ValueError("force_backend must be one of " + str(list(FORCE_BACKENDS)) + ", not " + str(force_backend))
+    if derivatives not in DERIVATIVE_FUNCTIONS:
+        raise ValueError("derivatives must be one of " + str(list(DERIVATIVE_FUNCTIONS)) + ", not " + str(derivatives))
+
+    if derivatives == "loop":
+        if force_backend != "direct":
+            raise ValueError("the loop derivatives only support the direct force_backend")
+        return (derivative_assignment, (stack_layout, masses, config))
+    return (vectorized_derivative_assignment, (stack_layout, masses, force_backend, config))
+
+
+
+
+
+
+#solve_ivp methods whose state can be saved and restored exactly by integrate_snapshots(), the names of their classes in scipy.integrate
+SNAPSHOT_SOLVERS = ("RK23", "RK45", "DOP853")
+
+#every method integrate_snapshots() can run, so the integration methods of run_main.py and the sweeps
+SNAPSHOT_METHODS = tuple(SYMPLECTIC_COEFFICIENTS) + ("block",) + SNAPSHOT_SOLVERS
+
+
+def integrate_snapshots(stack, stack_layout, masses, time, snapshot_times, derivatives = None, method = None,
+                        force_backend = None, integrator_state = None, config = None, step_callback = None, profiler = None):
+    """
+    Integrates the system once across all of snapshot_times, yielding the stack at each of them in turn.
+
+    Unlike calling integrate() once per snapshot, the integrator is only started once, so it keeps its step size
+    between snapshots. Stacks at snapshot times falling inside a step come from the dense output of the step.
+    Nothing is written to the Mass objects, pass the yielded stack to destacker() when they are needed.
+    Only the current step is held, so the memory used doesn't grow with the number of steps or snapshots.
+    With config.parallel the test masses are integrated as a restricted N-body problem between snapshots on
+    config.number_of_workers processes, see parallel_functions.integrate_parallel(). derivatives and force_backend
+    are then not used, and step_callback is only called at the snapshots.
+
+    The yielded integrator_state is enough to restart the integrator exactly where it was: pass it back
+    (with the remaining snapshot_times) to continue a run with the same results as if it had not stopped.
+
+    Keyword arguments:
+    stack -- array of floats, see stacker() method for more information
+    stack_layout -- StackLayout, contains information about what the values in stack correspond to
+    masses -- array of floats, masses of each of the massive_objects
+    time -- float, the time of stack
+    snapshot_times -- array of floats, increasing times after time at which to yield the stack
+    derivatives -- string, "vectorized" or "loop" (default None, config.derivatives)
+    method -- string, "leapfrog", "yoshida", "block" or one of SNAPSHOT_SOLVERS (default None, config.integration_method)
+    force_backend -- string, a key of FORCE_BACKENDS (default None, config.force_backend)
+    integrator_state -- dict, an integrator_state yielded earlier to continue from, time and stack are then ignored (default None)
+    config -- SimulationConfig, also gives the largest step allowed (default None, the values in global_constants.py)
+    step_callback -- function(float, float[]), called with the time and stack at the end of every step, e.g. to check
+                     conservation with diagnostic_functions.ConservationLog.record() (default None)
+    profiler -- Profiler, counts and times the evaluations of the derivatives, the steps and the rejected steps (default None)
+
+    Yield values:
+    snapshot_time -- float, the next of snapshot_times
+    snapshot_stack -- array of floats, the stack at snapshot_time
+    integrator_state -- dict of the time, stack, step_size and next_step_size needed to restart the integrator
+    """
+    if config is None:
+        config = SimulationConfig()
+    (derivatives, method, force_backend) = _integrator_choice(derivatives, method, force_backend, config)
+    (derivative_function, arguments) = _derivative_arguments(derivatives, stack_layout, masses, force_backend, config)
+    step_size = config.step_size
+    snapshot_times = np.asarray(snapshot_times, dtype = float)
+
+    if config.parallel:
+        #imported here, as it starts worker processes and isn't needed by the other integrators
+        import parallel_functions
+        if method == "block":
+            raise ValueError("the block method can't be run in parallel, use leapfrog, yoshida or one of " + str(list(SNAPSHOT_SOLVERS)))
+        if integrator_state is not None:
+            (time, stack) = (integrator_state["time"], integrator_state["stack"])
+        stack = np.array(stack, dtype = float)
+        for snapshot_time in snapshot_times:
+            result = parallel_functions.integrate_parallel(stack, stack_layout, masses, time, snapshot_time - time, method, config.parallel_chunk_size,
+                                                           config.number_of_workers, config)
+            if profiler is not None:
+                profiler.count("rhs_calls", result.nfev)
+            (time, stack) = (snapshot_time, result.y[:, -1])
+            if step_callback is not None:
+                step_callback(time, stack)
+            snapshot_stack = stack.copy()
+            yield (snapshot_time, snapshot_stack, {"time": snapshot_time, "stack": snapshot_stack, "step_size": step_size, "next_step_size": step_size})
+        return
+
+    if method in SYMPLECTIC_COEFFICIENTS:
+        if integrator_state is not None:
+            (time, stack) = (integrator_state["time"], integrator_state["stack"])
+        state = np.array(stack, dtype = float).reshape(-1, 6)
+
+        def acceleration_function(time, positions):
+            return acceleration_assignment(positions, stack_layout, masses, force_backend, config)
+
+        if profiler is not None:
+            acceleration_function = profiler.timed("force_evaluation", acceleration_function)
+        for snapshot_time in snapshot_times:
+            number_of_steps = _number_of_steps(snapshot_time - time, step_size)
+            if profiler is not None:
+                profiler.count("steps", number_of_steps)
+            _symplectic_steps(state, acceleration_function, time, (snapshot_time - time)/number_of_steps, number_of_steps, method,
+                              step_callback = step_callback)
+            time = snapshot_time
+            snapshot_stack = state.reshape(-1).copy()
+            yield (snapshot_time, snapshot_stack, {"time": snapshot_time, "stack": snapshot_stack, "step_size": step_size, "next_step_size": step_size})
+        return
+
+    if method == "block":
+        #every block starts afresh from the state at its start, so the state at a snapshot is all that is needed to restart
+        if integrator_state is not None:
+            (time, stack) = (integrator_state["time"], integrator_state["stack"])
+        state = np.array(stack, dtype = float).reshape(-1, 6)
+        acceleration_functions = FORCE_BACKENDS[force_backend]
+        if profiler is not None:
+            acceleration_functions = tuple(profiler.timed("force_evaluation", function) for function in acceleration_functions)
+        integrator = ts.BlockTimestepIntegrator(state, stack_layout.number_of_massive_objects, masses, time, acceleration_functions, config,
+                                                step_callback, profiler)
+        for snapshot_time in snapshot_times:
+            integrator.advance(snapshot_time)
+            snapshot_stack = state.reshape(-1).copy()
+            yield (snapshot_time, snapshot_stack, {"time": snapshot_time, "stack": snapshot_stack, "step_size": config.block_maximum_step,
+                                                   "next_step_size": config.block_maximum_step})
+        return
+
+    if method not in SNAPSHOT_SOLVERS:
+        raise ValueError("method must be one of " + str(list(SNAPSHOT_METHODS)) + ", not " + str(method))
+
+    if profiler is not None:
+        derivative_function = profiler.timed("rhs", derivative_function)
+
+    def fun(time, stack):
+        return derivative_function(time, stack, *arguments)
+
+    solver_class = getattr(_scipy_integrate(), method)
+    #the solver keeps its starting stack as y_old, so it is given a copy, the stack may be the storage of the objects,
+    #which destacker() overwrites between snapshots
+    if integrator_state is None:
+        solver = solver_class(fun, time, np.array(stack, dtype = float), snapshot_times[-1], max_step = step_size)
+        step_taken = False
+    else:
+        #retake the step that was in progress with the same size, then carry on with the step size that followed it
+        solver = solver_class(fun, integrator_state["time"], np.array(integrator_state["stack"], dtype = float), snapshot_times[-1],
+                              max_step = step_size, first_step = integrator_state["step_size"])
+        _solver_step(solver, profiler)
+        solver.h_abs = integrator_state["next_step_size"]
+        step_taken = True
+        if step_callback is not None:
+            step_callback(solver.t, solver.y)
+
+    next_snapshot = 0
+    while next_snapshot < len(snapshot_times):
+        if not step_taken:
+            message = _solver_step(solver, profiler)
+            if solver.status == "failed":
+                raise RuntimeError("integration failed at time " + str(solver.t) + ": " + str(message))
+            if step_callback is not None:
+                step_callback(solver.t, solver.y)
+        step_taken = False
+
+        dense_output = None
+        while next_snapshot < len(snapshot_times) and snapshot_times[next_snapshot] <= solver.t:
+            snapshot_time = snapshot_times[next_snapshot]
+            if snapshot_time == solver.t:
+                snapshot_stack = solver.y.copy()
+            else:
+                if dense_output is None:
+                    dense_output = solver.dense_output()
+                snapshot_stack = dense_output(snapshot_time)
+            integrator_state = {"time": solver.t_old, "stack": solver.y_old.copy(), "step_size": solver.t - solver.t_old, "next_step_size": solver.h_abs}
+            yield (snapshot_time, snapshot_stack, integrator_state)
+            next_snapshot += 1
+
+
+    return None
+
+
+def _solver_step(solver, profiler):
+    """Takes a step of a solve_ivp solver, counting it and its rejected attempts in profiler if it isn't None"""
+    if profiler is None:
+        return solver.step()
+
+    calls = profiler.counters.get("rhs_calls", 0)
+    message = solver.step()
+    #each attempt at a step evaluates the derivatives n_stages times, so any more were spent on rejected attempts
+    attempts = (profiler.counters.get("rhs_calls", 0) - calls)//solver.n_stages
+    profiler.count("steps")
+    profiler.count("rejected_steps", max(0, attempts - 1))
+
+    return message
+
+
+
+
+
+
+
+def test_mass_derivative_assignment(time, test_mass_stack, host_positions, masses, config = None):
+    """
+    Create and return the derivatives of a stack holding only test masses, moving in the field of massive objects on given paths
+
+    Keyword arguments:
+    time -- float, time at which derivatives are to be evaluated
+    test_mass_stack -- array of floats, [x y z vx vy vz] for each test mass in turn
+    host_positions -- function(float) --> float[][], the positions of the massive objects at a time
+    masses -- array of floats, masses of each of the massive_objects
+    config -- SimulationConfig (default None, the values in global_constants.py)
+
+    Return values:
+    derivative_stack -- array of floats, of the derivatives to be assigned at time
+    """
+    state = np.reshape(test_mass_stack, (-1, 6))
+    derivative_state = np.empty_like(state)
+    derivative_state[:, 0:3] = state[:, 3:6]
+    derivative_state[:, 3:6] = test_mass_accelerations(state[:, 0:3], host_positions(time), masses, config)
+
+
+    return derivative_state.reshape(-1)
+
+
+
+
+
+
+def integrate_massive_objects(massive_object_stack, masses, time, delta_time, rtol = 1e-10, atol = 1e-12, config = None):
+    """
+    Integrates only the massive objects, accurately and with dense output, using solve_ivp's DOP853 method
+
+    Keyword arguments:
+    massive_object_stack -- array of floats, the massive object part of a stack, see stacker()
+    masses -- array of floats, masses of each of the massive_objects
+    time -- float, the start time from which the system should be solved
+    delta_time --  float, the interval over which the system should be solved
+    rtol -- float, relative tolerance passed to solve_ivp (default 1e-10)
+    atol -- float, absolute tolerance passed to solve_ivp (default 1e-12)
+    config -- SimulationConfig, also gives the largest step allowed (default None, the values in global_constants.py)
+
+    Return values:
+    result -- solve_ivp result, result.sol(t) gives the massive object stack at any t in the interval
+    """
+    if config is None:
+        config = SimulationConfig()
+    stack_layout = StackLayout(len(masses), np.zeros(len(masses)))
+    result = _scipy_integrate().solve_ivp(vectorized_derivative_assignment, (time, time + delta_time), massive_object_stack, 'DOP853', args = (stack_layout, masses, "direct", config),
+                                          max_step = config.step_size, rtol = rtol, atol = atol, dense_output = True)
+
+
+    return result
+
+
+
+
+
+
+def propagate_test_masses(test_mass_state, host_positions, masses, time, delta_time, method = "RK45", chunk_size = None, step_size = None, config = None):
+    """
+    Advances test masses in the field of massive objects on given paths. The test masses don't affect each
+    other, so they are integrated independently in chunks of chunk_size, with a separate solve for each chunk.
+    A float32 test_mass_state stays float32: the symplectic methods step it in float32, while solve_ivp works
+    in float64 on one chunk at a time.
+
+    Keyword arguments:
+    test_mass_state -- 2D array of floats, [x y z vx vy vz, ...] one row per test mass
+    host_positions -- function(float) --> float[][], the positions of the massive objects at a time
+    masses -- array of floats, masses of each of the massive_objects
+    time -- float, the start time from which the test masses should be solved
+    delta_time --  float, the interval over which the test masses should be solved
+    method -- string, "leapfrog", "yoshida" or any solve_ivp method (default "RK45")
+    chunk_size -- int, number of test masses integrated together (default None, all of them)
+    step_size -- float, the largest step allowed (default None, config.step_size)
+    config -- SimulationConfig (default None, the values in global_constants.py)
+
+    Return values:
+    new_test_mass_state -- 2D array of floats, test_mass_state at time + delta_time, in the same precision
+    number_of_evaluations -- int, total number of evaluations of the accelerations
+    """
+    if config is None:
+        config = SimulationConfig()
+    if step_size is None:
+        step_size = config.step_size
+    new_test_mass_state = np.array(test_mass_state, dtype = _precision(np.asarray(test_mass_state)))
+    number_of_test_masses = len(new_test_mass_state)
+    if chunk_size is None:
+        chunk_size = max(1, number_of_test_masses)
+
+    number_of_evaluations = 0
+    for start in range(0, number_of_test_masses, chunk_size):
+        chunk = new_test_mass_state[start:start + chunk_size]
+        if method in SYMPLECTIC_COEFFICIENTS:
+            number_of_steps = _number_of_steps(delta_time, step_size)
+
+            def acceleration_function(time, positions):
+                return test_mass_accelerations(positions, host_positions(time), masses, config)
+
+            number_of_evaluations += _symplectic_steps(chunk, acceleration_function, time, delta_time/number_of_steps, number_of_steps, method)
+        else:
+            result = _scipy_integrate().solve_ivp(test_mass_derivative_assignment, (time, time + delta_time), chunk.reshape(-1), method, args = (host_positions, masses, config),
+                                                  max_step = step_size, t_eval = [time + delta_time])
+            chunk[:] = result.y[:, -1].reshape(-1, 6)
+            number_of_evaluations += result.nfev
+
+
+    return (new_test_mass_state, number_of_evaluations)
+
+
+
+
+
+
+def integrate_restricted(stack, stack_layout, masses, time, delta_time, method = "RK45", chunk_size = None, config = None):
+    """
+    Integrates the system as a restricted N-body problem. The massive objects are integrated first with
+    integrate_massive_objects(), then the test masses are advanced along the resulting paths with propagate_test_masses().
+
+    Keyword arguments:
+    stack -- array of floats, see stacker() method for more information
+    stack_layout -- StackLayout, contains information about what the values in stack correspond to
+    masses -- array of floats, masses of each of the massive_objects
+    time -- float, the start time from which the system should be solved
+    delta_time --  float, the interval over which the system should be solved
+    method -- string, method used for the test masses, "leapfrog", "yoshida" or any solve_ivp method (default "RK45")
+    chunk_size -- int, number of test masses integrated together (default None, all of them)
+    config -- SimulationConfig (default None, the values in global_constants.py)
+
+    Return values:
+    result -- IntegrationResult, result.y has a single column, the stack at time + delta_time
+    """
+    if config is None:
+        config = SimulationConfig()
+    stack = np.asarray(stack, dtype = float)
+    number_of_massive_objects = stack_layout.number_of_massive_objects
+    new_stack = np.empty_like(stack)
+
+    massive_object_result = integrate_massive_objects(stack[stack_layout.massive_object_slice], masses, time, delta_time, config = config)
+    new_stack[stack_layout.massive_object_slice] = massive_object_result.y[:, -1]
+
+    def host_positions(time):
+        return np.reshape(massive_object_result.sol(time), (number_of_massive_objects, 6))[:, 0:3]
+
+    (new_test_mass_state, number_of_evaluations) = propagate_test_masses(stack_layout.test_mass_state(stack), host_positions, masses, time, delta_time, method, chunk_size, config = config)
+    stack_layout.test_mass_state(new_stack)[:] = new_test_mass_state
+
+
+    return IntegrationResult(np.array([time + delta_time]), new_stack[:, np.newaxis], massive_object_result.nfev + number_of_evaluations)
+
+
+
+
+
+
+def integrate_mixed_precision(massive_objects, time, delta_time, method = "leapfrog", chunk_size = None, config = None):
+    """
+    Integrates massive_objects in place as a restricted N-body problem, like integrate_restricted(), without putting
+    the test masses into a stack. The massive objects are integrated in float64, and the test masses of each are
+    advanced in the precision of its ParticleStore, so with TEST_MASS_DTYPE = "float32" they take half the memory
+    of a stack. See diagnostic_functions.precision_error() for how far this moves them from a float64 run.
+
+    Keyword arguments:
+    massive_objects -- array of class Mass
+    time -- float, the start time from which the system should be solved
+    delta_time --  float, the interval over which the system should be solved
+    method -- string, method used for the test masses, "leapfrog", "yoshida" or any solve_ivp method (default "leapfrog")
+    chunk_size -- int, number of test masses integrated together (default None, all of those of a massive object)
+    config -- SimulationConfig (default None, the values in global_constants.py)
+
+    Return value:
+    number_of_evaluations -- int, total number of evaluations of the accelerations
+    """
+    if config is None:
+        config = SimulationConfig()
+    masses = [massive_object.mass for massive_object in massive_objects]
+    number_of_massive_objects = len(massive_objects)
+    massive_object_stack = np.concatenate([np.asarray(massive_object.state, dtype = float) for massive_object in massive_objects])
+
+    massive_object_result = integrate_massive_objects(massive_object_stack, masses, time, delta_time, config = config)
+
+    def host_positions(time):
+        return np.reshape(massive_object_result.sol(time), (number_of_massive_objects, 6))[:, 0:3]
+
+    number_of_evaluations = massive_object_result.nfev
+    for (i, massive_object) in enumerate(massive_objects):
+        (new_test_mass_state, evaluations) = propagate_test_masses(massive_object.test_masses.state, host_positions, masses, time, delta_time,
+                                                                   method, chunk_size, config = config)
+        massive_object.test_masses.state[:] = new_test_mass_state
+        massive_object.state[:] = massive_object_result.y[6*i:6*(i + 1), -1]
+        number_of_evaluations += evaluations
+
+
+    return number_of_evaluations
@@ -0,0 +1,356 @@
+import os
+import csv
+import numpy as np
+import core_functions as cf
+from core_classes import Mass, ParticleStore, SimulationConfig
+"""
+Conserved quantities of a system, found with array operations on the stack so they are cheap enough to
+check after every step of the integrator.
+
+For the massive objects the total kinetic and potential energy, linear momentum and angular momentum (about the
+origin) are found; these are conserved by the exact equations of motion. The test masses have no mass, so their
+quantities are per unit mass, summed over every test mass, with the potential due to every massive object. They are
+only conserved while the massive objects are fixed, but their drift still shows the error of the integrator.
+
+The drift of each quantity is relative to its value at the start, divided by a scale that doesn't vanish when the
+quantity itself is zero (the kinetic plus the magnitude of the potential energy, and the sums of the magnitudes of the
+momenta), so a system at rest still has a meaningful drift.
+
+Methods:
+
+    massive_object_quantities(float[][], float[], float) --> dict (No side-effects)
+
+    test_mass_quantities(float[][], float[][], float[], float) --> dict (No side-effects)
+
+    conserved_quantities(float[], StackLayout, float[], SimulationConfig) --> dict (No side-effects)
+
+    relative_drift(dict, dict) --> dict (No side-effects)
+
+    precision_error(Mass[], float, float, string, int, SimulationConfig) --> dict (No side-effects)
+
+"""
+
+#quantities of the massive objects and of the test masses that are checked for drift
+CONSERVED_QUANTITIES = ["massive_object_energy", "massive_object_momentum", "massive_object_angular_momentum",
+                        "test_mass_energy", "test_mass_momentum", "test_mass_angular_momentum"]
+
+
+
+
+
+def _quantities(positions, velocities, weights, potential_energy, absolute_potential_energy):
+    """Returns the dict of quantities of objects with the given weights (masses, or 1 for test masses)"""
+    speeds_squared = np.einsum("ij,ij->i", velocities, velocities)
+    kinetic_energy = 0.5*np.dot(weights, speeds_squared)
+    momenta = weights[:, np.newaxis]*velocities
+    #r x p written out, as np.cross is several times slower for arrays of vectors
+    angular_momenta = np.empty_like(momenta)
+    angular_momenta[:, 0] = positions[:, 1]*momenta[:, 2] - positions[:, 2]*momenta[:, 1]
+    angular_momenta[:, 1] = positions[:, 2]*momenta[:, 0] - positions[:, 0]*momenta[:, 2]
+    angular_momenta[:, 2] = positions[:, 0]*momenta[:, 1] - positions[:, 1]*momenta[:, 0]
+    return {"kinetic_energy": float(kinetic_energy),
+            "potential_energy": float(potential_energy),
+            "energy": float(kinetic_energy + potential_energy),
+            "energy_scale": float(kinetic_energy + absolute_potential_energy),
+            "momentum": momenta.sum(axis = 0),
+            "momentum_scale": float(np.dot(weights, np.sqrt(speeds_squared))),
+            "angular_momentum": angular_momenta.sum(axis = 0),
+            "angular_momentum_scale": float(np.sum(np.sqrt(np.einsum("ij,ij->i", angular_momenta, angular_momenta))))}
+
+
+def massive_object_quantities(massive_object_state, masses, gravitational_constant):
+    """
+    Finds the energy and momenta of the massive objects, counting the potential energy of each pair once
+
+    Keyword arguments:
+    massive_object_state -- 2D array of floats, [x y z vx vy vz] of each massive object
+    masses -- array of floats, masses of each of the massive_objects
+    gravitational_constant -- float
+
+    Return value:
+    -- dict, the kinetic_energy, potential_energy, energy, momentum and angular_momentum (and the scale of each of
+       the last three, see relative_drift())
+    """
+    massive_object_state = np.asarray(massive_object_state, dtype = float)
+    masses = np.asarray(masses, dtype = float)
+    positions = massive_object_state[:, 0:3]
+
+    (first, second) = np.triu_indices(len(masses), 1) #each pair once
+    distances = np.linalg.norm(positions[first] - positions[second], axis = 1)
+    potential_energy = -gravitational_constant*np.sum(masses[first]*masses[second]/distances)
+
+
+    return _quantities(positions, massive_object_state[:, 3:6], masses, potential_energy, abs(potential_energy))
+
+
+
+
+
+
+def test_mass_quantities(test_mass_state, massive_object_state, masses, gravitational_constant):
+    """
+    Finds the energy and momenta per unit mass of the test masses, summed over all of them, in the field of every massive object
+
+    Keyword arguments:
+    test_mass_state -- 2D array of floats, [x y z vx vy vz] of each test mass
+    massive_object_state -- 2D array of floats, [x y z vx vy vz] of each massive object
+    masses -- array of floats, masses of each of the massive_objects
+    gravitational_constant -- float
+
+    Return value:
+    -- dict, as massive_object_quantities()
+    """
+    test_mass_state = np.asarray(test_mass_state, dtype = float)
+    positions = test_mass_state[:, 0:3]
+
+    potential_energy = 0.0
+    #loop over the (few) massive objects, every test mass is handled at once
+    for i in range(len(masses)):
+        r_vectors = positions - massive_object_state[i, 0:3]
+        potential_energy -= gravitational_constant*masses[i]*np.sum(1/np.sqrt(np.einsum("ij,ij->i", r_vectors, r_vectors)))
+
+
+    return _quantities(positions, test_mass_state[:, 3:6], np.ones(len(test_mass_state)), potential_energy, abs(potential_energy))
+
+
+
+
+
+
+def conserved_quantities(stack, stack_layout, masses, config = None):
+    """
+    Finds the energy and momenta of the massive objects and of the test masses in a stack
+
+    Keyword arguments:
+    stack -- array of floats, see core_functions.stacker()
+    stack_layout -- StackLayout, contains information about what the values in stack correspond to
+    masses -- array of floats, masses of each of the massive_objects
+    config -- SimulationConfig, gives the gravitational_constant (default None, the values in global_constants.py)
+
+    Return value:
+    quantities -- dict, the quantities of massive_object_quantities() and test_mass_quantities(), with the names
+                  prefixed by "massive_object_" and "test_mass_", e.g. "test_mass_energy"
+    """
+    if config is None:
+        config = SimulationConfig()
+    massive_object_state = stack_layout.massive_object_state(stack)
+
+    quantities = {}
+    for (name, value) in massive_object_quantities(massive_object_state, masses, config.gravitational_constant).items():
+        quantities["massive_object_" + name] = value
+    test_mass_state = stack_layout.test_mass_state(stack)
+    for (name, value) in test_mass_quantities(test_mass_state, massive_object_state, masses, config.gravitational_constant).items():
+        quantities["test_mass_" + name] = value
+
+
+    return quantities
+
+
+
+
+
+
+def relative_drift(quantities, initial_quantities):
+    """
+    Finds how far each quantity in CONSERVED_QUANTITIES has moved from its initial value
+
+    Keyword arguments:
+    quantities -- dict, see conserved_quantities()
+    initial_quantities -- dict, conserved_quantities() at the start
+
+    Return value:
+    drift -- dict, for each quantity the magnitude of its change divided by its initial scale, 0 if the scale is 0
+    """
+    drift = {}
+    for name in CONSERVED_QUANTITIES:
+        change = np.linalg.norm(np.asarray(quantities[name]) - np.asarray(initial_quantities[name]))
+        scale = initial_quantities[name + "_scale"]
+        drift[name] = float(change/scale) if scale > 0 else 0.0
+
+    return drift
+
+
+
+
+
+
+def precision_error(massive_objects, time, delta_time, method = "leapfrog", sample_size = 1000, config = None):
+    """
+    Finds how far test masses integrated in float32 move from the same test masses integrated in float64, by
+    integrating a sample of the test masses of massive_objects both ways with core_functions.integrate_mixed_precision()
+
+    Keyword arguments:
+    massive_objects -- array of class Mass, left unchanged
+    time -- float, the start time
+    delta_time -- float, the interval over which to compare, e.g. the time between snapshots
+    method -- string, method used for the test masses (default "leapfrog")
+    sample_size -- int, the most test masses of each massive object that are compared, spread evenly through them (default 1000)
+    config -- SimulationConfig (default None, the values in global_constants.py)
+
+    Return value:
+    error -- dict of:
+        "maximum_position_error", "median_position_error" -- float, distance between the float32 and float64 positions
+        "maximum_velocity_error" -- float, difference between the float32 and float64 velocities
+        "rounding_error" -- float, the error of storing the largest position in float32, the least error there can be
+    """
+    if config is None:
+        config = SimulationConfig()
+
+    runs = {}
+    for dtype in (np.float32, np.float64):
+        runs[dtype] = []
+        for massive_object in massive_objects:
+            copy = Mass(massive_object.position, massive_object.velocity, massive_object.mass)
+            step = max(1, int(np.ceil(len(massive_object.test_masses)/sample_size)))
+            sample = np.asarray(massive_object.test_masses.state)[::step]
+            copy.test_masses = ParticleStore.from_arrays(sample[:, 0:3], sample[:, 3:6], dtype)
+            runs[dtype].append(copy)
+        cf.integrate_mixed_precision(runs[dtype], time, delta_time, method, config = config)
+
+    single = np.concatenate([np.empty((0, 6))] + [np.asarray(copy.test_masses.state, dtype = float) for copy in runs[np.float32]])
+    double = np.concatenate([np.empty((0, 6))] + [copy.test_masses.state for copy in runs[np.float64]])
+    position_errors = np.sqrt(np.einsum("ij,ij->i", single[:, 0:3] - double[:, 0:3], single[:, 0:3] - double[:, 0:3]))
+    velocity_errors = np.sqrt(np.einsum("ij,ij->i", single[:, 3:6] - double[:, 3:6], single[:, 3:6] - double[:, 3:6]))
+    largest_position = float(np.max(np.abs(double[:, 0:3]))) if len(double) > 0 else 0.0
+
+
+    return {"maximum_position_error": float(np.max(position_errors, initial = 0)),
+            "median_position_error": float(np.median(position_errors)) if len(position_errors) > 0 else 0.0,
+            "maximum_velocity_error": float(np.max(velocity_errors, initial = 0)),
+            "rounding_error": float(np.finfo(np.float32).eps)*largest_position}
+
+
+
+
+
+
+class ConservationLog:
+    """
+    Class writing the conserved quantities, and their drift from the first record, to a CSV file as a run goes.
+    Each row is written and flushed straight away, so the log is complete up to the last step if the run stops.
+
+    Attributes
+    ---------
+    file_name : string
+        the CSV file, with a column for the time, each component of CONSERVED_QUANTITIES and the drift of each
+    initial_quantities : dict
+        the quantities of the first record, that the drift is relative to
+    last_drift : dict
+        the drift of the last record, see relative_drift()
+    last_time : float
+        the time of the last row of the log, None if it has none
+
+    Methods
+    ------
+    __init__(string, StackLayout, float[], SimulationConfig, float) --> None (Side-effects: opens the log file)
+
+    record(float, float[]) --> dict (Side-effects: writes a row of the log)
+
+    close() --> None (Side-effects: closes the log file)
+    """
+
+
+    def __init__(self, file_name, stack_layout, masses, config = None, resume_time = None):
+        """
+        Keyword arguments:
+        file_name -- string, the CSV file
+        stack_layout -- StackLayout, of the stacks that will be recorded
+        masses -- array of floats, masses of each of the massive_objects
+        config -- SimulationConfig (default None, the values in global_constants.py)
+        resume_time -- float, continue the existing log, dropping any rows after this time (default None, start a new log)
+        """
+
+        self.file_name = file_name
+        self.stack_layout = stack_layout
+        self.masses = masses
+        self.config = config
+        self.initial_quantities = None
+        self.last_drift = None
+        self.last_time = None
+
+        rows = []
+        if resume_time is not None and os.path.exists(file_name):
+            with open(file_name, newline = "") as log_file:
+                rows = [row for row in csv.DictReader(log_file) if float(row["time"]) <= resume_time]
+        self._log_file = open(file_name, "w", newline = "")
+        self._writer = csv.DictWriter(self._log_file, fieldnames = ConservationLog.columns())
+        self._writer.writeheader()
+        for row in rows:
+            self._writer.writerow(row)
+        if len(rows) > 0:
+            self.initial_quantities = ConservationLog._row_to_quantities(rows[0])
+            self.last_drift = {name: float(rows[-1]["drift_" + name]) for name in CONSERVED_QUANTITIES}
+            self.last_time = float(rows[-1]["time"])
+        self._log_file.flush()
+
+        return None
+
+    @staticmethod
+    def columns():
+        """Returns the names of the columns of the log"""
+        columns = ["time"]
+        for name in CONSERVED_QUANTITIES:
+            if name.endswith("energy"):
+                columns += [name, name + "_scale"]
+            else:
+                columns += [name + "_x", name + "_y", name + "_z", name + "_scale"]
+        return columns + ["drift_" + name for name in CONSERVED_QUANTITIES]
+
+    @staticmethod
+    def _row_to_quantities(row):
+        """Reads the quantities back from a row of the log"""
+        quantities = {}
+        for name in CONSERVED_QUANTITIES:
+            if name.endswith("energy"):
+                quantities[name] = float(row[name])
+            else:
+                quantities[name] = np.array([float(row[name + "_" + axis]) for axis in "xyz"])
+            quantities[name + "_scale"] = float(row[name + "_scale"])
+        return quantities
+
+    def record(self, time, stack):
+        """
+        Writes the quantities of stack and their drift as the next row of the log, can be passed as the
+        step_callback of core_functions.integrate_snapshots() to record every step. A stack no later than the
+        last row is skipped, as when a resumed solver retakes a step ending at the time of the checkpoint
+
+        Keyword arguments:
+        time -- float, time of stack
+        stack -- array of floats, see core_functions.stacker()
+
+        Return value:
+        drift -- dict, see relative_drift(), of the last row written
+        """
+        if self.last_time is not None and time <= self.last_time:
+            return self.last_drift
+        quantities = conserved_quantities(stack, self.stack_layout, self.masses, self.config)
+        if self.initial_quantities is None:
+            self.initial_quantities = quantities
+        self.last_drift = relative_drift(quantities, self.initial_quantities)
+
+        row = {"time": repr(float(time))}
+        for name in CONSERVED_QUANTITIES:
+            if name.endswith("energy"):
+                row[name] = repr(quantities[name])
+            else:
+                for (axis, component) in zip("xyz", quantities[name]):
+                    row[name + "_" + axis] = repr(float(component))
+            row[name + "_scale"] = repr(quantities[name + "_scale"])
+            row["drift_" + name] = repr(self.last_drift[name])
+        self._writer.writerow(row)
+        self._log_file.flush()
+        self.last_time = float(time)
+
+        return self.last_drift
+
+    def close(self):
+        """Closes the log file"""
+        self._log_file.close()
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        self.close()
+        return False
@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import numpy as np
+import accessory_functions as af
+"""
+On-disk cache of the discs of test masses made by accessory_functions.generate_disc(), so runs and sweeps with the
+same disc settings only generate it once.
+
+Each disc is saved relative to its host as one .npy file holding a 2D array of float64, with one row
+[x y z vx vy vz] per test mass. It is named by a hash of every argument of generate_disc(): the ring settings, the
+mass of the host, the orientation and the gravitational constant. The hash also covers DISC_FORMAT_VERSION, which is
+increased whenever generate_disc() changes, so discs generated the old way are never loaded. The host's position and
+velocity are not part of the hash. The disc is the same wherever the host is and however fast it moves, so they are
+added as an offset by the caller when the disc is loaded. Discs are loaded memory-mapped, so only the pages read when the offset is added
+are read from the disc.
+
+The cache is kept under a size budget by least recently used eviction. Loading a disc updates the modification time
+of its file, and after a disc is saved the files used longest ago are removed until the cache fits the budget.
+Files are written under a temporary name and then renamed, so processes sharing a cache never read a partly written disc.
+Temporary files older than ORPHAN_AGE were left by writers that were stopped, and are removed by the eviction.
+
+Methods:
+
+    disc_key(float, int, float, float, float, float, float, float) --> string (No side-effects)
+
+    load_disc(string, string) --> float[][] (Side-effects: marks the disc as used)
+
+    save_disc(string, string, float[][], int) --> None (Side-effects: writes a file in cache_directory, may remove others)
+
+    evict(string, int) --> int (Side-effects: removes files from cache_directory)
+
+    cached_disc(string, int, float, int, float, float, float, float, float, float) --> (float[][], float[][]) (Side-effects: may write the disc to the cache)
+
+"""
+
+#extension of the files of the cache, only these and temporary files are ever removed by evict()
+DISC_FILE_EXTENSION = ".npy"
+TEMPORARY_FILE_EXTENSION = ".tmp"
+
+#version of the discs made by accessory_functions.generate_disc(), part of every key, increase it when generate_disc() changes
+DISC_FORMAT_VERSION = 1
+
+#seconds after which a temporary file is taken to be left by a writer that was stopped, rather than one still writing
+ORPHAN_AGE = 3600
+
+
+
+
+def disc_key(mass, number_of_rings, ring_spacing, minimum_radius, number_of_masses_per_unit_radius, inclination = 0, node_angle = 0,
+             gravitational_constant = 1):
+    """Returns a string, a hash of the arguments of accessory_functions.generate_disc(), the same for discs that are the same"""
+    parameters = [mass, number_of_rings, ring_spacing, minimum_radius, number_of_masses_per_unit_radius, inclination, node_angle, gravitational_constant]
+    #floats so that e.g. a mass of 1 and of 1.0 share a disc
+    return hashlib.sha1(json.dumps([DISC_FORMAT_VERSION] + [float(parameter) for parameter in parameters]).encode()).hexdigest()
+
+
+
+
+
+
+def load_disc(cache_directory, key):
+    """
+    Loads a disc from the cache and marks it as the most recently used
+
+    Keyword arguments:
+    cache_directory -- string
+    key -- string, see disc_key()
+
+    Return value:
+    -- read-only memory-mapped 2D array of floats, [x y z vx vy vz] of each test mass relative to the host, None if the disc isn't cached
+    """
+    file_name = os.path.join(cache_directory, key + DISC_FILE_EXTENSION)
+    try:
+        state = np.load(file_name, mmap_mode = "r")
+        os.utime(file_name)
+    except (OSError, ValueError): #missing, or removed by another process since, or unreadable
+        return None
+    if state.ndim != 2 or state.shape[1] != 6:
+        return None
+
+
+    return state
+
+
+
+
+
+
+def save_disc(cache_directory, key, state, maximum_size):
+    """
+    Saves a disc in the cache, then evicts the least recently used discs until the cache is no larger than maximum_size
+
+    Keyword arguments:
+    cache_directory -- string, created if it doesn't exist
+    key -- string, see disc_key()
+    state -- 2D array of floats, [x y z vx vy vz] of each test mass relative to the host
+    maximum_size -- int, size budget of the cache in bytes
+    """
+    os.makedirs(cache_directory, exist_ok = True)
+    (file_descriptor, temporary_file_name) = tempfile.mkstemp(dir = cache_directory, suffix = TEMPORARY_FILE_EXTENSION)
+    try:
+        with os.fdopen(file_descriptor, "wb") as disc_file:
+            np.save(disc_file, np.asarray(state, dtype = float))
+        os.replace(temporary_file_name, os.path.join(cache_directory, key + DISC_FILE_EXTENSION))
+    except BaseException:
+        os.remove(temporary_file_name)
+        raise
+    evict(cache_directory, maximum_size)
+
+    return None
+
+
+
+
+
+
+def evict(cache_directory, maximum_size):
+    """
+    Removes the temporary files older than ORPHAN_AGE, then the least recently used discs until the files of the
+    cache take up no more than maximum_size
+
+    Keyword arguments:
+    cache_directory -- string
+    maximum_size -- int, size budget of the cache in bytes
+
+    Return value:
+    -- int, number of files removed
+    """
+    entries = []
+    now = time.time()
+    for entry in os.scandir(cache_directory):
+        if entry.name.endswith(DISC_FILE_EXTENSION) or entry.name.endswith(TEMPORARY_FILE_EXTENSION):
+            try:
+                information = entry.stat()
+            except OSError: #removed by another process
+                continue
+            #a temporary file still being written is left alone, and counts towards the size of the cache
+            orphan = entry.name.endswith(TEMPORARY_FILE_EXTENSION) and now - information.st_mtime > ORPHAN_AGE
+            entries.append((not orphan, information.st_mtime, information.st_size, entry.path))
+
+    total_size = sum(size for (kept, modification_time, size, path) in entries)
+    number_removed = 0
+    #orphans first, then the discs in order of last use
+    for (kept, modification_time, size, path) in sorted(entries):
+        if kept and (total_size <= maximum_size or path.endswith(TEMPORARY_FILE_EXTENSION)):
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError: #already removed by another process
+            pass
+        total_size -= size
+        number_removed += 1
+
+
+    return number_removed
+
+
+
+
+
+
+def cached_disc(cache_directory, maximum_size, mass, number_of_rings, ring_spacing, minimum_radius, number_of_masses_per_unit_radius,
+                inclination = 0, node_angle = 0, gravitational_constant = 1):
+    """
+    Loads the disc from the cache, or generates it with accessory_functions.generate_disc() and caches it
+
+    Keyword arguments:
+    cache_directory -- string, None to always generate the disc
+    maximum_size -- int, size budget of the cache in bytes
+    mass, number_of_rings, ring_spacing, minimum_radius, number_of_masses_per_unit_radius, inclination, node_angle, gravitational_constant --
+        see accessory_functions.generate_disc()
+
+    Return values:
+    positions -- 2D array of floats, [ x y z, ...] relative to the massive object, read-only if it was loaded from the cache
+    velocities -- 2D array of floats, [ vx vy vz, ...] relative to the massive object, read-only if it was loaded from the cache
+    """
+    disc_arguments = (mass, number_of_rings, ring_spacing, minimum_radius, number_of_masses_per_unit_radius, inclination, node_angle, gravitational_constant)
+    if cache_directory is None:
+        return af.generate_disc(*disc_arguments)
+
+    key = disc_key(*disc_arguments)
+    state = load_disc(cache_directory, key)
+    if state is not None:
+        return (state[:, 0:3], state[:, 3:6])
+
+    (positions, velocities) = af.generate_disc(*disc_arguments)
+    if len(positions) > 0: #an empty array can't be memory-mapped
+        save_disc(cache_directory, key, np.column_stack((positions, velocities)), maximum_size)
+
+
+    return (positions, velocities)
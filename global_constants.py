@@ -1,6 +1,9 @@
 import numpy as np
 """
 Contains global constants that are used throughout the program
+
+These are the defaults of core_classes.SimulationConfig, which has an attribute for each constant with
+its name in lower case. Pass a SimulationConfig to use different values without changing this file.
 """
 
 #Initial conditions:
@@ -16,9 +19,77 @@ DELTA_TIME = 5 #time between snapshots of system
 #Change to alter the scaling of the problem
 GRAVITATIONAL_CONSTANT = 1
 
+#Choice of integrator, see core_functions.integrate()
+INTEGRATION_METHOD = "RK45"
+DERIVATIVES = "vectorized"
+FORCE_BACKEND = "direct"
+
+#Block timesteps of the "block" integration method, see timestep_functions.py
+BLOCK_MAXIMUM_STEP = 1
+BLOCK_MAXIMUM_LEVEL = 8 #the smallest step is BLOCK_MAXIMUM_STEP/2**BLOCK_MAXIMUM_LEVEL
+BLOCK_ACCURACY = 0.03
+
+#With PARALLEL the test masses are integrated as a restricted N-body problem between snapshots, in chunks of
+#PARALLEL_CHUNK_SIZE shared between NUMBER_OF_WORKERS processes, see parallel_functions.py. The results only depend
+#on PARALLEL_CHUNK_SIZE, not on NUMBER_OF_WORKERS
+PARALLEL = False
+NUMBER_OF_WORKERS = 1
+PARALLEL_CHUNK_SIZE = 2048
+
 
 #For the creation of test masses around massive objects
 NUMBER_OF_MASSES_PER_UNIT_RADIUS = 10
 MINIMUM_RADIUS = 2
 RING_SPACING = 0.25
 NUMBER_OF_RINGS = 20
+#"float32" stores the test masses in half the memory, but only core_functions.integrate_mixed_precision() can integrate them,
+#stacker() (and so run_main.py and every integrator working on a stack) rejects them
+TEST_MASS_DTYPE = "float64"
+
+#Discs of test masses are saved in DISC_CACHE_DIRECTORY and loaded when the same disc is needed again, None (the default)
+#turns the cache off. The discs used longest ago are removed to keep the cache under DISC_CACHE_SIZE bytes, see disc_cache_functions.py
+DISC_CACHE_DIRECTORY = None
+DISC_CACHE_SIZE = 2**30
+
+
+
+#Test masses further than this from both galaxies are in the tidal tail, see analysis_functions.py
+TAIL_DISTANCE = 10
+
+
+
+#For the tree code force calculation, see tree_functions.py, the softening length is also used by the direct sum
+OPENING_ANGLE = 0.5
+SOFTENING_LENGTH = 0
+
+#For the particle-mesh force calculation, see mesh_functions.py. The FFTs are done on a grid MESH_PADDING times
+#larger per side, which with 2 or more stops the masses feeling periodic images of each other
+MESH_SIZE = 64
+MESH_PADDING = 2
+
+
+#Directory in which run_main.py stores the trajectory, see trajectory_functions.py
+TRAJECTORY_DIRECTORY = "trajectory"
+
+
+#Checkpoints of run_main.py, written every CHECKPOINT_INTERVAL snapshots, see checkpoint_functions.py
+CHECKPOINT_FILE = "checkpoint.npz"
+CHECKPOINT_INTERVAL = 1
+
+
+#Images of the snapshots, rendered in the background by RENDER_WORKERS processes, see plot_functions.SnapshotRenderer
+PLOT = True #False makes no images or plots in run_main.py, so matplotlib is never imported
+PLOT_DPI = 300
+PLOT_FORMAT = "jpg"
+RENDER_WORKERS = 1
+RENDER_QUEUE_SIZE = 4
+
+
+#Energy and momenta of run_main.py after every step and their drift, see diagnostic_functions.py, None to turn off
+CONSERVATION_LOG = "conservation_log.csv"
+
+
+#Counters and timers of each snapshot of run_main.py, and a trace of every timed call if PROFILE_TRACE_FILE isn't None, see profiling_functions.py
+PROFILE = False
+PROFILE_TRACE_FILE = None
+PROFILE_MEMORY = False #also finds the peak memory allocated in each snapshot, which slows the run
\ No newline at end of file
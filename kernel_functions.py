@@ -0,0 +1,135 @@
+import numpy as np
+try:
+    import numba
+except ImportError: #numba is optional, core_functions then uses its NumPy accelerations
+    numba = None
+from core_classes import SimulationConfig
+"""
+Compiled kernels for the direct sum accelerations, the "jit" force_backend of core_functions.
+
+The kernels loop over every pair of a target and a massive object, keeping the running acceleration of each target
+in registers, so apart from the returned array they allocate nothing, where the NumPy functions in core_functions
+make several temporary arrays the size of the targets on every call. When Numba is installed the kernels are
+compiled with numba.njit(parallel = True), sharing the targets between threads, and the "direct" backend
+uses them. Without Numba they are plain Python loops, still correct but far too slow to integrate with, so the
+"direct" backend uses the NumPy functions instead (see NUMBA_AVAILABLE); "numpy" and "jit" choose one or the other.
+
+Forces are softened with a Plummer softening length, a = G m r/(r^2 + softening^2)^(3/2), as in tree_functions.
+
+Methods:
+
+    jit_accelerations(float[][], float[], SimulationConfig) --> float[][] (No side-effects)
+
+    jit_test_mass_accelerations(float[][], float[][], float[], SimulationConfig) --> float[][] (No side-effects)
+
+"""
+
+#whether the kernels are compiled
+NUMBA_AVAILABLE = numba is not None
+
+if NUMBA_AVAILABLE:
+    prange = numba.prange
+    compile_kernel = numba.njit(parallel = True, cache = True)
+else:
+    prange = range
+    compile_kernel = lambda kernel: kernel
+
+
+
+
+
+def _massive_object_kernel(positions, masses, gravitational_constant, softening_squared, accelerations):
+    """Sets each row of accelerations to the acceleration of that massive object due to all the others"""
+    for i in prange(positions.shape[0]):
+        (acceleration_x, acceleration_y, acceleration_z) = (0.0, 0.0, 0.0)
+        for j in range(positions.shape[0]):
+            if j != i: #so the mass doesn't exert a force on itself
+                r_x = positions[j, 0] - positions[i, 0]
+                r_y = positions[j, 1] - positions[i, 1]
+                r_z = positions[j, 2] - positions[i, 2]
+                distance_squared = r_x*r_x + r_y*r_y + r_z*r_z + softening_squared
+                factor = gravitational_constant*masses[j]/(distance_squared*np.sqrt(distance_squared))
+                acceleration_x += factor*r_x
+                acceleration_y += factor*r_y
+                acceleration_z += factor*r_z
+        accelerations[i, 0] = acceleration_x
+        accelerations[i, 1] = acceleration_y
+        accelerations[i, 2] = acceleration_z
+
+
+def _test_mass_kernel(positions_of_test_masses, positions_of_massive_objects, masses, gravitational_constant, softening_squared, accelerations):
+    """Sets each row of accelerations to the acceleration of that test mass due to the massive objects"""
+    for i in prange(positions_of_test_masses.shape[0]):
+        (acceleration_x, acceleration_y, acceleration_z) = (0.0, 0.0, 0.0)
+        for j in range(positions_of_massive_objects.shape[0]):
+            r_x = positions_of_massive_objects[j, 0] - positions_of_test_masses[i, 0]
+            r_y = positions_of_massive_objects[j, 1] - positions_of_test_masses[i, 1]
+            r_z = positions_of_massive_objects[j, 2] - positions_of_test_masses[i, 2]
+            distance_squared = r_x*r_x + r_y*r_y + r_z*r_z + softening_squared
+            factor = gravitational_constant*masses[j]/(distance_squared*np.sqrt(distance_squared))
+            acceleration_x += factor*r_x
+            acceleration_y += factor*r_y
+            acceleration_z += factor*r_z
+        accelerations[i, 0] = acceleration_x
+        accelerations[i, 1] = acceleration_y
+        accelerations[i, 2] = acceleration_z
+
+
+_massive_object_kernel = compile_kernel(_massive_object_kernel)
+_test_mass_kernel = compile_kernel(_test_mass_kernel)
+
+
+
+
+
+
+def jit_accelerations(positions_of_massive_objects, masses, config = None):
+    """
+    Finds the accelerations of all the massive objects due to each other with the compiled kernel
+
+    Keyword arguments:
+    positions_of_massive_objects -- 2D array of floats, [ x y z, ...] positions of all the masses
+    masses -- array of floats, masses of each of the massive_objects
+    config -- SimulationConfig, gives the gravitational_constant and softening_length (default None, the values in global_constants.py)
+
+    Return values:
+    accelerations -- 2D array of floats, [ x y z, ...] the acceleration of each massive object
+    """
+    if config is None:
+        config = SimulationConfig()
+    positions_of_massive_objects = np.ascontiguousarray(positions_of_massive_objects, dtype = float)
+    accelerations = np.empty_like(positions_of_massive_objects)
+    _massive_object_kernel(positions_of_massive_objects, np.asarray(masses, dtype = float), float(config.gravitational_constant),
+                           float(config.softening_length)**2, accelerations)
+
+
+    return accelerations
+
+
+
+
+
+
+def jit_test_mass_accelerations(positions_of_test_masses, positions_of_massive_objects, masses, config = None):
+    """
+    Finds the accelerations of all the test masses due to the massive objects with the compiled kernel
+
+    Keyword arguments:
+    positions_of_test_masses -- 2D array of floats, [ x y z, ...] positions of all the test masses
+    positions_of_massive_objects -- 2D array of floats, [ x y z, ...] positions of all the masses
+    masses -- array of floats, masses of each of the massive_objects
+    config -- SimulationConfig, gives the gravitational_constant and softening_length (default None, the values in global_constants.py)
+
+    Return values:
+    accelerations -- 2D array of floats, [ x y z, ...] the acceleration of each test mass
+    """
+    if config is None:
+        config = SimulationConfig()
+    #the rows of the test masses in a stack are strided views, which the kernel reads in place
+    positions_of_test_masses = np.asarray(positions_of_test_masses, dtype = float)
+    accelerations = np.empty(positions_of_test_masses.shape)
+    _test_mass_kernel(positions_of_test_masses, np.ascontiguousarray(positions_of_massive_objects, dtype = float), np.asarray(masses, dtype = float),
+                      float(config.gravitational_constant), float(config.softening_length)**2, accelerations)
+
+
+    return accelerations
@@ -0,0 +1,182 @@
+import functools
+import numpy as np
+from core_classes import SimulationConfig
+"""
+Particle-mesh gravity solver, for systems of so many massive objects that even the tree code of tree_functions.py
+is too slow.
+
+The masses are spread onto a cubic grid of config.mesh_size points per side covering every object with the
+cloud-in-cell scheme (each mass is shared between the 8 grid points around it, in proportion to how near it is to
+each). The potential is the convolution of the grid masses with the Green's function -G/r, done with NumPy FFTs on a
+grid config.mesh_padding times larger per side, padded with zeros so that (with a padding of 2 or more) the masses
+see no periodic images of each other. The accelerations are the central differences of the potential, interpolated
+back to the objects with the same cloud-in-cell weights. Each evaluation then costs O(N + M log M) operations for
+N objects and M grid points, rather than O(N^2) for the direct sum.
+
+Forces closer than about two grid cells are smoothed out by the grid, so the mesh is suited to many objects spread
+over the grid, not to the few massive objects of a galaxy encounter. The Green's function is softened with
+config.softening_length, and where that is 0 the grid point at no separation uses a separation of half a cell.
+
+Methods:
+
+    cloud_in_cell_weights(float[][], float[], float, int) --> (int[][], float[][]) (No side-effects)
+
+    mesh_potential(float[][], float[], float[], float, SimulationConfig) --> float[][][] (No side-effects)
+
+    mesh_test_mass_accelerations(float[][], float[][], float[], SimulationConfig) --> float[][] (No side-effects)
+
+    mesh_accelerations(float[][], float[], SimulationConfig) --> float[][] (No side-effects)
+
+"""
+
+#grid cells left between the objects and the edge of the grid, so every object has a neighbour on each side for the differences
+MESH_MARGIN = 1
+
+
+
+
+
+def cloud_in_cell_weights(positions, origin, cell_size, mesh_size):
+    """
+    Finds the 8 grid points around each position and the cloud-in-cell weight of each
+
+    Keyword arguments:
+    positions -- 2D array of floats, [ x y z, ...] positions inside the grid
+    origin -- array of floats, position of grid point (0, 0, 0)
+    cell_size -- float, spacing of the grid points
+    mesh_size -- int, number of grid points per side
+
+    Return values:
+    indices -- 2D array of ints, the flattened index of each of the 8 grid points, one row per corner
+    weights -- 2D array of floats, the weight of each of the 8 grid points, summing to 1 for each position
+    """
+    grid_positions = (np.asarray(positions, dtype = float) - origin)/cell_size
+    lower = np.floor(grid_positions).astype(int)
+    fractions = grid_positions - lower
+
+    indices = np.empty((8, len(grid_positions)), dtype = int)
+    weights = np.empty((8, len(grid_positions)))
+    for corner in range(8):
+        offsets = np.array([(corner >> 2) & 1, (corner >> 1) & 1, corner & 1])
+        corner_points = lower + offsets
+        indices[corner] = (corner_points[:, 0]*mesh_size + corner_points[:, 1])*mesh_size + corner_points[:, 2]
+        weights[corner] = np.prod(np.where(offsets == 1, fractions, 1 - fractions), axis = 1)
+
+
+    return (indices, weights)
+
+
+@functools.lru_cache(maxsize = 4)
+def _greens_function_transform(padded_size, softening_in_cells):
+    """Returns the real FFT of -1/r on the padded grid, with r in cells and measured to the nearest periodic image"""
+    separations = np.minimum(np.arange(padded_size), padded_size - np.arange(padded_size))
+    distances_squared = (separations[:, np.newaxis, np.newaxis]**2 + separations[np.newaxis, :, np.newaxis]**2
+                         + separations[np.newaxis, np.newaxis, :]**2 + softening_in_cells**2).astype(float)
+    if softening_in_cells == 0:
+        distances_squared[0, 0, 0] = 0.25 #half a cell
+    return np.fft.rfftn(-1/np.sqrt(distances_squared))
+
+
+def mesh_potential(positions, masses, origin, cell_size, config = None):
+    """
+    Finds the gravitational potential on the padded grid due to the masses
+
+    Keyword arguments:
+    positions -- 2D array of floats, [ x y z, ...] positions of the masses, inside the grid
+    masses -- array of floats
+    origin -- array of floats, position of grid point (0, 0, 0)
+    cell_size -- float, spacing of the grid points
+    config -- SimulationConfig, gives the mesh_size, mesh_padding, gravitational_constant and softening_length (default None, the values in global_constants.py)
+
+    Return value:
+    potential -- 3D array of floats, the potential at each point of the padded grid, the first mesh_size along each side cover the masses
+    """
+    if config is None:
+        config = SimulationConfig()
+    if config.mesh_padding < 1:
+        raise ValueError("mesh_padding must be at least 1, not " + str(config.mesh_padding))
+    mesh_size = config.mesh_size
+    padded_size = int(np.ceil(config.mesh_padding*mesh_size))
+
+    (indices, weights) = cloud_in_cell_weights(positions, origin, cell_size, mesh_size)
+    grid_masses = np.bincount(indices.reshape(-1), (weights*np.asarray(masses, dtype = float)).reshape(-1), minlength = mesh_size**3)
+    padded_masses = np.zeros((padded_size, padded_size, padded_size))
+    padded_masses[:mesh_size, :mesh_size, :mesh_size] = grid_masses.reshape(mesh_size, mesh_size, mesh_size)
+
+    greens_function_transform = _greens_function_transform(padded_size, float(config.softening_length/cell_size))
+    potential = np.fft.irfftn(np.fft.rfftn(padded_masses)*greens_function_transform, padded_masses.shape)
+
+
+    return config.gravitational_constant*potential/cell_size
+
+
+
+
+
+
+def mesh_test_mass_accelerations(positions_of_test_masses, positions_of_massive_objects, masses, config = None):
+    """
+    Finds the accelerations of test masses due to the massive objects with the particle-mesh method
+
+    Keyword arguments:
+    positions_of_test_masses -- 2D array of floats, [ x y z, ...] positions of all the test masses
+    positions_of_massive_objects -- 2D array of floats, [ x y z, ...] positions of all the masses
+    masses -- array of floats, masses of each of the massive_objects
+    config -- SimulationConfig, gives the mesh_size, mesh_padding, gravitational_constant and softening_length (default None, the values in global_constants.py)
+
+    Return values:
+    accelerations -- 2D array of floats, [ x y z, ...] the acceleration of each test mass
+    """
+    if config is None:
+        config = SimulationConfig()
+    positions_of_test_masses = np.asarray(positions_of_test_masses, dtype = float)
+    positions_of_massive_objects = np.asarray(positions_of_massive_objects, dtype = float)
+    if len(positions_of_test_masses) == 0 or len(masses) == 0:
+        return np.zeros_like(positions_of_test_masses)
+
+    #the grid is the smallest cube holding every object with MESH_MARGIN cells to spare on each side
+    all_positions = np.concatenate((positions_of_test_masses, positions_of_massive_objects))
+    (lower, upper) = (np.min(all_positions, axis = 0), np.max(all_positions, axis = 0))
+    mesh_size = config.mesh_size
+    cell_size = max(np.max(upper - lower), np.finfo(float).tiny)/(mesh_size - 1 - 2*MESH_MARGIN)
+    origin = (lower + upper)/2 - cell_size*(mesh_size - 1)/2
+
+    potential = mesh_potential(positions_of_massive_objects, masses, origin, cell_size, config)
+    #central differences on the grid points, with the neighbours past each edge taken from the padding
+    padded_size = len(potential)
+    neighbours = np.arange(-1, mesh_size + 1) % padded_size
+    potential = potential[np.ix_(neighbours, neighbours, neighbours)]
+    grid_accelerations = np.empty((3, mesh_size**3))
+    grid_accelerations[0] = ((potential[:-2, 1:-1, 1:-1] - potential[2:, 1:-1, 1:-1])/(2*cell_size)).reshape(-1)
+    grid_accelerations[1] = ((potential[1:-1, :-2, 1:-1] - potential[1:-1, 2:, 1:-1])/(2*cell_size)).reshape(-1)
+    grid_accelerations[2] = ((potential[1:-1, 1:-1, :-2] - potential[1:-1, 1:-1, 2:])/(2*cell_size)).reshape(-1)
+
+    #interpolated back with the weights the masses were spread with, so an object exerts no net force on itself
+    (indices, weights) = cloud_in_cell_weights(positions_of_test_masses, origin, cell_size, mesh_size)
+    accelerations = np.zeros_like(positions_of_test_masses)
+    for axis in range(3):
+        accelerations[:, axis] = np.sum(weights*grid_accelerations[axis][indices], axis = 0)
+
+
+    return accelerations
+
+
+
+
+
+
+def mesh_accelerations(positions_of_massive_objects, masses, config = None):
+    """
+    Finds the accelerations of all the massive objects due to each other with the particle-mesh method.
+    Can be used in place of core_functions.massive_object_accelerations().
+
+    Keyword arguments:
+    positions_of_massive_objects -- 2D array of floats, [ x y z, ...] positions of all the masses
+    masses -- array of floats, masses of each of the massive_objects
+    config -- SimulationConfig (default None, the values in global_constants.py)
+
+    Return values:
+    accelerations -- 2D array of floats, [ x y z, ...] the acceleration of each massive object
+    """
+
+    return mesh_test_mass_accelerations(positions_of_massive_objects, positions_of_massive_objects, masses, config)
@@ -0,0 +1,213 @@
+import os
+import numpy as np
+import concurrent.futures
+from multiprocessing import shared_memory
+import core_functions as cf
+from core_classes import IntegrationResult, SimulationConfig
+"""
+Methods for advancing the test masses on several processes at once.
+
+Test masses don't affect each other, so once the paths of the massive objects are known each chunk of test
+masses can be integrated on its own. The sampled paths of the massive objects and the test mass states are
+put in shared memory, which the worker processes attach to instead of receiving pickled copies. Each worker
+integrates whole chunks in place, so the result only depends on chunk_size and not on the number of workers.
+
+Runs use it when config.parallel is set, with config.number_of_workers processes and chunks of config.parallel_chunk_size,
+see core_functions.integrate_snapshots(), which yields each snapshot for run_main.py to write back into the Mass objects.
+
+Methods:
+
+    sample_trajectory(OdeResult, int, float, float, int) --> (float[], float[][][]) (No side-effects)
+
+    integrate_parallel(float[], StackLayout, float[], float, float, string, int, int, SimulationConfig) --> IntegrationResult (No side-effects)
+
+"""
+
+
+
+
+
+class HermiteTrajectory:
+    """
+    Class giving the positions of the massive objects at any time, by cubic Hermite interpolation
+    between positions and velocities sampled at equally spaced times
+
+    Attributes
+    ---------
+    times : float[]
+        equally spaced sample times
+    states : float[][][]
+        [x y z vx vy vz] of each massive object at each sample time
+
+    Methods
+    ------
+    __init__(float[], float[][][]) --> None (Side-effects: creates times and states attributes)
+
+    __call__(float) --> float[][] (No Side-effects)
+    """
+
+
+    def __init__(self, times, states):
+        """
+        Keyword arguments:
+        times -- array of floats, equally spaced sample times
+        states -- 3D array of floats, states[i, j] is [x y z vx vy vz] of massive object j at times[i]
+        """
+
+        self.times = times
+        self.states = states
+
+        return None
+
+    def __call__(self, time):
+        """Returns a 2D array of floats, [ x y z, ...] the positions of the massive objects at time"""
+        spacing = self.times[1] - self.times[0]
+        i = min(max(int((time - self.times[0])//spacing), 0), len(self.times) - 2)
+        s = (time - self.times[i])/spacing
+
+        #cubic Hermite basis functions
+        h00 = (1 + 2*s)*(1 - s)**2
+        h10 = s*(1 - s)**2
+        h01 = s**2*(3 - 2*s)
+        h11 = s**2*(s - 1)
+        return (h00*self.states[i, :, 0:3] + h10*spacing*self.states[i, :, 3:6]
+                + h01*self.states[i + 1, :, 0:3] + h11*spacing*self.states[i + 1, :, 3:6])
+
+
+
+
+
+
+def sample_trajectory(massive_object_result, number_of_massive_objects, time, delta_time, number_of_samples):
+    """
+    Samples the dense output of integrate_massive_objects() at equally spaced times
+
+    Keyword arguments:
+    massive_object_result -- solve_ivp result with dense output, see core_functions.integrate_massive_objects()
+    number_of_massive_objects -- int
+    time -- float, the start of the interval
+    delta_time -- float, the length of the interval
+    number_of_samples -- int, number of sample times, including both ends of the interval
+
+    Return values:
+    times -- array of floats, the sample times
+    states -- 3D array of floats, states[i, j] is [x y z vx vy vz] of massive object j at times[i]
+    """
+    times = np.linspace(time, time + delta_time, number_of_samples)
+    states = massive_object_result.sol(times).T.reshape(number_of_samples, number_of_massive_objects, 6)
+
+
+    return (times, states)
+
+
+
+
+
+
+def _shared_array(array):
+    """Copies array into a new block of shared memory, returns the block and the array viewing it"""
+    block = shared_memory.SharedMemory(create = True, size = max(1, array.nbytes))
+    shared_array = np.ndarray(array.shape, dtype = array.dtype, buffer = block.buf)
+    shared_array[:] = array
+    return (block, shared_array)
+
+
+def _release_blocks(blocks, unlink = False):
+    """Closes (and unlinks) every block, carrying on past any that fail so none are leaked, then raises the first failure"""
+    first_error = None
+    for block in blocks:
+        for release in ([block.close, block.unlink] if unlink else [block.close]):
+            try:
+                release()
+            except (BufferError, OSError) as error:
+                first_error = error if first_error is None else first_error
+    if first_error is not None:
+        raise first_error
+    return None
+
+
+def _propagate_chunk(arguments):
+    """Worker process: attaches to the shared arrays and advances rows start to end of the test masses in place"""
+    (names, shapes, masses, time, delta_time, method, start, end, config) = arguments
+    blocks = [shared_memory.SharedMemory(name = name) for name in names]
+    try:
+        (times, states, test_mass_state) = [np.ndarray(shape, dtype = float, buffer = block.buf) for (shape, block) in zip(shapes, blocks)]
+        #the integration works on copies, so if it fails its traceback holds no views of the blocks
+        host_positions = HermiteTrajectory(times.copy(), states.copy())
+        (new_chunk, number_of_evaluations) = cf.propagate_test_masses(test_mass_state[start:end].copy(), host_positions, masses, time, delta_time,
+                                                                      method, config = config)
+        test_mass_state[start:end] = new_chunk
+    finally:
+        times = states = test_mass_state = None #release the views before closing the blocks
+        _release_blocks(blocks)
+    return number_of_evaluations
+
+
+
+
+
+
+def integrate_parallel(stack, stack_layout, masses, time, delta_time, method = "RK45", chunk_size = 2048, number_of_workers = None, config = None):
+    """
+    Integrates the system as a restricted N-body problem, like core_functions.integrate_restricted(), with the
+    chunks of test masses shared between number_of_workers processes
+
+    Keyword arguments:
+    stack -- array of floats, see core_functions.stacker() for more information
+    stack_layout -- StackLayout, contains information about what the values in stack correspond to
+    masses -- array of floats, masses of each of the massive_objects
+    time -- float, the start time from which the system should be solved
+    delta_time --  float, the interval over which the system should be solved
+    method -- string, method used for the test masses, "leapfrog", "yoshida" or any solve_ivp method (default "RK45")
+    chunk_size -- int, number of test masses integrated together (default 2048)
+    number_of_workers -- int, number of processes, 1 integrates in this process (default None, the number of CPUs)
+    config -- SimulationConfig, sent to each worker (default None, the values in global_constants.py)
+
+    Return values:
+    result -- IntegrationResult, result.y has a single column, the stack at time + delta_time
+    """
+    if config is None:
+        config = SimulationConfig()
+    if number_of_workers is None:
+        number_of_workers = os.cpu_count()
+    stack = np.asarray(stack, dtype = float)
+    number_of_massive_objects = stack_layout.number_of_massive_objects
+    new_stack = np.empty_like(stack)
+
+    massive_object_result = cf.integrate_massive_objects(stack[stack_layout.massive_object_slice], masses, time, delta_time, config = config)
+    new_stack[stack_layout.massive_object_slice] = massive_object_result.y[:, -1]
+    #samples every eighth of a step, the interpolation error is then far below that of the test mass integration
+    number_of_samples = 8*cf._number_of_steps(delta_time, config.step_size) + 1
+    (times, states) = sample_trajectory(massive_object_result, number_of_massive_objects, time, delta_time, number_of_samples)
+
+    chunks = [(start, min(start + chunk_size, stack_layout.number_of_test_masses)) for start in range(0, stack_layout.number_of_test_masses, chunk_size)]
+    number_of_evaluations = massive_object_result.nfev
+
+    if number_of_workers <= 1 or len(chunks) <= 1:
+        #same chunks and interpolation as the workers, so the results are identical
+        test_mass_state = np.array(stack_layout.test_mass_state(stack))
+        host_positions = HermiteTrajectory(times, states)
+        for (start, end) in chunks:
+            (test_mass_state[start:end], evaluations) = cf.propagate_test_masses(test_mass_state[start:end], host_positions, masses, time, delta_time, method, config = config)
+            number_of_evaluations += evaluations
+        stack_layout.test_mass_state(new_stack)[:] = test_mass_state
+    else:
+        (blocks, shared_arrays, shared_array) = ([], [], None)
+        try:
+            for array in (times, states, np.ascontiguousarray(stack_layout.test_mass_state(stack))):
+                (block, shared_array) = _shared_array(array)
+                blocks.append(block)
+                shared_arrays.append(shared_array)
+            names = [block.name for block in blocks]
+            shapes = [shared_array.shape for shared_array in shared_arrays]
+            arguments = [(names, shapes, list(masses), time, delta_time, method, start, end, config) for (start, end) in chunks]
+
+            with concurrent.futures.ProcessPoolExecutor(max_workers = min(number_of_workers, len(chunks))) as executor:
+                number_of_evaluations += sum(executor.map(_propagate_chunk, arguments))
+            stack_layout.test_mass_state(new_stack)[:] = shared_arrays[2]
+        finally:
+            shared_arrays = shared_array = None #release the views before closing the blocks, also when a worker failed
+            _release_blocks(blocks, unlink = True)
+
+
+    return IntegrationResult(np.array([time + delta_time]), new_stack[:, np.newaxis], number_of_evaluations)
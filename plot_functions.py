@@ -1,47 +1,247 @@
+import threading
+import concurrent.futures
 import numpy as np
-import matplotlib.pyplot as plt
-np.warnings.filterwarnings('ignore', category=np.VisibleDeprecationWarning)
 """
 Contains functions used for creating plots
+
+The snapshots of a run are drawn with SnapshotRenderer, which renders them on background processes while the
+integration carries on, reusing one figure per process.
+
+Every figure is drawn with the Agg canvas rather than pyplot, so plotting needs no display. matplotlib is only
+imported when the first figure is made, so runs that never plot don't spend time importing it.
 """
 
-def plotter(massive_objects, time_given):
+def new_figure():
+    """Returns a matplotlib.figure.Figure with an Agg canvas, which can be saved without a display and isn't kept by pyplot"""
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    return figure
+
+
+
+def plotter(massive_objects, time_given, dpi = 300, file_format = "jpg"):
     """Produces plot of the positions of all masses in the system, given a massive_objects and a time (float)"""
-    position_to_plot_x = []
-    position_to_plot_y = []
-
-    for i in range(len(massive_objects)):
-        for j in range(len(massive_objects[i].test_masses)):
-            position_to_plot_x.append(massive_objects[i].test_masses[j].position[0])
-            position_to_plot_y.append(massive_objects[i].test_masses[j].position[1])
-    
-    figure, axes = plt.subplots()
-    axes.scatter(position_to_plot_x, position_to_plot_y, marker = '.', s = 5, linewidths=0.5, label = "Test mass")
-    
-    position_to_plot_x = []
-    position_to_plot_y = []
-    for i in range(len(massive_objects)):
-            position_to_plot_x.append(massive_objects[i].position[0])
-            position_to_plot_y.append(massive_objects[i].position[1])
-
-    axes.scatter(position_to_plot_x, position_to_plot_y, marker = '.', color = 'red', linewidths=0.5, label = "Massive object")
-    axes.set_xlabel(r"x coordinate / $\widetilde{m}$")
-    axes.set_ylabel(r"y coordinate / $\widetilde{m}$")
-    axes.set_title("x-y plane at " + str("{:.0f}".format(time_given)) + "s")
-    y_lower, y_upper = massive_objects[0].position[1]-20, massive_objects[0].position[1]+20
-    x_lower, x_upper = massive_objects[0].position[0]-20, massive_objects[0].position[0]+20
-    plt.ylim([y_lower, y_upper])
-    plt.xlim([x_lower, x_upper])
-    plt.gca().set_aspect('equal', adjustable='box')
-    axes.legend(loc="upper right",bbox_to_anchor=(1, 1), fontsize='xx-small')
-    title = "x-y plane at " + str("{:.2f}".format(time_given)) + ".jpg"
-    figure.savefig(title,  bbox_inches="tight", dpi=300)
+    snapshot_figure = SnapshotFigure()
+    snapshot_figure.render(*snapshot_positions(massive_objects), time_given, dpi, file_format)
+    snapshot_figure.close()
     return None
 
 
+
+
+
+
+def snapshot_positions(massive_objects):
+    """
+    Copies the x and y coordinates plotted by plotter() out of massive_objects
+
+    Keyword arguments:
+    massive_objects -- array of class Mass
+
+    Return values:
+    test_mass_positions -- 2D array of floats, [x y] of every test mass
+    massive_object_positions -- 2D array of floats, [x y] of every massive object
+    """
+    test_mass_positions = np.concatenate([np.empty((0, 2))] + [massive_object.test_masses.positions[:, 0:2] for massive_object in massive_objects])
+    massive_object_positions = np.array([massive_object.position[0:2] for massive_object in massive_objects], dtype = float)
+    return (test_mass_positions, massive_object_positions)
+
+
+
+
+
+
+class SnapshotFigure:
+    """
+    Class for the figure of plotter(), drawn once and then reused for every snapshot by moving its points
+
+    Attributes
+    ---------
+    figure : matplotlib.figure.Figure
+        figure drawn without pyplot, so it needs no display and is never kept by pyplot
+    axes : matplotlib.axes.Axes
+    test_mass_points, massive_object_points : matplotlib.collections.PathCollection
+        the scatter plots of the test masses and of the massive objects
+
+    Methods
+    ------
+    __init__() --> None (Side-effects: creates the figure)
+
+    render(float[][], float[][], float, float, string) --> string (Side-effects: writes an image file)
+
+    close() --> None (Side-effects: frees the figure)
+    """
+
+
+    def __init__(self):
+        self.figure = new_figure()
+        self.axes = self.figure.subplots()
+        self.test_mass_points = self.axes.scatter([], [], marker = '.', s = 5, linewidths=0.5, label = "Test mass")
+        self.massive_object_points = self.axes.scatter([], [], marker = '.', color = 'red', linewidths=0.5, label = "Massive object")
+        self.axes.set_xlabel(r"x coordinate / $\widetilde{m}$")
+        self.axes.set_ylabel(r"y coordinate / $\widetilde{m}$")
+        self.axes.set_aspect('equal', adjustable='box')
+        self.axes.legend(loc="upper right",bbox_to_anchor=(1, 1), fontsize='xx-small')
+
+        return None
+
+    def render(self, test_mass_positions, massive_object_positions, time_given, dpi = 300, file_format = "jpg"):
+        """
+        Moves the points to the given positions and saves the figure, the image is the same as plotter() would make
+
+        Keyword arguments:
+        test_mass_positions -- 2D array of floats, [x y] of every test mass
+        massive_object_positions -- 2D array of floats, [x y] of every massive object, the first is at the centre of the plot
+        time_given -- float, time of the snapshot
+        dpi -- float, resolution of the image (default 300)
+        file_format -- string, image format understood by matplotlib, also used as the file extension (default "jpg")
+
+        Return value:
+        title -- string, name of the file written
+        """
+        self.test_mass_points.set_offsets(test_mass_positions)
+        self.massive_object_points.set_offsets(massive_object_positions)
+        self.axes.set_title("x-y plane at " + str("{:.0f}".format(time_given)) + "s")
+        self.axes.set_ylim([massive_object_positions[0, 1]-20, massive_object_positions[0, 1]+20])
+        self.axes.set_xlim([massive_object_positions[0, 0]-20, massive_object_positions[0, 0]+20])
+        title = "x-y plane at " + str("{:.2f}".format(time_given)) + "." + file_format
+        self.figure.savefig(title,  bbox_inches="tight", dpi=dpi, format=file_format)
+        return title
+
+    def close(self):
+        """Frees the figure, it can't be rendered again"""
+        self.figure.clear()
+        self.figure = None
+        return None
+
+
+
+
+
+
+#figure reused by every snapshot rendered in this process
+_worker_figure = None
+
+
+def _render_snapshot(arguments):
+    """Renders a snapshot onto the figure kept by this process, creating the figure the first time"""
+    global _worker_figure
+    if _worker_figure is None:
+        _worker_figure = SnapshotFigure()
+    return _worker_figure.render(*arguments)
+
+
+class SnapshotRenderer:
+    """
+    Class rendering the snapshots of plotter() in the background, so a run doesn't wait for each image.
+
+    submit() copies the positions out of massive_objects straight away, so they can change as soon as it returns.
+    The snapshots are rendered by a pool of processes, each reusing one SnapshotFigure. At most maximum_queue_size
+    snapshots wait to be rendered, once there are that many submit() waits for one to finish (backpressure),
+    so a run that produces snapshots faster than they render doesn't fill the memory with them.
+
+    Attributes
+    ---------
+    dpi : float
+        resolution of the images
+    file_format : string
+        format of the images, see SnapshotFigure.render()
+
+    Methods
+    ------
+    __init__(int, int, float, string) --> None (Side-effects: starts the worker processes)
+
+    submit(Mass[], float) --> None (Side-effects: queues the snapshot, may wait for the queue to have space)
+
+    close() --> string[] (Side-effects: waits for every snapshot to be written, stops the worker processes)
+    """
+
+
+    def __init__(self, number_of_workers = 1, maximum_queue_size = 4, dpi = 300, file_format = "jpg"):
+        """
+        Keyword arguments:
+        number_of_workers -- int, number of rendering processes, 0 renders each snapshot in submit() (default 1)
+        maximum_queue_size -- int, number of snapshots that can be waiting or rendering at once (default 4)
+        dpi -- float, resolution of the images (default 300)
+        file_format -- string, image format understood by matplotlib (default "jpg")
+        """
+
+        self.dpi = dpi
+        self.file_format = file_format
+        self._titles = []
+        self._futures = []
+        self._executor = None
+        if number_of_workers > 0:
+            self._executor = concurrent.futures.ProcessPoolExecutor(max_workers = number_of_workers)
+        self._queue_space = threading.BoundedSemaphore(max(1, maximum_queue_size))
+
+        return None
+
+    def submit(self, massive_objects, time_given):
+        """
+        Queues a snapshot of massive_objects to be rendered like plotter(massive_objects, time_given)
+
+        Keyword arguments:
+        massive_objects -- array of class Mass
+        time_given -- float, time of the snapshot
+        """
+        arguments = snapshot_positions(massive_objects) + (time_given, self.dpi, self.file_format)
+        if self._executor is None:
+            self._titles.append(_render_snapshot(arguments))
+            return None
+
+        self._check_failures()
+        self._queue_space.acquire() #waits while the queue is full
+        future = self._executor.submit(_render_snapshot, arguments)
+        future.add_done_callback(lambda future: self._queue_space.release())
+        self._futures.append(future)
+
+        return None
+
+    def _check_failures(self):
+        """Raises the error of any snapshot that failed to render, and forgets the snapshots that have finished"""
+        for future in self._futures:
+            if future.done() and future.exception() is not None:
+                raise future.exception()
+        #titles are kept in the order of submission, so only the finished snapshots at the front are forgotten
+        while len(self._futures) > 0 and self._futures[0].done():
+            self._titles.append(self._futures.pop(0).result())
+
+    def close(self):
+        """
+        Waits for every queued snapshot to be written and stops the workers
+
+        Return value:
+        titles -- array of strings, names of the files written, in the order the snapshots were submitted
+        """
+        try:
+            for future in self._futures:
+                self._titles.append(future.result())
+            self._futures = []
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+        return self._titles
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        self.close()
+        return False
+
+
+
+
+
 def energy_against_time(energy, time):
     """Produces plot of energy against time"""
-    figure, axes = plt.subplots()
+    figure = new_figure()
+    axes = figure.subplots()
     axes.plot(time, energy)
     axes.set_title("Energy of test masses \n against time")
     axes.set_xlabel("time / s")
@@ -51,7 +251,8 @@ def energy_against_time(energy, time):
 
 def tidal_length_against_time(length, time):
     """Produces plot of tidal tail length against time"""
-    figure, axes = plt.subplots()
+    figure = new_figure()
+    axes = figure.subplots()
     axes.plot(time, length)
     axes.set_title("Average distance of test masses in tail against time")
     axes.set_xlabel("time / s")
@@ -60,7 +261,8 @@ def tidal_length_against_time(length, time):
 
 def plot_order(n, times):
     """Produces plot of time to compute against number of test masses"""
-    figure, axes = plt.subplots()
+    figure = new_figure()
+    axes = figure.subplots()
     axes.plot(n, times)
     axes.set_title("Time to compute against number of test masses")
     axes.set_xlabel("n")
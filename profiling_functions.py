@@ -0,0 +1,197 @@
+import os
+import json
+import time
+import threading
+import tracemalloc
+try:
+    import resource
+except ImportError: #not available on Windows, peak memory is then not reported
+    resource = None
+"""
+Counters and timers for finding where the time of a run goes, without a profiler around the whole script.
+
+A Profiler is passed to the integrators (see core_functions.integrate_snapshots()), which then wrap the derivatives
+and force evaluations so each call is counted and timed, and count the steps taken and rejected. Other code adds
+its own timers with Profiler.timer(), e.g. run_main.py for moving data between the stack and the Mass objects
+(marshalling) and for plotting. When no Profiler is given nothing is wrapped, so profiling costs nothing unless
+it is turned on.
+
+Profiler.snapshot_report() collects everything since the previous report, with the peak memory of the process,
+into one dict per snapshot. The peak resident memory never goes down, so it only shows the largest snapshot so far;
+with trace_memory the peak of the memory allocated by Python and NumPy since the previous report is found with
+tracemalloc, which shows the memory each snapshot needs but slows every allocation. If a trace file is given every timed call is also written to it in the Chrome trace
+event format, which can be opened in chrome://tracing or https://ui.perfetto.dev to see each call on a timeline.
+"""
+
+
+
+
+
+
+def peak_memory():
+    """Returns an int, the peak resident memory of this process so far in bytes, or None where it isn't available"""
+    if resource is None:
+        return None
+    #ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == "Darwin" else 1024*peak
+
+
+
+
+
+
+class Profiler:
+    """
+    Class holding counters and timers for a run
+
+    Attributes
+    ---------
+    counters : dict
+        number of each event since the last report, e.g. "rhs_calls", "steps", "rejected_steps"
+    timers : dict
+        seconds spent in each timed section since the last report, e.g. "rhs_time", "marshalling_time"
+    reports : dict[]
+        every report returned by snapshot_report()
+    trace_file_name : string
+        file the trace is written to, None if there is no trace
+    trace_memory : bool
+        whether the peak allocated memory of each snapshot is found with tracemalloc
+
+    Methods
+    ------
+    __init__(string, bool) --> None (Side-effects: creates the trace file if one is given, starts tracemalloc if trace_memory)
+
+    count(string, int) --> None (Side-effects: adds to a counter)
+
+    add_time(string, float, float) --> None (Side-effects: adds to a timer, and to the trace)
+
+    timer(string) --> context manager (Side-effects: times the code inside it)
+
+    timed(string, function) --> function (No Side-effects)
+
+    snapshot_report(int, float) --> dict (Side-effects: resets the counters and timers, writes the trace)
+
+    close() --> None (Side-effects: closes the trace file, stops tracemalloc if it was started here)
+    """
+
+
+    def __init__(self, trace_file_name = None, trace_memory = False):
+        """
+        Keyword arguments:
+        trace_file_name -- string, file to write the trace to (default None, no trace)
+        trace_memory -- bool, find the peak allocated memory of each snapshot with tracemalloc (default False)
+        """
+
+        self.counters = {}
+        self.timers = {}
+        self.reports = []
+        self.trace_file_name = trace_file_name
+        self.trace_memory = trace_memory
+        self._started_tracemalloc = False
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self._start_time = time.perf_counter()
+        self._last_report_time = self._start_time
+        self._trace_events = None
+        self._trace_file = None
+        if trace_file_name is not None:
+            self._trace_events = []
+            self._trace_file = open(trace_file_name, "w")
+            self._trace_file.write("[\n") #the closing bracket is optional in the trace event format, so the trace is usable while it is written
+
+        return None
+
+    def count(self, name, number = 1):
+        """Adds number to the counter name"""
+        self.counters[name] = self.counters.get(name, 0) + number
+
+    def add_time(self, name, start, end):
+        """Adds the time from start to end (from time.perf_counter()) to the timer name + "_time" """
+        self.timers[name + "_time"] = self.timers.get(name + "_time", 0.0) + (end - start)
+        if self._trace_events is not None:
+            self._trace_events.append({"name": name, "ph": "X", "ts": 1e6*(start - self._start_time), "dur": 1e6*(end - start),
+                                       "pid": os.getpid(), "tid": threading.get_ident()})
+
+    def timer(self, name):
+        """Returns a context manager adding the time spent inside it to the timer name + "_time" and counting name + "_calls" """
+        return _Timer(self, name)
+
+    def timed(self, name, function):
+        """Returns function wrapped so each call is counted in name + "_calls" and timed in name + "_time" """
+        def timed_function(*arguments, **keyword_arguments):
+            start = time.perf_counter()
+            try:
+                return function(*arguments, **keyword_arguments)
+            finally:
+                self.add_time(name, start, time.perf_counter())
+                self.count(name + "_calls")
+        return timed_function
+
+    def snapshot_report(self, snapshot_number, simulation_time):
+        """
+        Collects the counters and timers since the last report, and resets them
+
+        Keyword arguments:
+        snapshot_number -- int
+        simulation_time -- float, time of the snapshot in the simulation
+
+        Return value:
+        report -- dict of the snapshot_number, simulation_time, wall_time (seconds since the last report),
+                  peak_memory (bytes, None where it isn't available), traced_peak_memory (bytes allocated at
+                  most since the last report, if trace_memory) and every counter and timer
+        """
+        now = time.perf_counter()
+        report = {"snapshot_number": snapshot_number, "simulation_time": simulation_time,
+                  "wall_time": now - self._last_report_time, "peak_memory": peak_memory()}
+        if self.trace_memory and tracemalloc.is_tracing():
+            report["traced_peak_memory"] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.reset_peak()
+        report.update(self.counters)
+        report.update(self.timers)
+        self.reports.append(report)
+        (self.counters, self.timers) = ({}, {})
+        self._last_report_time = now
+
+        if self._trace_file is not None:
+            self._trace_events.append({"name": "snapshot " + str(snapshot_number), "ph": "i", "s": "p", "ts": 1e6*(now - self._start_time),
+                                       "pid": os.getpid(), "tid": threading.get_ident(), "args": report})
+            for event in self._trace_events:
+                self._trace_file.write(json.dumps(event) + ",\n")
+            self._trace_file.flush()
+            self._trace_events = []
+
+
+        return report
+
+    def close(self):
+        """Closes the trace file, and stops tracemalloc if it was started by this Profiler"""
+        if self._trace_file is not None:
+            self._trace_file.close()
+            self._trace_file = None
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        return None
+
+
+
+
+
+
+class _Timer:
+    """Context manager for Profiler.timer()"""
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        self.profiler.add_time(self.name, self.start, time.perf_counter())
+        self.profiler.count(self.name + "_calls")
+        return False
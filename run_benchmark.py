@@ -0,0 +1,319 @@
+import os
+import sys
+import csv
+import json
+import time
+import tempfile
+import numpy as np
+import accessory_functions as af
+import core_functions as cf
+import plot_functions as pf
+from analysis_functions import analyse_snapshot
+from core_classes import Mass, ParticleStore, SimulationConfig
+"""
+Script timing each part of a run for a range of numbers of test masses, massive objects and integrators, to track
+performance and the order of the cost with the number of test masses.
+
+Each case times disc generation, stacking and destacking, one evaluation of the derivatives (vectorized, and the
+loop for small systems), integration over one snapshot (with the number of evaluations of the derivatives, nfev),
+analysis and plotting of a snapshot. The results are written to benchmark.json and benchmark.csv, and the time to
+integrate a snapshot against the number of test masses is plotted with plot_functions.plot_order().
+
+Run with --quick for a small set of cases, or see run_cli.py for the settings of a benchmark from a config file and flags.
+
+Methods:
+
+    time_call(function, int) --> float (No side-effects)
+
+    benchmark_system(int, int, SimulationConfig) --> Mass[] (No side-effects)
+
+    benchmark_case(int, int, string, SimulationConfig, int) --> dict (No side-effects)
+
+    run_benchmarks(int[], int[], string[], SimulationConfig, int) --> dict[] (No side-effects)
+
+    scaling_order(dict[], string) --> dict (No side-effects)
+
+    write_benchmark_results(dict[], dict, SimulationConfig, string) --> None (Side-effects: writes a JSON and a CSV file)
+
+    main(bool, SimulationConfig) --> dict[] (Side-effects: writes the results and the scaling plot)
+
+"""
+
+#columns of the results table
+BENCHMARK_COLUMNS = ["number_of_test_masses", "number_of_massive_objects", "method", "disc_generation_time", "stacker_time",
+                     "destacker_time", "derivative_time", "loop_derivative_time", "integration_time", "nfev", "time_per_evaluation",
+                     "analysis_time", "plotting_time"]
+
+#the loop derivatives are only timed up to this many test masses, as they are very slow
+LOOP_DERIVATIVE_LIMIT = 1000
+
+
+
+
+
+def time_call(function, repeats = 3):
+    """
+    Times a function with no arguments
+
+    Keyword arguments:
+    function -- function() to time
+    repeats -- int, number of times it is called (default 3)
+
+    Return value:
+    -- float, the shortest time taken in seconds, which is the least affected by other processes
+    """
+    times = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+
+
+
+
+def benchmark_system(number_of_test_masses, number_of_massive_objects, config):
+    """
+    Makes a system of a host galaxy with a disc of test masses, and perturbing galaxies spread evenly on a circle around it
+
+    Keyword arguments:
+    number_of_test_masses -- int, number of test masses in the disc of the host
+    number_of_massive_objects -- int, number of massive objects including the host
+    config -- SimulationConfig
+
+    Return value:
+    massive_objects -- array of class Mass
+    """
+    massive_objects = [Mass([0, 0, 0], [0, 0, 0], 1)]
+    for i in range(1, number_of_massive_objects):
+        angle = 2*np.pi*(i - 1)/(number_of_massive_objects - 1)
+        rotation = np.array([[np.cos(angle), -np.sin(angle), 0], [np.sin(angle), np.cos(angle), 0], [0, 0, 1]])
+        massive_objects.append(Mass(np.dot(rotation, config.galaxy_position), np.dot(rotation, config.galaxy_velocity), config.galaxy_mass))
+
+    (positions, velocities) = _generate_disc(_number_of_rings(number_of_test_masses, config), config)
+    massive_objects[0].test_masses = ParticleStore.from_arrays(positions[:number_of_test_masses], velocities[:number_of_test_masses])
+
+
+    return massive_objects
+
+
+def _generate_disc(number_of_rings, config):
+    """Returns the positions and velocities of a disc around a host of mass 1 with the settings of config"""
+    return af.generate_disc(1, number_of_rings, config.ring_spacing, config.minimum_radius,
+                            config.number_of_masses_per_unit_radius, gravitational_constant = config.gravitational_constant)
+
+
+def _number_of_rings(number_of_test_masses, config):
+    """Returns the fewest rings holding at least number_of_test_masses, the last ring may then be partly used"""
+    (lower, upper) = (0, 1)
+    while len(_generate_disc(upper, config)[0]) < number_of_test_masses:
+        (lower, upper) = (upper, 2*upper)
+    while upper - lower > 1:
+        middle = (lower + upper)//2
+        if len(_generate_disc(middle, config)[0]) < number_of_test_masses:
+            lower = middle
+        else:
+            upper = middle
+    return upper
+
+
+
+
+
+
+def benchmark_case(number_of_test_masses, number_of_massive_objects, method, config, repeats = 3):
+    """
+    Times each part of a run for one system and integrator
+
+    Keyword arguments:
+    number_of_test_masses -- int
+    number_of_massive_objects -- int, at least 2 so the snapshot can be analysed
+    method -- string, the integrator, see core_functions.integrate()
+    config -- SimulationConfig, a snapshot is config.delta_time long
+    repeats -- int, number of times each part is timed after an untimed first integration, the shortest time is kept (default 3)
+
+    Return value:
+    result -- dict with a value for each of BENCHMARK_COLUMNS, times in seconds, None for parts that weren't timed
+    """
+    result = {"number_of_test_masses": number_of_test_masses, "number_of_massive_objects": number_of_massive_objects, "method": method}
+    number_of_rings = _number_of_rings(number_of_test_masses, config)
+    result["disc_generation_time"] = time_call(lambda: _generate_disc(number_of_rings, config), repeats)
+
+    #the first call of stacker() copies the objects into the stack, so each time is for a new system
+    stacker_times = []
+    for i in range(repeats):
+        massive_objects = benchmark_system(number_of_test_masses, number_of_massive_objects, config)
+        start = time.perf_counter()
+        (stack, stack_layout, masses) = cf.stacker(massive_objects)
+        stacker_times.append(time.perf_counter() - start)
+    result["stacker_time"] = min(stacker_times)
+    new_stack = stack.copy() #as returned by the integrator
+    result["destacker_time"] = time_call(lambda: cf.destacker(new_stack, stack_layout, massive_objects), repeats)
+
+    result["derivative_time"] = time_call(lambda: cf.vectorized_derivative_assignment(0, stack, stack_layout, masses, config.force_backend, config), repeats)
+    result["loop_derivative_time"] = None
+    if number_of_test_masses <= LOOP_DERIVATIVE_LIMIT:
+        result["loop_derivative_time"] = time_call(lambda: cf.derivative_assignment(0, stack, stack_layout, masses, config), 1)
+
+    def integrate_snapshot():
+        return cf.integrate(stack.copy(), stack_layout, masses, 0, config.delta_time, method = method, config = config, output_times = [config.delta_time])
+
+    #untimed first call, which pays for importing the integrator and any other first-call setup
+    integration_result = integrate_snapshot()
+    result["integration_time"] = time_call(integrate_snapshot, repeats)
+    result["nfev"] = int(integration_result.nfev)
+    result["time_per_evaluation"] = result["integration_time"]/max(1, result["nfev"])
+
+    snapshot_stack = integration_result.y[:, -1]
+    result["analysis_time"] = time_call(lambda: analyse_snapshot(snapshot_stack, stack_layout, masses, config), repeats)
+
+    #renders into a temporary directory, reusing one figure as SnapshotRenderer does
+    working_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            snapshot_figure = pf.SnapshotFigure()
+            positions = pf.snapshot_positions(massive_objects)
+            result["plotting_time"] = time_call(lambda: snapshot_figure.render(*positions, 0, config.plot_dpi, config.plot_format), repeats)
+            snapshot_figure.close()
+        finally:
+            os.chdir(working_directory)
+
+
+    return result
+
+
+
+
+
+
+def run_benchmarks(test_mass_counts, massive_object_counts, methods, config = None, repeats = 3):
+    """
+    Runs benchmark_case() for every combination of number of test masses, number of massive objects and method
+
+    Keyword arguments:
+    test_mass_counts -- array of ints
+    massive_object_counts -- array of ints, each at least 2
+    methods -- array of strings
+    config -- SimulationConfig (default None, the values in global_constants.py)
+    repeats -- int, see benchmark_case() (default 3)
+
+    Return value:
+    results -- array of dicts, see benchmark_case()
+    """
+    if config is None:
+        config = SimulationConfig()
+
+    results = []
+    for method in methods:
+        for number_of_massive_objects in massive_object_counts:
+            for number_of_test_masses in test_mass_counts:
+                result = benchmark_case(number_of_test_masses, number_of_massive_objects, method, config, repeats)
+                print(method + ", " + str(number_of_massive_objects) + " massive objects, " + str(number_of_test_masses) + " test masses: "
+                      + "{:.4f}".format(result["integration_time"]) + " s per snapshot, " + str(result["nfev"]) + " evaluations")
+                results.append(result)
+
+
+    return results
+
+
+
+
+
+
+def scaling_order(results, column = "integration_time"):
+    """
+    Finds the order of the cost with the number of test masses, the slope of a straight line fitted to log(time) against log(n)
+
+    Keyword arguments:
+    results -- array of dicts, see run_benchmarks()
+    column -- string, the time to fit (default "integration_time")
+
+    Return value:
+    orders -- dict, the order for each method and number of massive objects, keyed by "method, M massive objects"
+    """
+    groups = {}
+    for result in results:
+        if result[column] is not None and result[column] > 0:
+            key = result["method"] + ", " + str(result["number_of_massive_objects"]) + " massive objects"
+            groups.setdefault(key, []).append((result["number_of_test_masses"], result[column]))
+
+    orders = {}
+    for (key, points) in groups.items():
+        (n, times) = np.array(points, dtype = float).T
+        if len(np.unique(n)) > 1:
+            orders[key] = float(np.polyfit(np.log(n), np.log(times), 1)[0])
+
+
+    return orders
+
+
+
+
+
+
+def write_benchmark_results(results, orders, config, file_name = "benchmark"):
+    """
+    Writes the results as file_name.json, with the orders and config, and as file_name.csv with one row per case
+
+    Keyword arguments:
+    results -- array of dicts, see run_benchmarks()
+    orders -- dict, see scaling_order()
+    config -- SimulationConfig, the config the benchmarks were run with
+    file_name -- string, path of the files without the extension (default "benchmark")
+    """
+
+    with open(file_name + ".json", "w") as json_file:
+        json.dump({"results": results, "scaling_order": orders, "config": config.as_dict()}, json_file, indent = 4)
+    with open(file_name + ".csv", "w", newline = "") as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames = BENCHMARK_COLUMNS)
+        writer.writeheader()
+        for result in results:
+            writer.writerow({column: result[column] for column in BENCHMARK_COLUMNS})
+
+    return None
+
+
+
+
+def main(quick = False, config = None):
+    """
+    Runs the benchmarks, writes their results and plots the time per snapshot against the number of test masses
+
+    Keyword arguments:
+    quick -- bool, run a small set of cases (default False)
+    config -- SimulationConfig, a snapshot is config.delta_time long, nothing is plotted unless config.plot (default None, the values
+              in global_constants.py with a delta_time of 1)
+
+    Return value:
+    results -- array of dicts, see run_benchmarks()
+    """
+    if config is None:
+        config = SimulationConfig(delta_time = 1)
+    if quick:
+        (test_mass_counts, massive_object_counts, methods) = ([100, 300, 1000], [2], ["RK45", "leapfrog"])
+    else:
+        (test_mass_counts, massive_object_counts, methods) = ([100, 300, 1000, 3000, 10000, 30000], [2, 4, 8], ["RK45", "leapfrog", "yoshida", "block"])
+
+    results = run_benchmarks(test_mass_counts, massive_object_counts, methods, config)
+    orders = scaling_order(results)
+    for (key, order) in orders.items():
+        print("Time per snapshot for " + key + " grows as n^" + "{:.2f}".format(order))
+    write_benchmark_results(results, orders, config)
+
+    #scaling plot, for the first method with the fewest massive objects
+    if config.plot:
+        n = [result["number_of_test_masses"] for result in results if result["method"] == methods[0] and result["number_of_massive_objects"] == massive_object_counts[0]]
+        times = [result["integration_time"] for result in results if result["method"] == methods[0] and result["number_of_massive_objects"] == massive_object_counts[0]]
+        pf.plot_order(n, times)
+
+    return results
+
+
+
+
+if __name__ == "__main__":
+    main("--quick" in sys.argv)
@@ -0,0 +1,241 @@
+import sys
+import json
+import argparse
+from core_classes import SimulationConfig
+"""
+Command line entry point for batch jobs, with a subcommand for each kind of run:
+
+    python run_cli.py simulate [--resume] [--config FILE] [--PARAMETER VALUE ...]
+    python run_cli.py benchmark [--quick] [--config FILE] [--PARAMETER VALUE ...]
+    python run_cli.py sweep [--grid FILE] [--positions LIST] [--velocities LIST] [--masses LIST] [--cache-directory DIRECTORY]
+                            [--workers N] [--config FILE] [--PARAMETER VALUE ...]
+
+The SimulationConfig of a run takes the values in global_constants.py, then those in the config file (a JSON object
+of parameters, as written by SimulationConfig.as_dict()), then those given as flags. Every parameter has a flag,
+its name with dashes, e.g. --delta-time 2 or --galaxy-position "[10, 10, 0]"; values are read as JSON, and anything
+that isn't JSON is taken as a string, e.g. --integration-method leapfrog. Every value, from the file or a flag, must
+have the type of its default (see check_parameter()), otherwise it is reported as a usage error before anything runs.
+
+Each subcommand imports only what it runs, so the program starts quickly: scipy is only imported by the solve_ivp
+integrators and matplotlib only when something is plotted (see core_functions.py and plot_functions.py). Every
+figure is drawn without a display, and --plot false turns the plots of a simulation off altogether.
+
+Methods:
+
+    parse_value(string) --> any (No side-effects)
+
+    check_parameter(string, any) --> None (No side-effects)
+
+    load_config(string, dict, dict) --> SimulationConfig (No side-effects)
+
+    build_parser() --> argparse.ArgumentParser (No side-effects)
+
+    simulate(argparse.Namespace, SimulationConfig) --> None (Side-effects: runs run_main.main())
+
+    benchmark(argparse.Namespace, SimulationConfig) --> None (Side-effects: runs run_benchmark.main())
+
+    sweep(argparse.Namespace, SimulationConfig) --> None (Side-effects: runs sweep_functions.sweep())
+
+    main(string[]) --> int (Side-effects: runs the subcommand)
+
+"""
+
+#parameters of a benchmark that differ from global_constants.py unless they are set, as in run_benchmark.py
+BENCHMARK_DEFAULTS = {"delta_time": 1}
+
+#parameters with a default that isn't None which can also be None, to turn off what they name
+OPTIONAL_PARAMETERS = ["conservation_log"]
+
+
+
+
+def parse_value(string):
+    """Returns the value of a flag, string read as JSON, or string itself if it isn't JSON"""
+    try:
+        return json.loads(string)
+    except ValueError:
+        return string
+
+
+
+
+
+
+def check_parameter(name, value):
+    """
+    Checks a parameter has the type of its default in global_constants.py. Numbers may be ints or floats, and
+    parameters that default to None (and those in OPTIONAL_PARAMETERS) may be None or a string. integration_method
+    must also be one of core_functions.SNAPSHOT_METHODS.
+
+    Keyword arguments:
+    name -- string, name of the parameter
+    value -- the value given for it
+
+    Raises ValueError if the value has the wrong type, or isn't a known integration_method
+    """
+    default = getattr(SimulationConfig(), name)
+    if default is None or name in OPTIONAL_PARAMETERS:
+        (allowed, description) = (value is None or isinstance(value, str), "a string or null")
+    elif isinstance(default, bool):
+        (allowed, description) = (isinstance(value, bool), "true or false")
+    elif isinstance(default, (int, float)):
+        (allowed, description) = (isinstance(value, (int, float)) and not isinstance(value, bool), "a number")
+    elif isinstance(default, str):
+        (allowed, description) = (isinstance(value, str), "a string")
+    else:
+        (allowed, description) = (isinstance(value, list), "a JSON list")
+    if not allowed:
+        raise ValueError(name + " must be " + description + ", not " + json.dumps(value))
+    if name == "integration_method":
+        import core_functions #doesn't import scipy, see core_functions._scipy_integrate()
+        if value not in core_functions.SNAPSHOT_METHODS:
+            raise ValueError("integration_method must be one of " + str(list(core_functions.SNAPSHOT_METHODS)) + ", not " + json.dumps(value))
+
+    return None
+
+
+
+
+
+
+def load_config(file_name = None, parameters = None, defaults = None):
+    """
+    Makes the SimulationConfig of a run
+
+    Keyword arguments:
+    file_name -- string, JSON file of parameters (default None, no file)
+    parameters -- dict, parameters given as flags, which take precedence over the file (default None)
+    defaults -- dict, parameters used instead of those in global_constants.py unless the file or flags give them (default None)
+
+    Return value:
+    config -- SimulationConfig
+    """
+    all_parameters = dict(defaults or {})
+    if file_name is not None:
+        with open(file_name) as config_file:
+            file_parameters = json.load(config_file)
+        if not isinstance(file_parameters, dict):
+            raise ValueError("the config file " + str(file_name) + " must hold a JSON object of parameters")
+        all_parameters.update(file_parameters)
+    all_parameters.update(parameters or {})
+    config = SimulationConfig(**all_parameters) #raises TypeError for unknown parameters
+    for (name, value) in all_parameters.items():
+        check_parameter(name, value)
+
+
+    return config
+
+
+
+
+
+
+def build_parser():
+    """Returns the argparse.ArgumentParser of the command line, with a subparser for each subcommand"""
+    #flags shared by every subcommand
+    config_parser = argparse.ArgumentParser(add_help = False)
+    config_parser.add_argument("--config", metavar = "FILE", help = "JSON file of SimulationConfig parameters")
+    parameter_group = config_parser.add_argument_group("simulation parameters", "override the config file and global_constants.py, values are read as JSON")
+    for name in SimulationConfig.parameter_names():
+        #only the flags that are given are set, so the rest come from the file and the defaults
+        parameter_group.add_argument("--" + name.replace("_", "-"), dest = name, type = parse_value, metavar = "VALUE", default = argparse.SUPPRESS)
+
+    parser = argparse.ArgumentParser(description = "Simulates tidal tails of galaxy encounters, see run_cli.py")
+    subparsers = parser.add_subparsers(dest = "command", required = True)
+
+    simulate_parser = subparsers.add_parser("simulate", parents = [config_parser], help = "run a simulation, as run_main.py")
+    simulate_parser.add_argument("--resume", action = "store_true", help = "continue from the last checkpoint, with the config it was written with")
+    simulate_parser.set_defaults(function = simulate)
+
+    benchmark_parser = subparsers.add_parser("benchmark", parents = [config_parser], help = "time each part of a run, as run_benchmark.py")
+    benchmark_parser.add_argument("--quick", action = "store_true", help = "run a small set of cases")
+    benchmark_parser.set_defaults(function = benchmark)
+
+    sweep_parser = subparsers.add_parser("sweep", parents = [config_parser], help = "run an encounter for every combination of initial conditions")
+    sweep_parser.add_argument("--grid", metavar = "FILE", help = "JSON file with lists of positions, velocities and masses of the perturbing galaxy")
+    sweep_parser.add_argument("--positions", type = json.loads, metavar = "LIST", help = "JSON list of positions (default [galaxy_position])")
+    sweep_parser.add_argument("--velocities", type = json.loads, metavar = "LIST", help = "JSON list of velocities (default [galaxy_velocity])")
+    sweep_parser.add_argument("--masses", type = json.loads, metavar = "LIST", help = "JSON list of masses (default [galaxy_mass])")
+    sweep_parser.add_argument("--cache-directory", default = "sweep_cache", metavar = "DIRECTORY", help = "directory of the results (default sweep_cache)")
+    sweep_parser.add_argument("--workers", type = int, metavar = "N", help = "number of processes (default the number of CPUs)")
+    sweep_parser.set_defaults(function = sweep)
+
+
+    return parser
+
+
+def _parameters(arguments):
+    """Returns a dict of the simulation parameters given as flags"""
+    return {name: getattr(arguments, name) for name in SimulationConfig.parameter_names() if hasattr(arguments, name)}
+
+
+
+
+
+
+def simulate(arguments, config):
+    """Runs the simulate subcommand, see run_main.main()"""
+    import run_main
+    run_main.main(config, arguments.resume)
+    return None
+
+
+def benchmark(arguments, config):
+    """Runs the benchmark subcommand, see run_benchmark.main()"""
+    import run_benchmark
+    run_benchmark.main(arguments.quick, config)
+    return None
+
+
+def sweep(arguments, config):
+    """Runs the sweep subcommand over the grid of initial conditions given, see sweep_functions.sweep()"""
+    import sweep_functions
+    grid = {"positions": [config.galaxy_position], "velocities": [config.galaxy_velocity], "masses": [config.galaxy_mass]}
+    if arguments.grid is not None:
+        with open(arguments.grid) as grid_file:
+            grid.update(json.load(grid_file))
+    for name in grid:
+        if getattr(arguments, name) is not None:
+            grid[name] = getattr(arguments, name)
+
+    initial_conditions = sweep_functions.encounter_grid(grid["positions"], grid["velocities"], grid["masses"])
+    print("Running " + str(len(initial_conditions)) + " encounters")
+    results = sweep_functions.sweep(initial_conditions, arguments.cache_directory, arguments.workers, config)
+    for result in results:
+        print(", ".join(column + ": " + str(result[column]) for column in sweep_functions.RESULT_COLUMNS))
+    print("The results were written to " + arguments.cache_directory)
+
+    return None
+
+
+
+
+
+
+def main(argv = None):
+    """
+    Runs the subcommand given on the command line
+
+    Keyword arguments:
+    argv -- array of strings, the arguments after the program name (default None, sys.argv[1:])
+
+    Return value:
+    -- int, the exit status
+    """
+    parser = build_parser()
+    arguments = parser.parse_args(argv)
+    #a config file that can't be read, or an unknown parameter or one of the wrong type, is reported as a usage error before anything runs
+    try:
+        config = load_config(arguments.config, _parameters(arguments), BENCHMARK_DEFAULTS if arguments.command == "benchmark" else None)
+    except (OSError, TypeError, ValueError) as error:
+        parser.error(str(error))
+    arguments.function(arguments, config)
+
+
+    return 0
+
+
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,109 +1,225 @@
+import sys
+import contextlib
 import numpy as np
-from core_functions import *
-import accessory_functions as af
-from core_classes import *
-from plot_functions import *
+from core_functions import stacker, destacker, integrate_snapshots
+from core_classes import Mass, SimulationConfig
+from plot_functions import SnapshotRenderer, plotter, tidal_length_against_time
+from trajectory_functions import TrajectoryStore
+from checkpoint_functions import save_checkpoint, load_checkpoint
+from diagnostic_functions import ConservationLog
+from analysis_functions import analyse_snapshot
+from profiling_functions import Profiler, peak_memory
 import time
-from global_constants import *
-np.warnings.filterwarnings('ignore', category=np.VisibleDeprecationWarning)
 """
-Script with different intial conditions used to produce the tidal tail results. 
-Changes to the initial conditions made in global_constants.py
+Script with different intial conditions used to produce the tidal tail results.
+Changes to the initial conditions made in global_constants.py, which give the SimulationConfig of the run
+
+A checkpoint is written to CHECKPOINT_FILE every CHECKPOINT_INTERVAL snapshots, and the drift of the energy and
+momenta after every step is written to CONSERVATION_LOG. With PROFILE set the counters and timers of each snapshot
+are printed and kept in the diagnostics. With PLOT set to False no images are made, for batch jobs without a display.
+With PARALLEL set the test masses are integrated on NUMBER_OF_WORKERS processes, see parallel_functions.py.
+Run with --resume to continue from the last checkpoint instead of starting again, or see run_cli.py for the settings
+of a run from a config file and flags.
 """
 
 
 
 
-#generate the arrays of objects:
-massive_objects = [Mass([0,0,0], [0, 0, 0], 1), Mass(GALAXY_POSITION, GALAXY_VELOCITY, GALAXY_MASS)]
-massive_objects[0].generate_test_masses()
+def run(massive_objects, trajectory, first_snapshot = 0, config = None, diagnostics = None, integrator_state = None, renderer = None):
+    """
+    Integrates massive_objects from snapshot first_snapshot to config.number_of_snapshots, plotting, storing and checkpointing each snapshot.
+    The integrator runs continuously over all the snapshots, see core_functions.integrate_snapshots().
+
+    Keyword arguments:
+    massive_objects -- array of class Mass
+    trajectory -- TrajectoryStore, each snapshot is appended to it
+    first_snapshot -- int, number of snapshots already completed (default 0)
+    config -- SimulationConfig, settings of the run (default None, the values in global_constants.py)
+    diagnostics -- dict, sim_time, length_of_tidal_tail, closest_approach, snapshot_summaries (and profile_reports, if profiling)
+                   collected so far (default None, a new run)
+    integrator_state -- dict, state of the integrator to continue from, from a checkpoint (default None, a new run)
+    renderer -- SnapshotRenderer, renders the image of each snapshot (default None, one made from config and closed at the end,
+                if config.plot)
 
+    Return value:
+    diagnostics -- dict, as above, for the whole run
+    """
+    if config is None:
+        config = SimulationConfig()
+    if renderer is None and config.plot:
+        with snapshot_renderer(config) as renderer:
+            return run(massive_objects, trajectory, first_snapshot, config, diagnostics, integrator_state, renderer)
+    if diagnostics is None:
+        diagnostics = {"sim_time": [], #array to store the values of time in the simulation
+                       "length_of_tidal_tail": [], #array to store the average length of the tidal tail
+                       "closest_approach": 100, #float to store value fo closest approach
+                       "snapshot_summaries": []} #array of the summary of each snapshot, see analysis_functions.analyse_snapshot()
+    delta_time = config.delta_time
 
+    profiler = None
+    timer = lambda name: contextlib.nullcontext()
+    if config.profile:
+        profiler = Profiler(config.profile_trace_file, config.profile_memory)
+        timer = profiler.timer
 
-start = time.time() #timing the run
+    #main integration steps, the integrator yields each snapshot in turn
+    with timer("marshalling"):
+        (stack, stack_layout, masses) = stacker(massive_objects)
+    snapshot_times = delta_time*np.arange(first_snapshot + 1, config.number_of_snapshots + 1)
+    conservation_log = None
+    if config.conservation_log is not None:
+        conservation_log = ConservationLog(config.conservation_log, stack_layout, masses, config,
+                                           resume_time = delta_time*first_snapshot if first_snapshot > 0 else None)
+        if first_snapshot == 0:
+            conservation_log.record(0, stack)
+    step_callback = None
+    if conservation_log is not None:
+        step_callback = conservation_log.record if profiler is None else profiler.timed("conservation", conservation_log.record)
+    snapshots = integrate_snapshots(stack, stack_layout, masses, delta_time*first_snapshot, snapshot_times,
+                                    integrator_state = integrator_state, config = config, step_callback = step_callback, profiler = profiler)
 
-plotter(massive_objects, 0) #plot initial condition
+    for (i, (snapshot_time, snapshot_stack, integrator_state)) in enumerate(snapshots, first_snapshot):
+        print("Calculating snapshot number: " + str(i))
 
-sim_time = [] #array to store the values of time in the simulation
-length_of_tidal_tail = [] #array to store the average length of the tidal tail
-closest_approach = 100 #float to store value fo closest approach
+        with timer("marshalling"):
+            destacker(snapshot_stack, stack_layout, massive_objects)
+        with timer("storage"):
+            trajectory.append(delta_time*(i+1), snapshot_stack)
 
 
 
-for i in range(NUMBER_OF_SNAPSHOTS):
-    print("Calculating snapshot number: " + str(i))
+        if renderer is not None:
+            with timer("plotting"):
+                renderer.submit(massive_objects, delta_time*(i+1)) #produces snapshot image of system in the background
+        diagnostics["sim_time"].append(delta_time*(i+1))
 
-    #main integration steps
-    (stack, stack_info, masses) = stacker(massive_objects)
-    result = integrate(stack, stack_info, masses, 0, DELTA_TIME)
-    destacker(result.y[:, -1], stack_info, massive_objects)
 
+        #classifies the test masses, finding those in the tidal tail and their average distance from galaxy centre
+        with timer("analysis"):
+            (classes, summary) = analyse_snapshot(snapshot_stack, stack_layout, masses, config)
+        diagnostics["snapshot_summaries"].append(summary)
+        diagnostics["length_of_tidal_tail"].append(summary["length_of_tidal_tail"])
 
+        #checks approach of the perturbing system, and records the closest distance only.
+        if diagnostics["closest_approach"] > summary["separation"]:
+            diagnostics["closest_approach"] = summary["separation"]
 
-    plotter(massive_objects, DELTA_TIME*(i+1)) #produces snapshot image of system
-    sim_time.append(DELTA_TIME*(i+1))
-    
 
-    #checks approach of the perturbing system, and records the closest distance only.
-    approach = np.linalg.norm(af.distance(massive_objects[0].position, massive_objects[1].position))
-    if closest_approach > approach:
-        closest_approach = approach
-    
-    #finds massses in tidal tail and their average distance from galaxy centre
-    distances_of_masses_in_tail = [] #temporary storage for distances 
-    for i in range(massive_objects[0].number_of_test_masses):
-        distance = np.linalg.norm(af.distance(massive_objects[0].position, massive_objects[0].test_masses[i].position))
-        if 10 < distance: 
-            #exlude captured masses
-            if 10 < np.linalg.norm(af.distance(massive_objects[1].position, massive_objects[0].test_masses[i].position)):
-                distances_of_masses_in_tail.append(distance)
-    if len(distances_of_masses_in_tail) == 0: #catches cases where there is no tail
-        length_of_tidal_tail.append(0)
-    else:
-        length_of_tidal_tail.append(np.mean(distances_of_masses_in_tail)) #appends average length for this time
+        if profiler is not None:
+            profile_report = profiler.snapshot_report(i, delta_time*(i+1))
+            diagnostics.setdefault("profile_reports", []).append(profile_report)
+            print(", ".join(name + ": " + str(value) for (name, value) in profile_report.items()))
+
+        if (i+1) % config.checkpoint_interval == 0 or i+1 == config.number_of_snapshots:
+            save_checkpoint(config.checkpoint_file, massive_objects, delta_time*(i+1), i+1, config.as_dict(), diagnostics, integrator_state)
+
+    if conservation_log is not None:
+        print("The relative drift in the energy of the massive objects was: " + str(conservation_log.last_drift["massive_object_energy"]))
+        conservation_log.close()
+    if profiler is not None:
+        profiler.close()
+    if peak_memory() is not None:
+        print("The peak memory of the run was: " + "{:.1f}".format(peak_memory()/2**20) + " MB")
+
+
+    return diagnostics
+
 
 
 
+def snapshot_renderer(config):
+    """Returns a SnapshotRenderer with the settings of config"""
+    return SnapshotRenderer(config.render_workers, config.render_queue_size, config.plot_dpi, config.plot_format)
 
-end = time.time() #stop timing
-time_difference = end - start #subtracting two floats, caution
-print("The results were produced in: " + str(time_difference) + " seconds")
 
 
 
-print("The closest approach was: " + str(closest_approach))
+def report(massive_objects, diagnostics, config = None):
+    """Prints and plots the results of a completed run"""
+    if config is None:
+        config = SimulationConfig()
+    print("The closest approach was: " + str(diagnostics["closest_approach"]))
 
 
-#creates tidal length plot
-tidal_length_against_time(length_of_tidal_tail, sim_time)
-#excludes early on snapshots from mean
-print("The mean tidal tail length was: " + str(np.mean(length_of_tidal_tail[10:])))
+    #creates tidal length plot
+    if config.plot:
+        tidal_length_against_time(diagnostics["length_of_tidal_tail"], diagnostics["sim_time"])
+    #excludes early on snapshots from mean
+    print("The mean tidal tail length was: " + str(np.mean(diagnostics["length_of_tidal_tail"][10:])))
 
 
 
-#The following code is to obtain an estimate of the number of capture masses by the perturbing galaxy.
-count = 0
-for i in range(massive_objects[0].number_of_test_masses):
-    if 10 > np.linalg.norm(af.distance(massive_objects[1].position, massive_objects[0].test_masses[i].position)):
-        count += 1 
-fraction = count / massive_objects[0].number_of_test_masses
+    #The following code is to obtain an estimate of the number of capture masses by the perturbing galaxy.
+    (stack, stack_layout, masses) = stacker(massive_objects)
+    (classes, summary) = analyse_snapshot(stack, stack_layout, masses, config)
+    count = summary["within_capture_distance"]
+    fraction = count / stack_layout.number_of_test_masses
 
 
-print(str(count) + " test masses were captured by the perturbing galaxy, " + str(fraction) + " of the total")
+    print(str(count) + " test masses were captured by the perturbing galaxy, " + str(fraction) + " of the total")
+    print(str(summary["captured"]) + " of them are bound to it, " + str(summary["bridge"]) + " test masses are in the bridge and "
+          + str(summary["tail"]) + " in the tail, " + str(summary["host"]) + " remain bound to the host galaxy")
 
+    return None
 
 
 
 
+def main(config = None, resume = False):
+    """
+    Runs a simulation from the start, or from the last checkpoint, and reports the results
+
+    Keyword arguments:
+    config -- SimulationConfig, settings of the run, when resuming only its checkpoint_file is used and the rest come
+              from the checkpoint (default None, the values in global_constants.py)
+    resume -- bool, continue from the last checkpoint in config.checkpoint_file, discarding any snapshots stored after it (default False)
+
+    Return values:
+    massive_objects -- array of class Mass, at the end of the run
+    diagnostics -- dict, see run()
+    """
+    if config is None:
+        config = SimulationConfig()
+    if np.dtype(config.test_mass_dtype) != float:
+        raise ValueError("run_main.py integrates a float64 stack, so test_mass_dtype must be float64, not " + str(config.test_mass_dtype))
+    if config.number_of_snapshots < 1:
+        raise ValueError("number_of_snapshots must be at least 1, not " + str(config.number_of_snapshots))
+    start = time.time() #timing the run
+
+    if resume:
+        (massive_objects, sim_time, first_snapshot, settings, diagnostics, integrator_state) = load_checkpoint(config.checkpoint_file)
+        config = SimulationConfig.from_dict(settings)
+        trajectory = TrajectoryStore(config.trajectory_directory)
+        trajectory.truncate(first_snapshot + 1)
+        print("Resuming from snapshot " + str(first_snapshot) + " at time " + str(sim_time))
+    else:
+        #generate the arrays of objects:
+        massive_objects = [Mass([0,0,0], [0, 0, 0], 1), Mass(config.galaxy_position, config.galaxy_velocity, config.galaxy_mass)]
+        massive_objects[0].generate_test_masses(config = config)
+
+        if config.plot:
+            plotter(massive_objects, 0, config.plot_dpi, config.plot_format) #plot initial condition
+        trajectory = TrajectoryStore.create(config.trajectory_directory, massive_objects, config) #stores every snapshot on disk
+        trajectory.append(0, stacker(massive_objects)[0])
+        (first_snapshot, diagnostics, integrator_state) = (0, None, None)
+
+    if first_snapshot < config.number_of_snapshots:
+        diagnostics = run(massive_objects, trajectory, first_snapshot, config, diagnostics, integrator_state)
+    else:
+        print("The run was already complete")
+
 
 
+    end = time.time() #stop timing
+    time_difference = end - start #subtracting two floats, caution
+    print("The results were produced in: " + str(time_difference) + " seconds")
 
+    report(massive_objects, diagnostics, config)
 
-#def run(n): 
+    return (massive_objects, diagnostics)
 
 
-#n = range(1, 50)
-#times = [run(i) for i in n]
 
-#plot_order(n, times)
 
+if __name__ == "__main__":
+    main(resume = "--resume" in sys.argv)
@@ -3,15 +3,54 @@ import accessory_functions as af
 import core_functions as cf
 from core_classes import *
 import plot_functions as pf
+import diagnostic_functions as dg
 from global_constants import *
 import time
-from pympler.tracker import SummaryTracker
-tracker = SummaryTracker()
+from profiling_functions import Profiler
+profiler = Profiler() #counts and times the calls of the integrator, much cheaper than tracking every object in memory
 
-np.warnings.filterwarnings('ignore', category=np.VisibleDeprecationWarning)
 """Script to check the stability and performance of the program""" 
 
 
+#Check the compiled and NumPy force backends agree, with softening, on random positions:
+random_generator = np.random.default_rng(0)
+backend_positions = random_generator.normal(size = (205, 3))
+backend_masses = random_generator.uniform(0.5, 1.5, 5)
+backend_config = SimulationConfig(softening_length = 0.1)
+for (numpy_function, jit_function) in zip(cf.FORCE_BACKENDS["numpy"], cf.FORCE_BACKENDS["jit"]):
+    if numpy_function is cf.massive_object_accelerations:
+        arguments = (backend_positions[:5], backend_masses, backend_config)
+    else:
+        arguments = (backend_positions[5:], backend_positions[:5], backend_masses, backend_config)
+    np.testing.assert_allclose(jit_function(*arguments), numpy_function(*arguments), rtol = 1e-12, atol = 1e-12)
+print("The jit and numpy force backends agree (Numba available: " + str(cf.kf.NUMBA_AVAILABLE) + ")")
+
+
+#Check snapshots falling inside one solver step don't depend on destacker() writing to the objects between them:
+snapshot_config = SimulationConfig(delta_time = 1e-5, step_size = 0.1)
+snapshot_results = []
+for write_objects in [False, True]:
+    snapshot_objects = [Mass([0,0,0], [0,0,0], 1), Mass(GALAXY_POSITION, GALAXY_VELOCITY, GALAXY_MASS)]
+    snapshot_objects[0].generate_test_masses()
+    (stack, stack_layout, masses) = cf.stacker(snapshot_objects)
+    snapshot_stacks = []
+    for (snapshot_time, snapshot_stack, integrator_state) in cf.integrate_snapshots(stack, stack_layout, masses, 0, 1e-5*np.arange(1, 6),
+                                                                                    method = "RK45", config = snapshot_config):
+        snapshot_stacks.append(np.concatenate((snapshot_stack, integrator_state["stack"])))
+        if write_objects:
+            cf.destacker(snapshot_stack, stack_layout, snapshot_objects)
+    snapshot_results.append(snapshot_stacks)
+np.testing.assert_array_equal(snapshot_results[1], snapshot_results[0])
+print("Snapshots within one step don't depend on the objects being written between them")
+
+
+#Check the error of float32 test masses against float64 over one snapshot:
+single_precision_config = SimulationConfig(test_mass_dtype = "float32")
+single_precision_objects = [Mass([0,0,0], [0,0,0], 1), Mass(GALAXY_POSITION, GALAXY_VELOCITY, GALAXY_MASS)]
+single_precision_objects[0].generate_test_masses(config = single_precision_config)
+print("The float32 error bound over one snapshot is: " + str(dg.precision_error(single_precision_objects, 0, DELTA_TIME, config = single_precision_config)))
+
+
 #Check stability of orbits of test masses:
 massive_objects = [Mass([0,0,0], [0,0,0], 1)]
 massive_objects[0].generate_test_masses()
@@ -28,9 +67,9 @@ for i in range(NUMBER_OF_SNAPSHOTS):
     print("Calculating snapshot number: " + str(i))
 
     #main integration method
-    (stack, stack_info, masses) = cf.stacker(massive_objects)
-    result = cf.integrate(stack, stack_info, masses, 0, DELTA_TIME)
-    cf.destacker(result.y[:, -1], stack_info, massive_objects)
+    (stack, stack_layout, masses) = cf.stacker(massive_objects)
+    result = cf.integrate(stack, stack_layout, masses, 0, DELTA_TIME, profiler = profiler, output_times = [DELTA_TIME]) #only the final stack is kept
+    cf.destacker(result.y[:, -1], stack_layout, massive_objects)
 
 
     if result.success == 1: #checks if integration method worked correctly
@@ -52,7 +91,7 @@ for i in range(NUMBER_OF_SNAPSHOTS):
             time_period = sim_time[i+1]
         else:
             time_period_found = True
-    tracker.print_diff() #outputs the difference in objects in memory since last call
+    print(profiler.snapshot_report(i, DELTA_TIME*(i+1))) #outputs the calls, time and peak memory since last call
 
 end = time.time() #stop timing
 
@@ -86,9 +125,9 @@ pf.plotter(massive_objects, 0) #plot initial positions
 for i in range(NUMBER_OF_SNAPSHOTS):
     
 
-    (stack, stack_info, masses) = cf.stacker(massive_objects)
-    result = cf.integrate(stack, stack_info, masses, 0, DELTA_TIME)
-    cf.destacker(result.y[:, -1], stack_info, massive_objects)
+    (stack, stack_layout, masses) = cf.stacker(massive_objects)
+    result = cf.integrate(stack, stack_layout, masses, 0, DELTA_TIME, output_times = [DELTA_TIME])
+    cf.destacker(result.y[:, -1], stack_layout, massive_objects)
 
 
     if result.success == 1: #checks if integration method worked correctly
@@ -0,0 +1,232 @@
+import os
+import csv
+import json
+import hashlib
+import itertools
+import concurrent.futures
+import numpy as np
+import disc_cache_functions as dc
+import core_functions as cf
+import analysis_functions as an
+from core_classes import Mass, ParticleStore, SimulationConfig
+"""
+Methods for running many encounters between the galaxy of run_main.py and perturbing galaxies with different
+initial conditions, and collecting the results in one table.
+
+The disc of test masses around the central galaxy is generated once (or loaded from the disc cache, see
+disc_cache_functions.py) and shared by every encounter. The encounters
+are run on a pool of processes, and the result of each is saved in cache_directory as soon as it finishes, so a sweep
+that is stopped and started again only runs the encounters it hasn't finished. Results are cached under a hash of
+the initial condition and of the parameters of the SimulationConfig that change the result (RESULT_PARAMETERS), so
+changing the config never reuses a stale result, while changing e.g. the plotting settings keeps the cached results.
+
+Methods:
+
+    encounter_grid(float[][], float[][], float[]) --> dict[] (No side-effects)
+
+    run_encounter(dict, (float[][], float[][]), SimulationConfig) --> dict (No side-effects)
+
+    sweep(dict[], string, int, SimulationConfig) --> dict[] (Side-effects: writes files in cache_directory)
+
+    write_results_table(dict[], string) --> None (Side-effects: writes a CSV file)
+
+"""
+
+#columns of the results table
+RESULT_COLUMNS = ["position", "velocity", "mass", "closest_approach", "mean_tidal_tail_length", "captured_fraction",
+                  "bound_captured_fraction", "bridge_fraction"]
+
+#mass of the central galaxy, as in run_main.py
+HOST_MASS = 1
+
+#parameters of the SimulationConfig that change the result of an encounter, the only ones its cached result is keyed by,
+#so changing e.g. the plotting, profiling or output files doesn't run the encounters again
+RESULT_PARAMETERS = ["step_size", "number_of_snapshots", "delta_time", "gravitational_constant", "integration_method", "derivatives",
+                     "force_backend", "block_maximum_step", "block_maximum_level", "block_accuracy", "number_of_masses_per_unit_radius",
+                     "minimum_radius", "ring_spacing", "number_of_rings", "tail_distance", "opening_angle", "softening_length",
+                     "mesh_size", "mesh_padding", "parallel", "parallel_chunk_size"]
+
+
+
+
+def encounter_grid(positions, velocities, masses):
+    """
+    Makes a list of initial conditions of the perturbing galaxy from every combination of the given values
+
+    Keyword arguments:
+    positions -- array of [x, y, z], initial positions
+    velocities -- array of [vx, vy, vz], initial velocities
+    masses -- array of floats, masses
+
+    Return value:
+    -- array of dicts with keys "position", "velocity" and "mass"
+    """
+
+    return [{"position": list(map(float, position)), "velocity": list(map(float, velocity)), "mass": float(mass)}
+            for (position, velocity, mass) in itertools.product(positions, velocities, masses)]
+
+
+
+
+
+
+def _generate_disc(config):
+    """Returns the positions and velocities of the disc of test masses described by config, from the disc cache if it is there"""
+    return dc.cached_disc(config.disc_cache_directory, config.disc_cache_size, HOST_MASS, config.number_of_rings, config.ring_spacing,
+                          config.minimum_radius, config.number_of_masses_per_unit_radius, gravitational_constant = config.gravitational_constant)
+
+
+
+
+
+
+def run_encounter(initial_condition, disc, config):
+    """
+    Runs one encounter and measures the same quantities as run_main.py
+
+    Keyword arguments:
+    initial_condition -- dict, "position", "velocity" and "mass" of the perturbing galaxy
+    disc -- (positions, velocities) of the test masses around the central galaxy, which is at rest at the origin
+    config -- SimulationConfig, the integrator, step size, delta_time and number_of_snapshots (at least 1) of the encounter
+
+    Return value:
+    -- dict, initial_condition with closest_approach, mean_tidal_tail_length (None with 10 snapshots or fewer), captured_fraction
+       (within tail_distance of the perturber), bound_captured_fraction and bridge_fraction (see analysis_functions.py) added
+    """
+    #the results are measured on the snapshots, so there must be at least one
+    if config.number_of_snapshots < 1:
+        raise ValueError("number_of_snapshots must be at least 1, not " + str(config.number_of_snapshots))
+    massive_objects = [Mass([0, 0, 0], [0, 0, 0], HOST_MASS),
+                       Mass(initial_condition["position"], initial_condition["velocity"], initial_condition["mass"])]
+    massive_objects[0].test_masses = ParticleStore.from_arrays(disc[0], disc[1])
+
+    (stack, stack_layout, masses) = cf.stacker(massive_objects)
+    delta_time = config.delta_time
+    snapshot_times = delta_time*np.arange(1, config.number_of_snapshots + 1)
+
+    closest_approach = 100
+    length_of_tidal_tail = []
+    for (snapshot_time, snapshot_stack, integrator_state) in cf.integrate_snapshots(stack, stack_layout, masses, 0, snapshot_times, config = config):
+        (classes, summary) = an.analyse_snapshot(snapshot_stack, stack_layout, masses, config)
+        closest_approach = min(closest_approach, summary["separation"])
+        length_of_tidal_tail.append(summary["length_of_tidal_tail"])
+
+    result = dict(initial_condition)
+    result["closest_approach"] = closest_approach
+    #excludes early on snapshots from mean, as in run_main.py, None (null in the cache) when there are too few snapshots
+    result["mean_tidal_tail_length"] = float(np.mean(length_of_tidal_tail[10:])) if len(length_of_tidal_tail) > 10 else None
+    number_of_test_masses = stack_layout.number_of_test_masses
+    result["captured_fraction"] = summary["within_capture_distance"]/number_of_test_masses if number_of_test_masses > 0 else 0.0
+    result["bound_captured_fraction"] = summary["captured_fraction"]
+    result["bridge_fraction"] = summary["bridge_fraction"]
+
+
+    return result
+
+
+
+
+
+
+_worker_disc = None
+
+
+def _initialise_worker(positions, velocities):
+    """Keeps the shared disc in each worker process, so it is sent once per worker rather than once per encounter"""
+    global _worker_disc
+    _worker_disc = (positions, velocities)
+
+
+def _run_cached_encounter(arguments):
+    """Worker process: runs an encounter with the shared disc and saves its result in the cache"""
+    (initial_condition, config, cache_file_name) = arguments
+    result = run_encounter(initial_condition, _worker_disc, config)
+    _write_json(cache_file_name, result)
+    return result
+
+
+def _write_json(file_name, contents):
+    """Writes contents to file_name as JSON, atomically, raising ValueError rather than writing NaN or infinity, which aren't JSON"""
+    with open(file_name + ".tmp", "w") as json_file:
+        json.dump(contents, json_file, allow_nan = False)
+    os.replace(file_name + ".tmp", file_name)
+
+
+def _cache_file_name(cache_directory, initial_condition, config):
+    """Returns the file caching the result of an encounter, named by a hash of its initial condition and the RESULT_PARAMETERS of config"""
+    key = json.dumps({"initial_condition": initial_condition, "config": config.config_hash(RESULT_PARAMETERS), "host_mass": HOST_MASS}, sort_keys = True)
+    return os.path.join(cache_directory, hashlib.sha1(key.encode()).hexdigest() + ".json")
+
+
+
+
+
+
+def sweep(initial_conditions, cache_directory = "sweep_cache", number_of_workers = None, config = None):
+    """
+    Runs an encounter for each initial condition, in parallel, skipping any whose result is already cached
+
+    Keyword arguments:
+    initial_conditions -- array of dicts, "position", "velocity" and "mass" of the perturbing galaxy, see encounter_grid()
+    cache_directory -- string, directory in which the result of each encounter is saved (default "sweep_cache")
+    number_of_workers -- int, number of processes, 1 runs every encounter in this process (default None, the number of CPUs)
+    config -- SimulationConfig, integration and disc settings (default None, the values in global_constants.py)
+
+    Return value:
+    results -- array of dicts, one per initial condition in the same order, see run_encounter()
+    """
+    if config is None:
+        config = SimulationConfig()
+    if number_of_workers is None:
+        number_of_workers = os.cpu_count()
+    os.makedirs(cache_directory, exist_ok = True)
+
+    results = [None]*len(initial_conditions)
+    to_run = []
+    for (i, initial_condition) in enumerate(initial_conditions):
+        cache_file_name = _cache_file_name(cache_directory, initial_condition, config)
+        if os.path.exists(cache_file_name):
+            with open(cache_file_name) as cache_file:
+                results[i] = json.load(cache_file)
+        else:
+            to_run.append((i, (initial_condition, config, cache_file_name)))
+
+    if len(to_run) > 0:
+        (positions, velocities) = _generate_disc(config)
+        if number_of_workers <= 1:
+            _initialise_worker(positions, velocities)
+            for (i, arguments) in to_run:
+                results[i] = _run_cached_encounter(arguments)
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers = number_of_workers, initializer = _initialise_worker,
+                                                        initargs = (positions, velocities)) as executor:
+                futures = {executor.submit(_run_cached_encounter, arguments): i for (i, arguments) in to_run}
+                for future in concurrent.futures.as_completed(futures):
+                    results[futures[future]] = future.result()
+
+    write_results_table(results, os.path.join(cache_directory, "results.csv"))
+
+
+    return results
+
+
+
+
+
+
+def write_results_table(results, file_name):
+    """
+    Writes the results of a sweep as a CSV file, one row per encounter
+
+    Keyword arguments:
+    results -- array of dicts, see run_encounter()
+    file_name -- string
+    """
+
+    with open(file_name, "w", newline = "") as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames = RESULT_COLUMNS)
+        writer.writeheader()
+        for result in results:
+            writer.writerow({column: result[column] for column in RESULT_COLUMNS})
+
+    return None
@@ -0,0 +1,249 @@
+import numpy as np
+from core_classes import SimulationConfig
+"""
+Hierarchical block timestep integrator, so a few test masses in a close encounter don't set the step of the whole system.
+
+Time is split into blocks of at most config.block_maximum_step, and each block into power-of-two bins: a test mass
+in bin k steps by block_step/2^k, down to bin config.block_maximum_level. Each test mass chooses its bin at the end
+of every one of its steps from its acceleration a and jerk j (the rate of change of a), taking the largest bin step
+no longer than config.block_accuracy*|a|/|j|, and may only move to a coarser bin when the current time is a whole
+number of the coarser steps, so the bins stay in step with each other.
+
+A step is a kick-drift-kick leapfrog step: the closing half kick of one step and the opening half kick of the next
+are both made at the end of the step, with the accelerations found there. The test masses have no mass, so a test mass
+between the ends of its steps isn't needed by anything else and is drifted over its whole step at once, and at each
+time only the bins whose steps end then (the active bins) have their accelerations found. The massive objects are
+few, so they are stepped with the smallest step of any bin (and no longer than their own step, chosen at the start of
+each block), and are known at every time the test masses need them.
+
+The cost of a block is then roughly the number of test masses in each bin times the number of steps of that bin,
+rather than the number of test masses times the number of steps of the smallest bin. At the end of every block
+every test mass is at the same time, which is where the state can be read.
+
+Methods:
+
+    test_mass_jerks(float[][], float[][], float[], SimulationConfig) --> float[][] (No side-effects)
+
+    massive_object_jerks(float[][], float[], SimulationConfig) --> float[][] (No side-effects)
+
+"""
+
+
+
+
+
+def test_mass_jerks(test_mass_state, massive_object_state, masses, config = None):
+    """
+    Finds the jerk (the time derivative of the softened acceleration) of each test mass due to the massive objects
+
+    Keyword arguments:
+    test_mass_state -- 2D array of floats, [x y z vx vy vz] of each test mass
+    massive_object_state -- 2D array of floats, [x y z vx vy vz] of each massive object
+    masses -- array of floats, masses of each of the massive_objects
+    config -- SimulationConfig, gives the gravitational_constant and softening_length (default None, the values in global_constants.py)
+
+    Return value:
+    jerks -- 2D array of floats, [ x y z, ...] the jerk of each test mass
+    """
+    if config is None:
+        config = SimulationConfig()
+    jerks = np.zeros((len(test_mass_state), 3))
+
+    #loop over the (few) massive objects, every test mass is handled at once
+    for i in range(len(masses)):
+        r_vectors = massive_object_state[i, 0:3] - test_mass_state[:, 0:3]
+        v_vectors = massive_object_state[i, 3:6] - test_mass_state[:, 3:6]
+        jerks += _pair_jerks(r_vectors, v_vectors, config.gravitational_constant*masses[i], config.softening_length**2)
+
+
+    return jerks
+
+
+def massive_object_jerks(massive_object_state, masses, config = None):
+    """
+    Finds the jerk of each massive object due to all the others, see test_mass_jerks()
+
+    Keyword arguments:
+    massive_object_state -- 2D array of floats, [x y z vx vy vz] of each massive object
+    masses -- array of floats, masses of each of the massive_objects
+    config -- SimulationConfig (default None, the values in global_constants.py)
+
+    Return value:
+    jerks -- 2D array of floats, [ x y z, ...] the jerk of each massive object
+    """
+    if config is None:
+        config = SimulationConfig()
+    jerks = np.zeros((len(massive_object_state), 3))
+
+    for i in range(len(masses)):
+        others = np.arange(len(masses)) != i #so the mass doesn't act on itself
+        r_vectors = massive_object_state[i, 0:3] - massive_object_state[others, 0:3]
+        v_vectors = massive_object_state[i, 3:6] - massive_object_state[others, 3:6]
+        jerks[others] += _pair_jerks(r_vectors, v_vectors, config.gravitational_constant*masses[i], config.softening_length**2)
+
+
+    return jerks
+
+
+def _pair_jerks(r_vectors, v_vectors, gravitational_parameter, softening_squared):
+    """Returns the jerks due to a mass with gravitational_parameter G m at separations r_vectors, moving at v_vectors relative to them"""
+    distances_squared = np.einsum("ij,ij->i", r_vectors, r_vectors) + softening_squared
+    inverse_distances_cubed = gravitational_parameter/(distances_squared*np.sqrt(distances_squared))
+    radial_speeds = np.einsum("ij,ij->i", r_vectors, v_vectors)/distances_squared
+    return inverse_distances_cubed[:, np.newaxis]*(v_vectors - 3*radial_speeds[:, np.newaxis]*r_vectors)
+
+
+
+
+
+
+class BlockTimestepIntegrator:
+    """
+    Class advancing a state with block timesteps, see the description at the top of this file
+
+    Attributes
+    ---------
+    state : float[][]
+        [x y z vx vy vz] of each massive object then each test mass, in the order of a stack, advanced in place
+    time : float
+        time of state
+    number_of_evaluations : int
+        number of calls to the acceleration functions
+    number_of_test_mass_evaluations : int
+        total number of accelerations of test masses found, the measure of the cost for many test masses
+    bin_counts : int[]
+        number of test masses in each bin at the start of the last block
+
+    Methods
+    ------
+    __init__(float[][], int, float[], float, (function, function), SimulationConfig, function, Profiler) --> None (Side-effects: finds the accelerations)
+
+    advance(float) --> None (Side-effects: advances state to the given time)
+    """
+
+
+    def __init__(self, state, number_of_massive_objects, masses, time, acceleration_functions, config = None, step_callback = None, profiler = None):
+        """
+        Keyword arguments:
+        state -- 2D array of floats, advanced in place, see the attributes
+        number_of_massive_objects -- int, number of rows of state that are massive objects
+        masses -- array of floats, masses of each of the massive_objects
+        time -- float, time of state
+        acceleration_functions -- (function, function), the accelerations of the massive objects and of the test masses,
+                                  as in core_functions.FORCE_BACKENDS
+        config -- SimulationConfig, gives the block_maximum_step, block_maximum_level and block_accuracy (default None, the values in global_constants.py)
+        step_callback -- function(float, float[]), called with the time and flattened state at the end of every block (default None)
+        profiler -- Profiler, counts the steps and the test masses in them (default None)
+        """
+        if config is None:
+            config = SimulationConfig()
+
+        self.state = state
+        self.number_of_massive_objects = number_of_massive_objects
+        self.masses = np.asarray(masses, dtype = float)
+        self.time = time
+        (self.massive_object_function, self.test_mass_function) = acceleration_functions
+        self.config = config
+        self.step_callback = step_callback
+        self.profiler = profiler
+
+        self.massive_object_state = state[:number_of_massive_objects]
+        self.test_mass_state = state[number_of_massive_objects:]
+        self.massive_object_accelerations = self.massive_object_function(self.massive_object_state[:, 0:3], self.masses, config)
+        self.test_mass_accelerations = self.test_mass_function(self.test_mass_state[:, 0:3], self.massive_object_state[:, 0:3], self.masses, config)
+        self.number_of_evaluations = 2
+        self.number_of_test_mass_evaluations = len(self.test_mass_state)
+        self.bin_counts = np.zeros(config.block_maximum_level + 1, dtype = int)
+
+        return None
+
+    def advance(self, end_time):
+        """Advances state to end_time, in equal blocks no longer than config.block_maximum_step"""
+        interval = end_time - self.time
+        number_of_blocks = max(1, int(np.ceil(np.round(interval/self.config.block_maximum_step, 9))))
+        start_time = self.time
+        for block in range(number_of_blocks):
+            self._block(interval/number_of_blocks)
+            #time of each block found from the start, so the error doesn't build up
+            self.time = start_time + interval*(block + 1)/number_of_blocks
+            if self.step_callback is not None:
+                self.step_callback(self.time, self.state.reshape(-1))
+        self.time = end_time
+
+        return None
+
+    def _levels(self, accelerations, jerks, block_step, coarsest_level):
+        """Returns the bin of each object from its accelerations and jerks, no coarser than coarsest_level"""
+        acceleration_sizes = np.sqrt(np.einsum("ij,ij->i", accelerations, accelerations))
+        jerk_sizes = np.sqrt(np.einsum("ij,ij->i", jerks, jerks))
+        #block_step over the chosen step, with no jerk the step is only limited by the block
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            ratios = np.where(jerk_sizes > 0, block_step*jerk_sizes/(self.config.block_accuracy*acceleration_sizes), 0)
+        levels = np.ceil(np.log2(np.maximum(ratios, 1)))
+        return np.minimum(np.maximum(levels, coarsest_level), self.config.block_maximum_level).astype(int)
+
+    def _massive_object_step(self, step):
+        """Advances the massive objects by one kick-drift-kick step"""
+        velocities = self.massive_object_state[:, 3:6]
+        velocities += 0.5*step*self.massive_object_accelerations
+        self.massive_object_state[:, 0:3] += step*velocities
+        self.massive_object_accelerations = self.massive_object_function(self.massive_object_state[:, 0:3], self.masses, self.config)
+        velocities += 0.5*step*self.massive_object_accelerations
+        self.number_of_evaluations += 1
+
+    def _block(self, block_step):
+        """Advances state by one block of length block_step, at the end of which every object is at the same time"""
+        maximum_level = self.config.block_maximum_level
+        ticks_per_block = 2**maximum_level
+        tick_time = block_step/ticks_per_block #the smallest step, every step is a whole number of ticks
+        test_mass_velocities = self.test_mass_state[:, 3:6]
+        half_steps = np.zeros(len(self.test_mass_state)) #half of the step each test mass is in the middle of
+        bins = [np.empty(0, dtype = int) for level in range(maximum_level + 1)] #indices of the test masses in each bin
+        #the massive objects move slowly, so their step is chosen once per block
+        massive_object_level = 0
+        if len(self.masses) > 0:
+            massive_object_jerks_now = massive_object_jerks(self.massive_object_state, self.masses, self.config)
+            massive_object_level = int(np.max(self._levels(self.massive_object_accelerations, massive_object_jerks_now, block_step, 0)))
+
+        (tick, active, active_level) = (0, np.arange(len(self.test_mass_state)), 0)
+        while True:
+            #the active test masses and the massive objects are all at tick, with known accelerations
+            accelerations = self.test_mass_accelerations[active]
+            test_mass_velocities[active] += accelerations*half_steps[active, np.newaxis] #closing half kick
+            if tick == ticks_per_block:
+                break
+
+            #new bins of the active test masses, which can only move to bins that are active at tick
+            active_state = self.test_mass_state[active]
+            levels = self._levels(accelerations, test_mass_jerks(active_state, self.massive_object_state, self.masses, self.config), block_step, active_level)
+            order = np.argsort(levels, kind = "stable")
+            boundaries = np.searchsorted(levels[order], np.arange(active_level, maximum_level + 2))
+            for level in range(active_level, maximum_level + 1):
+                bins[level] = active[order[boundaries[level - active_level]:boundaries[level - active_level + 1]]]
+            if tick == 0:
+                self.bin_counts = np.array([len(indices) for indices in bins])
+            #opening half kick, then drift over the whole step as nothing needs the test mass before its end
+            half_steps[active] = 0.5*tick_time*2.0**(maximum_level - levels)
+            test_mass_velocities[active] += accelerations*half_steps[active, np.newaxis]
+            self.test_mass_state[active, 0:3] += 2*half_steps[active, np.newaxis]*test_mass_velocities[active]
+
+            #the massive objects step to the next time that any bin is active
+            finest_level = max([massive_object_level] + [level for level in range(maximum_level + 1) if len(bins[level]) > 0])
+            finest_ticks = 2**(maximum_level - finest_level)
+            next_tick = (tick//finest_ticks + 1)*finest_ticks
+            self._massive_object_step((next_tick - tick)*tick_time)
+            tick = next_tick
+
+            #bins whose steps end at tick, the coarsest is set by the largest power of two dividing tick
+            active_level = maximum_level - ((tick & -tick).bit_length() - 1)
+            active = np.concatenate(bins[active_level:])
+            self.test_mass_accelerations[active] = self.test_mass_function(self.test_mass_state[active, 0:3], self.massive_object_state[:, 0:3],
+                                                                           self.masses, self.config)
+            self.number_of_evaluations += 1
+            self.number_of_test_mass_evaluations += len(active)
+            if self.profiler is not None:
+                self.profiler.count("steps")
+                self.profiler.count("active_test_masses", len(active))
+
+
+        return None
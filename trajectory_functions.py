@@ -0,0 +1,186 @@
+import os
+import json
+import numpy as np
+import core_functions as cf
+from core_classes import StackLayout, SimulationConfig
+"""
+Storage of the states of a system on disk, one snapshot at a time, so a run keeps its whole trajectory
+without holding it in memory.
+
+A trajectory is a directory holding:
+    metadata.json -- the masses, the StackLayout and the SimulationConfig of the run
+    times.bin -- the time of each snapshot, float64
+    states.bin -- the stack (see core_functions.stacker()) of each snapshot one after another, float64
+
+Each snapshot is appended to the end of the binary files as soon as it is produced, and any snapshot
+can be read back through a memory map without loading the rest of the file.
+"""
+
+
+
+
+
+class TrajectoryStore:
+    """
+    Class for a trajectory stored on disk
+
+    Attributes
+    ---------
+    directory : string
+        directory holding the files of the trajectory
+    masses : float[]
+        masses of the massive objects
+    stack_layout : StackLayout
+        where each object is in the stored stacks
+    config : SimulationConfig
+        the config of the run the trajectory was created for
+
+    Methods
+    ------
+    __init__(string) --> None (Side-effects: reads the metadata of an existing trajectory)
+
+    create(string, Mass[], SimulationConfig) --> TrajectoryStore (Side-effects: creates the directory and files)
+
+    append(float, float[]) --> None (Side-effects: adds a snapshot to the end of the files)
+
+    truncate(int) --> None (Side-effects: removes snapshots from the end of the files)
+
+    __len__() --> int (No Side-effects)
+
+    times() --> float[] (No Side-effects)
+
+    read(int) --> (float, float[]) (No Side-effects)
+
+    load(int, Mass[]) --> float (Side-effects: modifies attributes of Mass[])
+    """
+
+
+    def __init__(self, directory):
+        """
+        Opens an existing trajectory
+
+        Keyword arguments:
+        directory -- string, the directory written by TrajectoryStore.create()
+        """
+
+        self.directory = directory
+        with open(os.path.join(directory, "metadata.json")) as metadata_file:
+            metadata = json.load(metadata_file)
+        self.masses = metadata["masses"]
+        self.stack_layout = StackLayout(metadata["number_of_massive_objects"], metadata["test_mass_counts"])
+        self.config = SimulationConfig.from_dict(metadata["config"])
+
+        return None
+
+    @classmethod
+    def create(cls, directory, massive_objects, config = None):
+        """
+        Starts a new, empty trajectory for massive_objects, replacing any trajectory already in directory
+
+        Keyword arguments:
+        directory -- string, directory to hold the files, created if it doesn't exist
+        massive_objects -- array of class Mass
+        config -- SimulationConfig, the config of the run (default None, the values in global_constants.py)
+
+        Return value:
+        -- TrajectoryStore
+        """
+        if config is None:
+            config = SimulationConfig()
+
+        os.makedirs(directory, exist_ok = True)
+        stack_layout = StackLayout.from_massive_objects(massive_objects)
+        metadata = {
+            "masses": [float(massive_object.mass) for massive_object in massive_objects],
+            "number_of_massive_objects": stack_layout.number_of_massive_objects,
+            "test_mass_counts": stack_layout.test_mass_counts.tolist(),
+            "stack_length": stack_layout.length,
+            "dtype": "float64",
+            "config": config.as_dict(),
+        }
+        with open(os.path.join(directory, "metadata.json"), "w") as metadata_file:
+            json.dump(metadata, metadata_file, indent = 4)
+        for name in ("times.bin", "states.bin"):
+            open(os.path.join(directory, name), "wb").close()
+
+        return cls(directory)
+
+    def append(self, time, stack):
+        """
+        Writes a snapshot to the end of the trajectory
+
+        Keyword arguments:
+        time -- float, time of the snapshot
+        stack -- array of floats, see core_functions.stacker()
+        """
+
+        stack = np.asarray(stack, dtype = np.float64)
+        if stack.size != self.stack_layout.length:
+            raise ValueError("stack has " + str(stack.size) + " values, the trajectory expects " + str(self.stack_layout.length))
+        #the state is written before the time, so a snapshot only counts once all of it is on disk
+        with open(os.path.join(self.directory, "states.bin"), "ab") as states_file:
+            states_file.write(stack.tobytes())
+        with open(os.path.join(self.directory, "times.bin"), "ab") as times_file:
+            times_file.write(np.float64(time).tobytes())
+
+        return None
+
+    def truncate(self, number_of_snapshots):
+        """
+        Removes every snapshot after the first number_of_snapshots, used when a run continues from a checkpoint
+
+        Keyword arguments:
+        number_of_snapshots -- int, number of snapshots to keep
+        """
+
+        number_of_snapshots = min(number_of_snapshots, len(self))
+        os.truncate(os.path.join(self.directory, "times.bin"), 8*number_of_snapshots)
+        os.truncate(os.path.join(self.directory, "states.bin"), 8*number_of_snapshots*self.stack_layout.length)
+
+        return None
+
+    def __len__(self):
+        return os.path.getsize(os.path.join(self.directory, "times.bin"))//8
+
+    def times(self):
+        """Returns an array of floats, the time of every snapshot"""
+        return np.fromfile(os.path.join(self.directory, "times.bin"), dtype = np.float64, count = len(self))
+
+    def read(self, index):
+        """
+        Reads one snapshot without loading the others
+
+        Keyword arguments:
+        index -- int, number of the snapshot, negative numbers count back from the last
+
+        Return values:
+        time -- float, time of the snapshot
+        stack -- array of floats, read-only memory map of the stack of the snapshot
+        """
+
+        number_of_snapshots = len(self)
+        if index < 0:
+            index += number_of_snapshots
+        if not 0 <= index < number_of_snapshots:
+            raise IndexError("snapshot " + str(index) + " is not in a trajectory of " + str(number_of_snapshots))
+        time = np.memmap(os.path.join(self.directory, "times.bin"), dtype = np.float64, mode = "r", offset = 8*index, shape = (1,))[0]
+        stack = np.memmap(os.path.join(self.directory, "states.bin"), dtype = np.float64, mode = "r",
+                          offset = 8*index*self.stack_layout.length, shape = (self.stack_layout.length,))
+
+        return (float(time), stack)
+
+    def load(self, index, massive_objects):
+        """
+        Sets the positions and velocities of massive_objects to those of a snapshot
+
+        Keyword arguments:
+        index -- int, number of the snapshot, negative numbers count back from the last
+        massive_objects -- array of class Mass, the system the trajectory was created for
+
+        Return value:
+        time -- float, time of the snapshot
+        """
+
+        (time, stack) = self.read(index)
+        cf.destacker(stack, self.stack_layout, massive_objects)
+        return time
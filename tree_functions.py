@@ -0,0 +1,233 @@
+import numpy as np
+from core_classes import SimulationConfig
+"""
+Barnes-Hut tree code for the gravitational accelerations of many massive objects.
+
+The massive objects are sorted into an octree, each node of which stores its total mass and centre of mass.
+A node is treated as a single mass when it is small compared to its distance from the object feeling
+the force (size/distance < opening angle) and the object is outside the node's cube, otherwise its children are opened. This takes O(N log N) operations
+rather than the O(N^2) of core_functions.massive_object_accelerations(). Forces are softened with a Plummer
+softening length, a = G m r/(r^2 + softening^2)^(3/2). The opening angle and softening length are those of the
+SimulationConfig passed in (OPENING_ANGLE and SOFTENING_LENGTH in global_constants.py by default).
+
+The walk is done for all objects at once: each node is visited once, with the array of objects that
+still need to open it.
+
+Methods:
+
+    build_octree(float[][], float[], int) --> Octree (No side-effects)
+
+    tree_accelerations(float[][], float[], SimulationConfig) --> float[][] (No side-effects)
+
+    tree_test_mass_accelerations(float[][], float[][], float[], SimulationConfig) --> float[][] (No side-effects)
+
+"""
+
+#depth at which nodes are made leaves regardless of how many objects they contain, so coincident objects can't recurse forever
+MAXIMUM_DEPTH = 48
+
+
+
+
+class Octree:
+    """
+    Class for an octree of massive objects, stored as arrays with one entry per node (the root is node 0)
+
+    Attributes
+    ---------
+    positions : float[][]
+        positions of the massive objects
+    masses : float[]
+        masses of the massive objects
+    order : int[]
+        indices of the massive objects, sorted so that the objects in each node are contiguous
+    starts, ends : int[]
+        each node holds the objects order[starts[node]:ends[node]]
+    sizes : float[]
+        side length of each node
+    centres : float[][]
+        centre of the cube of each node
+    node_masses : float[]
+        total mass in each node
+    centres_of_mass : float[][]
+        centre of mass of each node
+    children : int[][]
+        the (up to eight) children of each node, an empty list for leaves
+
+    Methods
+    ------
+    __init__(float[][], float[], int) --> None (Side-effects: creates the attributes above)
+    """
+
+
+    def __init__(self, positions, masses, leaf_size = 8):
+        """
+        Builds the tree
+
+        Keyword arguments:
+        positions -- 2D array of floats, [ x y z, ...] positions of the massive objects
+        masses -- array of floats, masses of the massive objects
+        leaf_size -- int, nodes with at most this many objects are not split (default 8)
+        """
+
+        self.positions = np.asarray(positions, dtype = float)
+        self.masses = np.asarray(masses, dtype = float)
+        self.order = np.arange(len(self.masses))
+        self.starts = []
+        self.ends = []
+        self.sizes = []
+        self.centres = []
+        self.node_masses = []
+        self.centres_of_mass = []
+        self.children = []
+
+        lower = np.min(self.positions, axis = 0)
+        upper = np.max(self.positions, axis = 0)
+        size = max(np.max(upper - lower), 1e-12)*(1 + 1e-9) #so objects on the upper faces are inside
+        self._add_node((lower + upper)/2, size, 0, len(self.masses), leaf_size, 0)
+
+        self.starts = np.array(self.starts)
+        self.ends = np.array(self.ends)
+        self.sizes = np.array(self.sizes)
+        self.centres = np.array(self.centres)
+        self.node_masses = np.array(self.node_masses)
+        self.centres_of_mass = np.array(self.centres_of_mass)
+
+        return None
+
+    def _add_node(self, centre, size, start, end, leaf_size, depth):
+        """Adds the node holding order[start:end] and, recursively, its children. Returns the index of the node"""
+        node = len(self.starts)
+        members = self.order[start:end]
+        node_mass = np.sum(self.masses[members])
+        self.starts.append(start)
+        self.ends.append(end)
+        self.sizes.append(size)
+        self.centres.append(centre)
+        self.node_masses.append(node_mass)
+        if node_mass > 0:
+            self.centres_of_mass.append(np.dot(self.masses[members], self.positions[members])/node_mass)
+        else:
+            self.centres_of_mass.append(np.mean(self.positions[members], axis = 0))
+        self.children.append([])
+
+        if end - start > leaf_size and depth < MAXIMUM_DEPTH:
+            #octant of each object, bit 0 for x, 1 for y, 2 for z
+            octants = np.dot(self.positions[members] >= centre, [1, 2, 4])
+            sorting = np.argsort(octants, kind = "stable")
+            self.order[start:end] = members[sorting]
+            boundaries = start + np.searchsorted(octants[sorting], np.arange(9))
+            for octant in range(8):
+                if boundaries[octant + 1] > boundaries[octant]:
+                    offset = (np.array([octant & 1, (octant >> 1) & 1, (octant >> 2) & 1]) - 0.5)*size/2
+                    child = self._add_node(centre + offset, size/2, boundaries[octant], boundaries[octant + 1], leaf_size, depth + 1)
+                    self.children[node].append(child)
+
+        return node
+
+
+
+
+
+
+def build_octree(positions, masses, leaf_size = 8):
+    """
+    Builds the Octree of a set of massive objects
+
+    Keyword arguments:
+    positions -- 2D array of floats, [ x y z, ...] positions of the massive objects
+    masses -- array of floats, masses of the massive objects
+    leaf_size -- int, nodes with at most this many objects are not split (default 8)
+
+    Return value:
+    -- Octree
+    """
+
+    return Octree(positions, masses, leaf_size)
+
+
+
+
+
+
+def _walk(tree, node, targets, target_positions, accelerations, opening_angle, softening_squared):
+    """Adds the acceleration due to node onto the rows targets of accelerations, opening the node where needed"""
+    r_vectors = tree.centres_of_mass[node] - target_positions[targets]
+    distances_squared = np.sum(r_vectors**2, axis = 1)
+
+    if len(tree.children[node]) == 0:
+        #leaf, sum over the objects it holds directly
+        members = tree.order[tree.starts[node]:tree.ends[node]]
+        r_vectors = tree.positions[members][np.newaxis, :, :] - target_positions[targets][:, np.newaxis, :]
+        distances_squared = np.sum(r_vectors**2, axis = 2) + softening_squared
+        with np.errstate(divide = "ignore"):
+            factors = tree.masses[members]/distances_squared**1.5
+        factors[distances_squared == 0] = 0 #so an object doesn't exert a force on itself
+        accelerations[targets] += np.einsum("ijk,ij->ik", r_vectors, factors)
+        return None
+
+    #a node holding the target is always opened, as its centre of mass can be far enough away to accept it for large
+    #opening angles, and the target would then feel its own mass
+    outside = np.any(np.abs(target_positions[targets] - tree.centres[node]) > tree.sizes[node]/2, axis = 1)
+    accepted = outside & (tree.sizes[node]**2 < opening_angle**2*distances_squared)
+    if np.any(accepted):
+        factors = tree.node_masses[node]/(distances_squared[accepted] + softening_squared)**1.5
+        accelerations[targets[accepted]] += r_vectors[accepted]*factors[:, np.newaxis]
+    remaining = targets[~accepted]
+    if len(remaining) > 0:
+        for child in tree.children[node]:
+            _walk(tree, child, remaining, target_positions, accelerations, opening_angle, softening_squared)
+
+    return None
+
+
+
+
+
+
+def tree_test_mass_accelerations(positions_of_test_masses, positions_of_massive_objects, masses, config = None):
+    """
+    Finds the accelerations of test masses due to the massive objects with the Barnes-Hut approximation
+
+    Keyword arguments:
+    positions_of_test_masses -- 2D array of floats, [ x y z, ...] positions of all the test masses
+    positions_of_massive_objects -- 2D array of floats, [ x y z, ...] positions of all the masses
+    masses -- array of floats, masses of each of the massive_objects
+    config -- SimulationConfig, gives the opening_angle and softening_length (default None, the values in global_constants.py)
+
+    Return values:
+    accelerations -- 2D array of floats, [ x y z, ...] the acceleration of each test mass
+    """
+    if config is None:
+        config = SimulationConfig()
+    positions_of_test_masses = np.asarray(positions_of_test_masses, dtype = float)
+    accelerations = np.zeros_like(positions_of_test_masses)
+    if len(positions_of_test_masses) == 0 or len(masses) == 0:
+        return accelerations
+
+    tree = build_octree(positions_of_massive_objects, masses)
+    _walk(tree, 0, np.arange(len(positions_of_test_masses)), positions_of_test_masses, accelerations, config.opening_angle, config.softening_length**2)
+
+
+    return config.gravitational_constant*accelerations
+
+
+
+
+
+
+def tree_accelerations(positions_of_massive_objects, masses, config = None):
+    """
+    Finds the accelerations of all the massive objects due to each other with the Barnes-Hut approximation.
+    Can be used in place of core_functions.massive_object_accelerations().
+
+    Keyword arguments:
+    positions_of_massive_objects -- 2D array of floats, [ x y z, ...] positions of all the masses
+    masses -- array of floats, masses of each of the massive_objects
+    config -- SimulationConfig, gives the opening_angle and softening_length (default None, the values in global_constants.py)
+
+    Return values:
+    accelerations -- 2D array of floats, [ x y z, ...] the acceleration of each massive object
+    """
+
+    return tree_test_mass_accelerations(positions_of_massive_objects, positions_of_massive_objects, masses, config)